@@ -3,11 +3,40 @@
 import os
 import sys
 import argparse
-from PIL import Image, ImageOps
-import glob
+import PIL
+from PIL import Image, ImageChops, ImageOps
 from pathlib import Path
 import time
-from typing import Optional, Tuple, Union, List
+import signal
+import io
+import json
+import cProfile
+import pstats
+import tempfile
+import shutil
+import subprocess
+import contextlib
+import hashlib
+import random
+import functools
+import itertools
+import struct
+import zlib
+import sqlite3
+import zipfile
+import tarfile
+import queue
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import select
+import ctypes
+import ctypes.util
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple, Union, List, Dict
 import psutil
 
 class Colors:
@@ -21,480 +50,4464 @@ class Colors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
-class ImageCompressor:
+PROCESSING_MODES = {
+    "compress_convert": "Compress + Convert",
+    "convert_compress": "Convert + Compress",
+    "compress_only": "Compress Only",
+    "convert_only": "Convert Only",
+}
+
+OUTPUT_FORMATS = {
+    '.jpg': "JPEG",
+    '.png': "PNG",
+    '.webp': "WebP",
+    '.bmp': "BMP",
+    '.tiff': "TIFF",
+    '.gif': "GIF",
+}
+
+# Encoder parameters per preset and output format; "balanced" is the long-standing behaviour
+ENCODER_PRESETS = {
+    'fast': {
+        '.jpg': {'optimize': False, 'progressive': False},
+        '.png': {'compress_level': 1},
+        '.webp': {'method': 0},
+        '.tiff': {},
+        '.gif': {'optimize': False},
+    },
+    'balanced': {
+        '.jpg': {'optimize': True, 'progressive': True},
+        '.png': {'optimize': True, 'compress_level': 6},
+        '.webp': {'method': 4},
+        '.tiff': {},
+        '.gif': {'optimize': True},
+    },
+    'smallest': {
+        '.jpg': {'optimize': True, 'progressive': True},
+        '.png': {'optimize': True, 'compress_level': 9},
+        '.webp': {'method': 6},
+        '.tiff': {'compression': 'tiff_adobe_deflate'},
+        '.gif': {'optimize': True},
+    },
+}
+
+# Pillow format name -> extension, for inputs that arrive without a file name
+FORMAT_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'WEBP': '.webp',
+    'BMP': '.bmp',
+    'TIFF': '.tiff',
+    'GIF': '.gif',
+}
+
+# Luminance quantization table of the JPEG standard (Annex K), which IJG-style encoders scale by quality
+JPEG_STANDARD_LUMA = (
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99,
+)
+
+def estimate_jpeg_quality(img) -> Optional[int]:
+    """Quality an opened JPEG was saved at, judged from its luminance table alone.
+
+    Inverts the IJG scaling (50 keeps the standard table, lower qualities
+    scale it by 5000/q, higher ones by 200 - 2q), so no pixels are decoded.
+    Other encoders get the nearest IJG equivalent.
+    """
+    tables = getattr(img, 'quantization', None)
+    if not tables or 0 not in tables:
+        return None
+    scale = 100 * sum(tables[0]) / sum(JPEG_STANDARD_LUMA)
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return max(1, min(100, round(quality)))
+
+@functools.lru_cache(maxsize=None)
+def jpegtran_path() -> Optional[str]:
+    return shutil.which('jpegtran')
+
+def optimize_jpeg_losslessly(data: bytes) -> Optional[bytes]:
+    """Rewrite a JPEG's Huffman coding with jpegtran, keeping every coefficient and marker.
+
+    Returns None when jpegtran is not installed or fails.
+    """
+    if not jpegtran_path():
+        return None
+    try:
+        done = subprocess.run([jpegtran_path(), '-copy', 'all', '-optimize', '-progressive'],
+                              input=data, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return done.stdout or None
+
+# TIFF tags that may carry private metadata: XMP, IPTC, Photoshop, EXIF and GPS IFDs, image source data
+TIFF_METADATA_TAGS = {700, 33723, 34377, 34665, 34853, 37724}
+
+def _strip_jpeg_metadata(data: bytes) -> Optional[bytes]:
+    # Keep JFIF (APP0), ICC profiles (APP2) and Adobe color transform (APP14) markers; drop other APPn and comments
+    out, pos = [data[:2]], 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # fill byte
+            continue
+        if marker in (0xDA, 0xD9):
+            out.append(data[pos:])  # entropy-coded data follows start of scan
+            return b''.join(out)
+        end = pos + 2 + struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        segment = data[pos:end]
+        private = marker == 0xFE or (0xE1 <= marker <= 0xEF and marker != 0xEE
+                                     and not (marker == 0xE2 and segment[4:16] == b'ICC_PROFILE\x00'))
+        if not private:
+            out.append(segment)
+        pos = end
+    return None
+
+def _strip_png_metadata(data: bytes) -> Optional[bytes]:
+    out, pos = [data[:8]], 8
+    while pos + 12 <= len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        end = pos + 12 + length
+        if kind not in (b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'):
+            out.append(data[pos:end])
+        pos = end
+        if kind == b'IEND':
+            return b''.join(out)
+    return None
+
+def _strip_webp_metadata(data: bytes) -> Optional[bytes]:
+    chunks, pos = [], 12
+    while pos + 8 <= len(data):
+        kind, length = struct.unpack('<4sI', data[pos:pos + 8])
+        end = pos + 8 + length + (length & 1)
+        if kind == b'VP8X':
+            # Clear the EXIF (0x08) and XMP (0x04) flags
+            chunks.append(data[pos:pos + 8] + bytes([data[pos + 8] & ~0x0C]) + data[pos + 9:end])
+        elif kind not in (b'EXIF', b'XMP '):
+            chunks.append(data[pos:end])
+        pos = end
+    body = b'WEBP' + b''.join(chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+def _strip_gif_metadata(data: bytes) -> Optional[bytes]:
+    # Keep the looping application extensions; drop comments and other application data such as XMP
+    pos = 13 + (3 << ((data[10] & 7) + 1) if data[10] & 0x80 else 0)
+    out = [data[:pos]]
+    while pos < len(data):
+        start, introducer = pos, data[pos]
+        if introducer == 0x3B:
+            out.append(data[pos:pos + 1])
+            return b''.join(out)
+        if introducer == 0x2C:
+            flags = data[pos + 9]
+            pos += 10 + (3 << ((flags & 7) + 1) if flags & 0x80 else 0) + 1  # descriptor, table, LZW code size
+            private = False
+        elif introducer == 0x21:
+            label = data[pos + 1]
+            private = label == 0xFE or (label == 0xFF and data[pos + 3:pos + 14] not in (b'NETSCAPE2.0', b'ANIMEXTS1.0'))
+            pos += 2
+        else:
+            return None
+        while pos < len(data) and data[pos]:
+            pos += data[pos] + 1  # data sub-blocks
+        pos += 1
+        if not private:
+            out.append(data[start:pos])
+    return None
+
+def strip_metadata(data: bytes) -> Optional[bytes]:
+    """Drop EXIF, XMP, IPTC, text and comment metadata from an encoded image without re-encoding it.
+
+    Re-encoded outputs never carry these, so sources kept in their place
+    (see ImageCompressor._keep_source) must not either. ICC profiles stay.
+    Returns None for files that cannot be stripped this way.
+    """
+    try:
+        if data.startswith(b'\xff\xd8'):
+            return _strip_jpeg_metadata(data)
+        if data.startswith(b'\x89PNG\r\n\x1a\n'):
+            return _strip_png_metadata(data)
+        if data.startswith(b'RIFF') and data[8:12] == b'WEBP':
+            return _strip_webp_metadata(data)
+        if data.startswith((b'GIF87a', b'GIF89a')):
+            return _strip_gif_metadata(data)
+        if data.startswith(b'BM'):
+            return data  # no metadata
+        if data.startswith((b'II*\x00', b'MM\x00*')):
+            with Image.open(io.BytesIO(data)) as img:
+                return None if TIFF_METADATA_TAGS & set(img.tag_v2) else data
+    except (IndexError, struct.error, OSError):
+        pass
+    return None
+
+CONFLICT_POLICIES = ("ask", "replace", "skip", "rename")
+
+# How a batch reports progress: per-file lines, a rate-limited status line, or nothing
+# ("auto" is the status line on a terminal and per-file lines when stdout is redirected)
+PROGRESS_MODES = ("auto", "files", "bar", "none")
+PROGRESS_INTERVAL = 0.5  # seconds between status line redraws and event log flushes
+
+QUALITY_PRESETS = {90: "High", 80: "Medium (Recommended)", 60: "Low"}
+
+def parse_size(text: str) -> int:
+    """Parse '200KB', '1.5MB' or a plain byte count into bytes"""
+    value = str(text).strip().upper().replace(' ', '')
+    for unit, factor in (('KB', 1024), ('MB', 1024 * 1024), ('K', 1024), ('M', 1024 * 1024), ('B', 1)):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * factor)
+    return int(value)
+
+def format_size(nbytes: int) -> str:
+    if nbytes >= 1024 * 1024:
+        return f"{nbytes / (1024 * 1024):.2f} MB"
+    return f"{nbytes / 1024:.0f} KB"
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+# Archive and object store members are addressed as "<location>!/<member name>"
+MEMBER_SEPARATOR = '!/'
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+def is_archive_path(path) -> bool:
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+def is_s3_url(path) -> bool:
+    return str(path).startswith('s3://')
+
+def is_store_location(path) -> bool:
+    """True for locations whose members are not plain files (archives, S3)"""
+    return is_archive_path(path) or is_s3_url(path)
+
+def split_member_path(path) -> Tuple[Optional[str], str]:
+    """Return (location, member) for a member path and (None, path) otherwise"""
+    location, separator, member = str(path).partition(MEMBER_SEPARATOR)
+    return (location, member) if separator else (None, str(path))
+
+def normalize_ext(ext: str) -> str:
+    """Map a format name such as 'JPEG' or '.tif' to its OUTPUT_FORMATS key"""
+    ext = ext.strip().lower()
+    ext = ext if ext.startswith('.') else f".{ext}"
+    ext = {'.jpeg': '.jpg', '.tif': '.tiff'}.get(ext, ext)
+    if ext not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{ext.lstrip('.')}'")
+    return ext
+
+def normalize_suffix(suffix: str) -> str:
+    """Add a '-' separator to a user supplied suffix if it has none"""
+    if suffix and not suffix.startswith('-') and not suffix.startswith('_'):
+        return f"-{suffix}"
+    return suffix
+
+@dataclass
+class BatchConfig:
+    """Settings for an unattended run (see ImageCompressor.run)"""
+    input_dir: Union[str, Path] = './input'
+    output_dir: Union[str, Path] = './output'
+    mode: str = "convert_only"
+    quality: Optional[int] = None      # defaults to 80 for compressing modes
+    target_size: Optional[int] = None  # bytes per output; searches quality up to `quality`
+    min_ssim: Optional[float] = None   # lowest JPEG/WebP quality (up to `quality`) keeping SSIM at least this
+    never_larger: bool = True          # keep the source when re-encoding to its own format would not shrink it
+    output_ext: Optional[str] = None   # None keeps the original format
+    variant_formats: Optional[List[str]] = None  # fan-out: several output formats from one decode
+    variant_widths: Optional[List[int]] = None   # fan-out: widths per format (never upscaled)
+    max_width: Optional[int] = None    # shrink outputs to fit these bounds (never upscaled)
+    max_height: Optional[int] = None
+    scale: Optional[float] = None      # shrink by this factor, e.g. 0.5
+    suffix: Optional[str] = None       # None picks the mode default, "" keeps names
+    on_conflict: str = "rename"
+    workers: Optional[int] = None      # None uses every CPU core
+    memory_fraction: float = 0.7       # share of available RAM in-flight jobs may use
+    scan_index: bool = True            # reuse cached probes from the output folder
+    rebuild_scan_index: bool = False   # discard the cached probes and probe every input again
+    strict_verify: bool = False        # img.verify() every file before processing
+    incremental: bool = False          # skip inputs whose recorded output is up to date
+    resume: bool = False               # skip inputs the journal of an interrupted run records as done
+    prune_orphans: bool = False        # with incremental, delete outputs of removed inputs
+    instrument: bool = False           # per-stage timings in the summary and FileResult.stats
+    trace_path: Optional[str] = None   # append one JSON line per file (implies instrument)
+    progress: str = "auto"             # files, bar or none (see PROGRESS_MODES); auto picks by terminal
+    events_path: Optional[str] = None  # append progress events as JSON lines, '-' for stdout
+    profile_samples: int = 0           # run this many files under cProfile
+    encoder_preset: str = "balanced"   # fast, balanced or smallest (see ENCODER_PRESETS)
+    auto_tune: bool = False            # pick the preset from sample encodes of the batch
+    tune_throughput: Optional[float] = None  # auto-tune goal in images/s; otherwise the size goal applies
+    tune_size_slack: float = 0.05      # size goal: fastest preset within this share of the smallest output
+    tune_samples: int = 6
+    storage_connections: int = 8       # concurrent S3 downloads/uploads
+    dedupe: bool = False               # encode byte-identical inputs once and link the other outputs
+    dedupe_distance: Optional[int] = None  # also treat images this many perceptual-hash bits apart as duplicates
+    s3_endpoint: Optional[str] = None  # S3-compatible endpoint (MinIO, moto); None uses the AWS default
+    show_plans: bool = False           # list the conversion plans used in the summary
+
+    def __post_init__(self):
+        if (self.incremental or self.prune_orphans) and (is_store_location(self.input_dir) or is_store_location(self.output_dir)):
+            raise ValueError("Incremental runs need an input and output folder, not an archive or object store")
+        if self.resume and is_store_location(self.output_dir):
+            raise ValueError("Resuming needs an output folder; archives and object stores are written from scratch")
+        if self.mode not in PROCESSING_MODES:
+            raise ValueError(f"Unknown mode '{self.mode}', expected one of: {', '.join(PROCESSING_MODES)}")
+        if self.on_conflict not in CONFLICT_POLICIES:
+            raise ValueError(f"Unknown conflict policy '{self.on_conflict}', expected one of: {', '.join(CONFLICT_POLICIES)}")
+        if self.progress not in PROGRESS_MODES:
+            raise ValueError(f"Unknown progress mode '{self.progress}', expected one of: {', '.join(PROGRESS_MODES)}")
+
+        if self.target_size is not None and self.target_size <= 0:
+            raise ValueError("Target size must be greater than zero")
+        if self.min_ssim is not None and not 0 < self.min_ssim <= 1:
+            raise ValueError("Minimum SSIM must be greater than 0 and at most 1")
+        if self.target_size and self.min_ssim:
+            raise ValueError("Choose either a target size or a minimum SSIM, not both")
+
+        if self.mode == "convert_only":
+            self.quality = None
+            self.target_size = None
+            self.min_ssim = None
+        elif self.quality is None:
+            self.quality = 95 if self.target_size or self.min_ssim else 80
+        elif not 1 <= self.quality <= 100:
+            raise ValueError("Quality must be between 1 and 100")
+
+        if self.mode == "compress_only":
+            self.output_ext = None
+        elif self.output_ext:
+            self.output_ext = normalize_ext(self.output_ext)
+
+        if any(bound is not None and bound <= 0 for bound in (self.max_width, self.max_height)):
+            raise ValueError("Maximum width and height must be greater than zero")
+        if self.scale is not None and not 0 < self.scale <= 1:
+            raise ValueError("Scale must be greater than 0 and at most 1")
+
+        if self.variant_formats:
+            if self.mode == "compress_only":
+                raise ValueError("compress_only keeps the input format; use variant widths only")
+            self.variant_formats = list(dict.fromkeys(normalize_ext(ext) for ext in self.variant_formats))
+        if self.variant_widths:
+            if any(width <= 0 for width in self.variant_widths):
+                raise ValueError("Variant widths must be greater than zero")
+            self.variant_widths = sorted(set(self.variant_widths), reverse=True)
+        if (self.variant_formats or self.variant_widths) and (self.incremental or self.prune_orphans):
+            raise ValueError("Fan-out outputs are not tracked by the build manifest; drop --incremental")
+
+        if not 0 < self.memory_fraction <= 1:
+            raise ValueError("Memory fraction must be greater than 0 and at most 1")
+        if self.storage_connections < 1:
+            raise ValueError("Storage connections must be at least 1")
+        if self.dedupe_distance is not None:
+            if self.dedupe_distance < 0:
+                raise ValueError("Duplicate distance must not be negative")
+            self.dedupe = True
+
+        if self.encoder_preset not in ENCODER_PRESETS:
+            raise ValueError(f"Unknown encoder preset '{self.encoder_preset}', expected one of: {', '.join(ENCODER_PRESETS)}")
+        if self.tune_samples < 1:
+            raise ValueError("Auto-tune needs at least one sample")
+
+        if self.prune_orphans:
+            self.incremental = True
+        if self.trace_path:
+            self.instrument = True
+
+        if self.suffix is None:
+            self.suffix = "-converted" if self.mode == "convert_only" else "-compressed"
+        else:
+            self.suffix = normalize_suffix(self.suffix)
+
+    @property
+    def mode_name(self) -> str:
+        return PROCESSING_MODES[self.mode]
+
+    @property
+    def quality_name(self) -> Optional[str]:
+        if self.quality is None:
+            return None
+        if self.target_size:
+            return f"Target ≤ {format_size(self.target_size)}"
+        if self.min_ssim:
+            return f"SSIM ≥ {self.min_ssim:g}"
+        return QUALITY_PRESETS.get(self.quality, "Custom")
+
+    @property
+    def format_name(self) -> str:
+        if self.variant_formats:
+            return " + ".join(OUTPUT_FORMATS[ext] for ext in self.variant_formats)
+        return OUTPUT_FORMATS[self.output_ext] if self.output_ext else "Original Format"
+
+@dataclass
+class FileResult:
+    """Outcome of processing a single input file"""
+    input_path: str
+    output_path: Optional[str] = None
+    status: str = "pending"  # "success", "skipped", "unchanged", "resumed" or "failed"
+    original_size: int = 0   # bytes
+    output_size: int = 0     # bytes
+    error: Optional[str] = None
+    content_hash: Optional[str] = None
+    stats: Optional[dict] = None  # per-stage timings and byte counts (see StageTimer)
+    search: Optional[dict] = None # outcome of a target-size or SSIM search (see _search_target_size, _search_min_ssim)
+    variants: Optional[List[dict]] = None  # fan-out outputs: path, format, width, size, search
+    plans: Optional[List[str]] = None      # conversion plans applied (see plan_conversion)
+    payload: Optional[List[Tuple[str, bytes]]] = None  # encoded outputs bound for an output archive
+    cpu_seconds: float = 0.0               # CPU time spent processing this input
+    duplicate_of: Optional[str] = None     # input whose encoded output was reused (see find_duplicates)
+    linked: bool = False                   # that reused output is a hardlink rather than a copy
+    kept_source: Optional[str] = None      # why the source bytes (or a lossless rewrite) were kept
+    seconds: float = 0.0                   # wall-clock time spent processing this input
+
+@dataclass
+class Variant:
+    """One planned output of a fan-out job"""
+    output_path: Path
+    output_ext: str
+    width: Optional[int] = None  # None keeps the decoded width
+
+@dataclass
+class ImageInfo:
+    """Per-file record built once while scanning and carried into display and processing.
+
+    Only the image header is read; full integrity problems surface when the
+    file is decoded for processing (or up front with strict verification).
+    """
+    path: str
+    file_size: int           # bytes
+    mtime_ns: int
+    width: int = 0
+    height: int = 0
+    format: Optional[str] = None
+    mode: Optional[str] = None
+    valid: bool = False      # header could be read
+    verified: bool = False   # passed img.verify()
+    error: Optional[str] = None
+    streamable: bool = False # can be decoded strip by strip (see StripReader)
+    content_hash: Optional[str] = None  # filled in for incremental runs
+
+class ScanIndex:
+    """SQLite cache of probe results so unchanged files are not re-read.
+
+    Entries are keyed by absolute path and only trusted while the file's
+    size and mtime still match what was recorded.
+    """
+    FILENAME = '.mami-scan-index.sqlite'
+    SCHEMA_VERSION = 3
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.hits = 0
+        self.misses = 0
+        self._pending: List[ImageInfo] = []
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        # Older layouts are just a cache, so drop them instead of migrating
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            with self.conn:
+                self.conn.execute("DROP TABLE IF EXISTS images")
+                self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS images (
+                   path TEXT PRIMARY KEY,
+                   file_size INTEGER NOT NULL,
+                   mtime_ns INTEGER NOT NULL,
+                   width INTEGER,
+                   height INTEGER,
+                   format TEXT,
+                   mode TEXT,
+                   valid INTEGER NOT NULL,
+                   verified INTEGER NOT NULL,
+                   streamable INTEGER NOT NULL,
+                   error TEXT
+               )"""
+        )
+
+    def lookup(self, path: str, file_size: int, mtime_ns: int, require_verified: bool = False,
+               count: bool = True) -> Optional[ImageInfo]:
+        query = ("SELECT width, height, format, mode, valid, verified, streamable, error FROM images "
+                 "WHERE path = ? AND file_size = ? AND mtime_ns = ?")
+        if require_verified:
+            # Header-only entries must be probed again for strict verification
+            query += " AND (valid = 0 OR verified = 1)"
+        row = self.conn.execute(query, (path, file_size, mtime_ns)).fetchone()
+        if row is None:
+            self.misses += count
+            return None
+        self.hits += count
+        width, height, fmt, mode, valid, verified, streamable, error = row
+        return ImageInfo(path, file_size, mtime_ns, width, height, fmt, mode, bool(valid), bool(verified),
+                         error, bool(streamable))
+
+    def store(self, info: ImageInfo):
+        # Written in one transaction by commit() to keep rescans cheap
+        self._pending.append(info)
+
+    def commit(self):
+        if self._pending:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(i.path, i.file_size, i.mtime_ns, i.width, i.height, i.format, i.mode,
+                      int(i.valid), int(i.verified), int(i.streamable), i.error)
+                     for i in self._pending],
+                )
+            self._pending.clear()
+
+    def clear(self):
+        """Forget every cached entry so the next scan probes all files again"""
+        with self.conn:
+            self.conn.execute("DELETE FROM images")
+        self._pending.clear()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+# Bytes per pixel of the raw layouts StripReader can seek through
+RAW_PIXEL_BYTES = {
+    'L': 1, 'P': 1, 'LA': 2, 'I;16': 2, 'I;16B': 2,
+    'RGB': 3, 'BGR': 3, 'RGBA': 4, 'RGBX': 4, 'BGRA': 4, 'BGRX': 4, 'CMYK': 4,
+}
+
+# Target formats that can be written strip by strip; the rest need the whole frame in memory
+STREAMING_OUTPUT_FORMATS = {'.png', '.bmp'}
+
+class StripReader:
+    """Decode an image in horizontal bands instead of all at once.
+
+    Only uncompressed BMP/TIFF files qualify: Pillow describes them with a
+    single 'raw' tile, so any run of rows can be decoded on its own by
+    pointing the tile at that row's file offset.
+    """
+    STRIP_PIXELS = 4_000_000  # ~16MB per band at 4 bytes per pixel
+
+    def __init__(self, path, strip_pixels: Optional[int] = None):
+        self.path = path
+        with Image.open(path) as img:
+            if not self.supports(img):
+                raise ValueError(f"{Path(path).name} cannot be decoded in strips")
+            if img.getexif().get(0x0112, 1) != 1:
+                raise ValueError("EXIF-rotated images cannot be processed in strips")
+            self.width, self.height = img.size
+            self.mode = img.mode
+            _, _, self.offset, (self.rawmode, stride, self.orientation) = img.tile[0]
+            # (rawmode, bytes) as parsed from the header; getpalette() would decode the whole image
+            self.palette = img.palette.getdata() if img.mode == 'P' else None
+        self.stride = stride or self.width * RAW_PIXEL_BYTES[self.rawmode]
+        self.rows_per_strip = max(1, (strip_pixels or self.STRIP_PIXELS) // self.width)
+
+    @staticmethod
+    def supports(img: Image.Image) -> bool:
+        if img.format not in ('BMP', 'TIFF') or len(img.tile) != 1:
+            return False
+        codec, extents, _, args = img.tile[0]
+        return (codec == 'raw' and tuple(extents) == (0, 0) + img.size and isinstance(args, tuple)
+                and len(args) == 3 and args[0] in RAW_PIXEL_BYTES and args[2] in (1, -1))
+
+    def read(self, top: int, bottom: int) -> Image.Image:
+        """Decode rows [top, bottom) into a new image the size of the band"""
+        # Bottom-up files (orientation -1) store the last row first
+        first_row = self.height - bottom if self.orientation < 0 else top
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset + first_row * self.stride)
+            data = file.read(self.stride * (bottom - top))
+        img = Image.frombytes(self.mode, (self.width, bottom - top), data, 'raw',
+                              self.rawmode, self.stride, self.orientation)
+        if self.palette:
+            rawmode, palette = self.palette
+            img.putpalette(palette, rawmode)
+        return img
+
+    def strips(self):
+        """Yield (top, band) pairs covering the image from top to bottom"""
+        for top in range(0, self.height, self.rows_per_strip):
+            bottom = min(top + self.rows_per_strip, self.height)
+            yield top, self.read(top, bottom)
+
+def temp_path_for(path) -> Path:
+    """Hidden sibling an output is written to before it is renamed into place"""
+    path = Path(path)
+    return path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+def commit_file(file, tmp_path, path):
+    """fsync and close a finished temp file, then atomically rename it over ``path``"""
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+    os.replace(tmp_path, path)
+
+@contextlib.contextmanager
+def atomic_write(path):
+    """Write ``path`` through a temp file in the same folder, renamed into place once complete.
+
+    A crash leaves at most a hidden ``.<name>.<pid>.tmp`` file, never a truncated output.
+    """
+    tmp_path = temp_path_for(path)
+    tmp_path.parent.mkdir(parents=True, exist_ok=True)
+    file = open(tmp_path, 'wb')
+    try:
+        yield file
+        commit_file(file, tmp_path, path)
+    except BaseException:
+        file.close()
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+class StripFileWriter:
+    """Bands are written to a temp file that replaces the output once complete"""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.tmp_path = temp_path_for(path)
+        self.file = None
+
+    def _open(self):
+        self.tmp_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.tmp_path, 'wb')
+
+    def abort(self):
+        if self.file:
+            self.file.close()
+            with contextlib.suppress(OSError):
+                os.unlink(self.tmp_path)
+
+class PngStripWriter(StripFileWriter):
+    """Write an 8-bit PNG one band at a time through a single zlib stream"""
+    COLOR_TYPES = {'L': 0, 'RGB': 2, 'P': 3, 'LA': 4, 'RGBA': 6}
+
+    def __init__(self, path, size, compress_level: int = 6):
+        super().__init__(path, size)
+        self.compress_level = compress_level
+
+    def _chunk(self, tag: bytes, data: bytes):
+        self.file.write(struct.pack('>I', len(data)) + tag + data)
+        self.file.write(struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    def _start(self, band: Image.Image):
+        width, height = self.size
+        self.mode = band.mode
+        self._open()
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, self.COLOR_TYPES[self.mode], 0, 0, 0))
+        if self.mode == 'P':
+            self._chunk(b'PLTE', bytes(band.getpalette()[:768]))
+        self.row_bytes = width * len(self.mode if self.mode != 'P' else 'L')
+        self.compressor = zlib.compressobj(self.compress_level)
+
+    def write(self, band: Image.Image):
+        if band.mode not in self.COLOR_TYPES:
+            band = band.convert('RGBA' if 'A' in band.mode else 'RGB')
+        if self.file is None:
+            self._start(band)
+        raw = band.tobytes()
+        # Filter type 0 (none) on every row; zlib does the rest
+        rows = b''.join(b'\x00' + raw[i:i + self.row_bytes] for i in range(0, len(raw), self.row_bytes))
+        data = self.compressor.compress(rows)
+        if data:
+            self._chunk(b'IDAT', data)
+
+    def close(self):
+        self._chunk(b'IDAT', self.compressor.flush())
+        self._chunk(b'IEND', b'')
+        commit_file(self.file, self.tmp_path, self.path)
+
+class BmpStripWriter(StripFileWriter):
+    """Write an uncompressed top-down BMP one band at a time"""
+
+    def _start(self, band: Image.Image):
+        width, height = self.size
+        self.mode = band.mode
+        bits = 24 if self.mode == 'RGB' else 8
+        self.rawmode = 'BGR' if self.mode == 'RGB' else self.mode
+        self.row_bytes = width * bits // 8
+        self.padding = b'\x00' * (-self.row_bytes % 4)
+
+        if self.mode == 'P':
+            rgb = band.getpalette()[:768]
+            rgb += [0] * (768 - len(rgb))
+            palette = b''.join(bytes((rgb[i + 2], rgb[i + 1], rgb[i], 0)) for i in range(0, 768, 3))
+        elif self.mode == 'L':
+            palette = b''.join(bytes((i, i, i, 0)) for i in range(256))
+        else:
+            palette = b''
+
+        image_size = (self.row_bytes + len(self.padding)) * height
+        offset = 14 + 40 + len(palette)
+        self._open()
+        self.file.write(b'BM' + struct.pack('<IHHI', offset + image_size, 0, 0, offset))
+        # Negative height marks rows as stored top to bottom
+        self.file.write(struct.pack('<IiiHHIIiiII', 40, width, -height, 1, bits, 0, image_size,
+                                    2835, 2835, len(palette) // 4, 0))
+        self.file.write(palette)
+
+    def write(self, band: Image.Image):
+        if band.mode not in ('RGB', 'L', 'P'):
+            band = band.convert('RGB')
+        if self.file is None:
+            self._start(band)
+        raw = band.tobytes('raw', self.rawmode)
+        if self.padding:
+            raw = b''.join(raw[i:i + self.row_bytes] + self.padding for i in range(0, len(raw), self.row_bytes))
+        self.file.write(raw)
+
+    def close(self):
+        commit_file(self.file, self.tmp_path, self.path)
+
+class FullFrameWriter:
+    """Fallback for encoders that need the whole frame: bands are pasted into
+    one output-sized image and saved through ImageCompressor._save_image"""
+
+    def __init__(self, compressor, path, size, output_ext, quality):
+        self.compressor = compressor
+        self.path = path
+        self.size = size
+        self.output_ext = output_ext
+        self.quality = quality
+        self.frame = None
+        self.top = 0
+
+    def write(self, band: Image.Image):
+        if self.frame is None:
+            self.frame = Image.new(band.mode, self.size)
+            if band.mode == 'P':
+                self.frame.putpalette(band.getpalette())
+        self.frame.paste(band, (0, self.top))
+        self.top += band.height
+
+    def close(self):
+        self.compressor._save_image(self.frame, self.path, self.output_ext, self.quality)
+
+    def abort(self):
+        self.frame = None  # nothing was written yet
+
+# Animated inputs keep every frame when written as one of these; other targets get the first frame
+ANIMATED_OUTPUT_FORMATS = {'.gif', '.webp'}
+
+def changed_box(previous: Image.Image, frame: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box of the pixels (alpha included) that differ between two same-sized frames"""
+    boxes = [band.getbbox() for band in ImageChops.difference(previous, frame).split()]
+    boxes = [box for box in boxes if box]
+    if not boxes:
+        return None
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+def _opaque_mask(frame: Image.Image) -> Optional[Image.Image]:
+    """Pixels a GIF keeps opaque (alpha ≥ 128), or None for frames without alpha"""
+    if frame.mode != 'RGBA':
+        return None
+    return frame.getchannel('A').point(lambda a: 255 if a >= 128 else 0)
+
+class GifAnimationWriter:
+    """Assemble an animated GIF in memory from frames encoded independently.
+
+    Pillow encodes each frame as a still GIF (quantizing it to its own
+    palette); its color table becomes the frame's local table and its LZW
+    data is copied behind a graphic control extension carrying the delay.
+    Frames store only the area that changed since the previous one and are
+    left in place. A frame followed by one that turns opaque pixels
+    transparent is stored whole and cleared instead, so the next frame
+    never shows stale content through its transparent pixels.
+    """
+
+    def __init__(self, size, loop: Optional[int]):
+        self.size = size
+        self.previous: Optional[Image.Image] = None
+        self.cleared = False
+        self.buffer = io.BytesIO()
+        # GIF89a logical screen without a global color table
+        self.buffer.write(b'GIF89a' + struct.pack('<HHBBB', size[0], size[1], 0, 0, 0))
+        if loop is not None:
+            self.buffer.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', loop) + b'\x00')
+
+    def place(self, frame: Image.Image, following: Optional[Image.Image]) -> Tuple[Tuple[int, int, int, int], int]:
+        """Area of the canvas to store for a frame and its disposal method"""
+        mask = _opaque_mask(frame)
+        following_mask = _opaque_mask(following) if following is not None else None
+        # Disposal 2 clears the canvas once the frame has been shown, 1 leaves it
+        clear = mask is not None and following_mask is not None and bool(
+            ImageChops.subtract(mask, following_mask).getbbox())
+        if self.previous is None or self.cleared or clear:
+            box = (0, 0) + frame.size
+        else:
+            box = changed_box(self.previous, frame) or (0, 0, 1, 1)
+        self.previous, self.cleared = frame, clear
+        return box, 2 if clear else 1
+
+    @staticmethod
+    def encode(frame: Image.Image, quality, params: dict) -> Tuple[bytes, bytes, int, Optional[int]]:
+        """Encode one frame; returns (color table, LZW data, interlace flag, transparent index)"""
+        buffer = io.BytesIO()
+        if frame.mode in ('RGBA', 'LA'):
+            frame = frame.convert('RGBA')
+            clear = frame.getchannel('A').point(lambda a: 255 if a < 128 else 0)
+            frame = frame.convert('RGB').quantize(255)
+            frame.paste(255, mask=clear)
+            frame.save(buffer, 'GIF', transparency=255, **params)
+        else:
+            frame.convert('RGB').quantize(256).save(buffer, 'GIF', **params)
+        data = buffer.getvalue()
+
+        # Header, then the global color table Pillow writes for a single frame
+        flags, pos, table = data[10], 13, b''
+        if flags & 0x80:
+            table_size = 3 << ((flags & 7) + 1)
+            table, pos = data[pos:pos + table_size], pos + table_size
+        transparency = None
+        while data[pos] == 0x21:
+            if data[pos + 1] == 0xF9 and data[pos + 3] & 1:
+                transparency = data[pos + 6]
+            pos += 2
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+        # Image descriptor, an optional local table, then the LZW data up to the trailer
+        descriptor_flags, pos = data[pos + 9], pos + 10
+        if descriptor_flags & 0x80:
+            table_size = 3 << ((descriptor_flags & 7) + 1)
+            table, pos = data[pos:pos + table_size], pos + table_size
+        return table, data[pos:-1], descriptor_flags & 0x40, transparency
+
+    def add(self, encoded, box, disposal: int, duration: int):
+        table, lzw, interlace, transparency = encoded
+        packed = (disposal << 2) | (transparency is not None)
+        self.buffer.write(b'!\xf9\x04' + struct.pack('<BHBB', packed, round(duration / 10), transparency or 0, 0))
+        size_bits = (len(table) // 3).bit_length() - 2
+        self.buffer.write(b',' + struct.pack('<HHHHB', box[0], box[1], box[2] - box[0], box[3] - box[1],
+                                             0x80 | interlace | size_bits) + table + lzw)
+
+    def getvalue(self) -> bytes:
+        return self.buffer.getvalue() + b';'
+
+def _riff_chunk(fourcc: bytes, payload: bytes) -> bytes:
+    return fourcc + struct.pack('<I', len(payload)) + payload + b'\x00' * (len(payload) & 1)
+
+def _uint24(value: int) -> bytes:
+    return struct.pack('<I', value)[:3]
+
+class WebPAnimationWriter:
+    """Assemble an animated WebP in memory from frames encoded independently.
+
+    Each frame is a still WebP from Pillow whose bitstream chunks (ALPH,
+    VP8 or VP8L) are wrapped in an ANMF chunk. Frames store only the area
+    that changed since the previous one and replace it without blending,
+    which is exact for transparent animations too.
+    """
+
+    def __init__(self, size, loop: Optional[int]):
+        self.size = size
+        self.loop = 1 if loop is None else loop  # a GIF without a loop extension plays once
+        self.alpha = False
+        self.previous: Optional[Image.Image] = None
+        self.buffer = io.BytesIO()
+
+    def place(self, frame: Image.Image, following: Optional[Image.Image]) -> Tuple[Tuple[int, int, int, int], int]:
+        """Area of the canvas to store for a frame; frames replace it, so nothing is disposed"""
+        if self.previous is None:
+            box = (0, 0) + frame.size
+        else:
+            box = changed_box(self.previous, frame) or (0, 0, 1, 1)
+        self.previous = frame
+        return (box[0] & ~1, box[1] & ~1) + box[2:], 0  # frame offsets are stored halved
+
+    @staticmethod
+    def encode(frame: Image.Image, quality, params: dict) -> bytes:
+        """Encode one frame and return its bitstream chunks"""
+        buffer = io.BytesIO()
+        frame.save(buffer, 'WebP', quality=quality or 95, lossless=False, **params)
+        data = buffer.getvalue()
+        chunks, pos = [], 12
+        while pos + 8 <= len(data):
+            fourcc, length = data[pos:pos + 4], struct.unpack('<I', data[pos + 4:pos + 8])[0]
+            end = pos + 8 + length + (length & 1)
+            if fourcc in (b'ALPH', b'VP8 ', b'VP8L'):
+                chunks.append(data[pos:end])
+            pos = end
+        return b''.join(chunks)
+
+    def add(self, encoded: bytes, box, disposal: int, duration: int):
+        self.alpha = self.alpha or encoded.startswith(b'ALPH') or encoded.startswith(b'VP8L')
+        header = (_uint24(box[0] // 2) + _uint24(box[1] // 2) + _uint24(box[2] - box[0] - 1)
+                  + _uint24(box[3] - box[1] - 1) + _uint24(min(duration, 0xFFFFFF))
+                  + bytes([0x02 | disposal]))  # no blending
+        self.buffer.write(_riff_chunk(b'ANMF', header + encoded))
+
+    def getvalue(self) -> bytes:
+        flags = 0x02 | (0x10 if self.alpha else 0)  # animation, alpha
+        body = (b'WEBP' + _riff_chunk(b'VP8X', bytes([flags, 0, 0, 0]) + _uint24(self.size[0] - 1)
+                                      + _uint24(self.size[1] - 1))
+                + _riff_chunk(b'ANIM', struct.pack('<IH', 0, self.loop)) + self.buffer.getvalue())
+        return b'RIFF' + struct.pack('<I', len(body)) + body
+
+# Pipeline stages in report order
+PIPELINE_STAGES = ('decode', 'exif_transpose', 'resize', 'convert', 'encode', 'write')
+
+@dataclass(frozen=True)
+class ConversionPlan:
+    """Pixel work a processing mode needs for one source mode and target format.
+
+    Built by plan_conversion from the same rules _convert_format_only and
+    _compress_quality_only have always followed, folded so that an image
+    sees at most one Image.convert and one alpha composite.
+    """
+    source_mode: str
+    transparency: bool
+    input_ext: str
+    output_ext: str
+    processing_mode: str
+    convert: Optional[str] = None  # Image.convert target, applied first
+    flatten: bool = False          # composite the alpha onto white, giving RGB
+
+    def apply(self, img: Image.Image) -> Image.Image:
+        if self.convert:
+            img = img.convert(self.convert)
+        if self.flatten:
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            # The LA/RGBA image itself is a valid paste mask; no split() copy of the alpha
+            background.paste(img if img.mode == 'RGBA' else img.convert('RGB'), mask=img)
+            return background
+        return img
+
+    def __str__(self):
+        steps = [f"convert to {self.convert}"] if self.convert else []
+        if self.flatten:
+            steps.append("flatten alpha onto white")
+        source = f"{self.source_mode}{' + transparency' if self.transparency else ''}"
+        return (f"{source} {self.input_ext} → {self.output_ext} [{self.processing_mode}]: "
+                f"{', '.join(steps) or 'no pixel work'}")
+
+def _format_steps(mode: str, transparency: bool, ext: str) -> list:
+    """Steps _convert_format_only takes to make an image fit a target format"""
+    if ext in ('.jpg', '.jpeg', '.bmp'):
+        # No transparency support: flatten onto white
+        if mode in ('RGBA', 'LA'):
+            return ['flatten']
+        if mode == 'P':
+            return ['RGB']
+    elif ext == '.png':
+        # PNG supports all modes
+        if mode == 'P' and transparency:
+            return ['RGBA']
+    elif ext == '.webp':
+        if mode not in ('RGB', 'RGBA', 'L'):
+            return ['RGBA' if mode == 'P' and transparency else 'RGB']
+    return []
+
+def _quality_steps(mode: str, ext: str) -> list:
+    """Steps _compress_quality_only takes before a lossy encode.
+
+    PNG needs nothing: a palette image never holds more than 256 colours,
+    so there is no palette to widen.
+    """
+    if ext in ('.jpg', '.jpeg', '.webp') and mode not in ('RGB', 'L'):
+        return ['flatten' if mode in ('RGBA', 'LA') else 'RGB']
+    return []
+
+@functools.lru_cache(maxsize=None)
+def plan_conversion(mode: str, transparency: bool, input_ext: str, output_ext: str,
+                    processing_mode: str) -> ConversionPlan:
+    """Fold the steps of a processing mode into one cached ConversionPlan"""
+    stages = {
+        "convert_only": [('format', output_ext)],
+        "compress_only": [('quality', output_ext)],
+        "convert_compress": [('format', output_ext), ('quality', output_ext)],
+        "compress_convert": [('quality', input_ext), ('format', output_ext)],
+    }[processing_mode]
+
+    current, has_transparency = mode, transparency
+    convert, flatten = None, False
+    for kind, ext in stages:
+        steps = _format_steps(current, has_transparency, ext) if kind == 'format' else _quality_steps(current, ext)
+        for step in steps:
+            if step == 'flatten':
+                flatten = True
+                current = 'RGB'  # every later rule is a no-op on RGB
+            else:
+                # Back-to-back converts collapse into the last one (P → RGBA → RGB is P → RGB)
+                convert = current = step
+            has_transparency = has_transparency and current == 'P'
+
+    return ConversionPlan(mode, transparency, input_ext, output_ext, processing_mode,
+                          convert if convert != mode else None, flatten)
+
+class StageTimer:
+    """Wall/CPU time and byte counters per pipeline stage for one file"""
+    enabled = True
+
     def __init__(self):
-        self.supported_formats = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
+        self.stages: Dict[str, List[float]] = {}
+        self.bytes: Dict[str, int] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, [0.0, 0.0])
+            totals[0] += time.perf_counter() - wall
+            totals[1] += time.process_time() - cpu
+
+    def count(self, name: str, nbytes: int):
+        self.bytes[name] = self.bytes.get(name, 0) + nbytes
+
+    def as_dict(self) -> dict:
+        return {
+            'stages': {name: {'wall': wall, 'cpu': cpu} for name, (wall, cpu) in self.stages.items()},
+            'bytes': dict(self.bytes),
+        }
+
+class _NullTimer:
+    """Stand-in used when instrumentation is off; every call is a no-op"""
+    enabled = False
+    _context = contextlib.nullcontext()
+
+    def stage(self, name: str):
+        return self._context
+
+    def count(self, name: str, nbytes: int):
+        pass
+
+NULL_TIMER = _NullTimer()
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+def hash_file(path, chunk_size: int = 1 << 20) -> str:
+    """Content hash used to tell whether an input really changed"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_or_copy(source, target) -> bool:
+    """Hardlink target to source, copying where links are not possible; True if linked.
+
+    The link or copy is made under a temp name and renamed over ``target``.
+    """
+    tmp_path = temp_path_for(target)
+    tmp_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(source, tmp_path)
+        linked = True
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+        linked = False
+    os.replace(tmp_path, target)
+    return linked
+
+# Bytes hashed to split a size bucket before hashing whole files
+DEDUPE_HEAD_BYTES = 64 * 1024
+# Near-duplicates compare a difference hash of a (size + 1)×size grey thumbnail: 256 bits
+PERCEPTUAL_HASH_SIZE = 16
+# The hash ignores colour and brightness, so an 8×8 colour thumbnail must also match within this many levels
+NEAR_DUPLICATE_COLOR_TOLERANCE = 8
+
+class BuildManifest:
+    """Maps each input to the output it produced and the settings used.
+
+    Stored as JSON next to the outputs so a re-run can skip inputs whose
+    content and settings are unchanged and whose output is still in place.
+    """
+    FILENAME = '.mami-manifest.json'
+    VERSION = 1
+
+    def __init__(self, input_dir: Path, output_dir: Path):
+        self.input_dir = Path(input_dir).resolve()
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / self.FILENAME
+        self.entries: Dict[str, dict] = {}
+        # Outputs replaced by a differently named one, removed by prune_orphans()
+        self.superseded = set()
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                self.entries = data.get('entries', {})
+                self.superseded = set(data.get('superseded', []))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"{Colors.YELLOW}⚠️  Ignoring unreadable manifest {self.path.name}: {e}{Colors.ENDC}")
+
+    @staticmethod
+    def settings_for(mode, quality, output_ext, suffix, target_size=None, resize=None, preset="balanced",
+                     min_ssim=None, never_larger=True) -> dict:
+        return {
+            'mode': mode,
+            'quality': quality,
+            'target_size': target_size,
+            'min_ssim': min_ssim,
+            'never_larger': never_larger,
+            'resize': resize,
+            'preset': preset,
+            'output_ext': output_ext,
+            'suffix': suffix,
+            'pillow': PIL.__version__,
+        }
+
+    def key_for(self, input_path) -> str:
+        path = Path(input_path).resolve()
+        try:
+            return path.relative_to(self.input_dir).as_posix()
+        except ValueError:
+            return str(path)
+
+    def check(self, info: ImageInfo, settings: dict) -> Tuple[bool, Optional[dict]]:
+        """Return (up_to_date, recorded_entry) for an input.
+
+        The content hash is only computed when the file's size or mtime
+        moved since it was recorded; it is stored on ``info`` for reuse.
+        """
+        entry = self.entries.get(self.key_for(info.path))
+        if entry is None:
+            return False, None
+
+        if entry['file_size'] == info.file_size and entry['mtime_ns'] == info.mtime_ns:
+            info.content_hash = entry['hash']
+        elif entry['file_size'] == info.file_size:
+            info.content_hash = hash_file(info.path)
+        else:
+            info.content_hash = None  # size changed, so the content did too
+
+        if info.content_hash != entry['hash'] or entry['settings'] != settings:
+            return False, entry
+
+        try:
+            up_to_date = (self.output_dir / entry['output']).stat().st_size == entry['output_size']
+        except OSError:
+            up_to_date = False
+        if up_to_date:
+            # Remember the new mtime so a touched file is not hashed again
+            entry['mtime_ns'] = info.mtime_ns
+        return up_to_date, entry
+
+    def record(self, info: ImageInfo, result: FileResult, settings: dict):
+        key = self.key_for(info.path)
+        output_name = Path(result.output_path).relative_to(self.output_dir).as_posix()
+        previous = self.entries.get(key)
+        if previous and previous['output'] != output_name:
+            self.superseded.add(previous['output'])
+        self.entries[key] = {
+            'hash': result.content_hash,
+            'file_size': info.file_size,
+            'mtime_ns': info.mtime_ns,
+            'settings': settings,
+            'output': output_name,
+            'output_size': result.output_size,
+        }
+
+    def prune_orphans(self) -> List[Path]:
+        """Forget inputs that are gone and delete outputs nothing refers to any more"""
+        stale = set(self.superseded)
+        for key in list(self.entries):
+            if not (self.input_dir / key).exists():
+                stale.add(self.entries.pop(key)['output'])
+
+        live = {entry['output'] for entry in self.entries.values()}
+        removed = []
+        for name in sorted(stale - live):
+            output_path = self.output_dir / name
+            if output_path.exists():
+                output_path.unlink()
+                removed.append(output_path)
+        self.superseded.clear()
+        return removed
+
+    def save(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'entries': self.entries,
+                       'superseded': sorted(self.superseded)}, f)
+        os.replace(tmp_path, self.path)
+
+class JobJournal:
+    """Append-only record of the inputs a batch has finished, so an interrupted run can resume.
+
+    The first line holds the batch settings; then come the outputs each run
+    planned and one line per finished input. Lines are flushed as they are
+    written and fsynced every ``sync_every`` lines or ``sync_seconds``, so a
+    crash loses at most the last few entries and may tear only the last line.
+    """
+    FILENAME = '.mami-journal.jsonl'
+
+    def __init__(self, output_dir: Path, sync_every: int = 64, sync_seconds: float = 2.0):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / self.FILENAME
+        self.sync_every = sync_every
+        self.sync_seconds = sync_seconds
+        self.done: Dict[str, dict] = {}  # input key -> entry of its successful run
+        self.planned = set()             # outputs named by earlier runs of this batch
+        self.file = None
+        self.pending = 0
+        self.synced = time.monotonic()
+
+    def open(self, settings: dict, resume: bool = False):
+        """Start a new journal, or with ``resume`` replay the existing one and append to it"""
+        settings = json.loads(json.dumps(settings))  # compare as read back
+        data = b''
+        if resume:
+            try:
+                data = self.path.read_bytes()
+            except FileNotFoundError:
+                print(f"{Colors.YELLOW}⚠️  No {self.FILENAME} to resume in {self.output_dir}; "
+                      f"processing everything{Colors.ENDC}")
+        header = self._replay(data)
+        if header is not None and header.get('settings') != settings:
+            raise ValueError(f"{self.path} was written with different settings; run without --resume to start over")
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if header is None:
+            self.file = open(self.path, 'wb')
+            self._write({'settings': settings})
+        else:
+            self.file = open(self.path, 'ab')
+            if not data.endswith(b'\n'):
+                self.file.write(b'\n')  # end a line torn by the crash
+
+    def _replay(self, data: bytes) -> Optional[dict]:
+        header = None
+        for line in data.split(b'\n'):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # empty, or torn by a crash mid-write
+            if header is None:
+                header = entry
+            elif 'planned' in entry:
+                self.planned.update(entry['planned'])
+            elif entry.get('status') == "success":
+                self.done[entry['input']] = entry
+            else:
+                self.done.pop(entry.get('input'), None)
+        return header
+
+    def _name(self, path) -> str:
+        return Path(path).relative_to(self.output_dir).as_posix()
+
+    def lookup(self, key: str, info: ImageInfo) -> Optional[dict]:
+        """Entry of an input finished by an earlier run, if it and its outputs are unchanged"""
+        entry = self.done.get(key)
+        if entry is None or entry['size'] != info.file_size or entry['mtime_ns'] != info.mtime_ns:
+            return None
+        for name, size in entry['outputs']:
+            try:
+                if (self.output_dir / name).stat().st_size != size:
+                    return None
+            except OSError:
+                return None
+        return entry
+
+    def plan(self, output_paths):
+        self._write({'planned': [self._name(path) for path in output_paths]})
+
+    def record(self, key: str, info: ImageInfo, result: FileResult):
+        if result.variants:
+            outputs = [(v['path'], v['size']) for v in result.variants]
+        else:
+            outputs = [(result.output_path, result.output_size)] if result.status == "success" else []
+        self._write({'input': key, 'size': info.file_size, 'mtime_ns': info.mtime_ns, 'status': result.status,
+                     'hash': result.content_hash, 'outputs': [[self._name(path), size] for path, size in outputs]})
+
+    def _write(self, entry: dict):
+        self.file.write(json.dumps(entry).encode('utf-8') + b'\n')
+        self.file.flush()
+        self.pending += 1
+        if self.pending >= self.sync_every or time.monotonic() - self.synced >= self.sync_seconds:
+            self.sync()
+
+    def sync(self):
+        if self.pending:
+            os.fsync(self.file.fileno())
+            self.pending = 0
+        self.synced = time.monotonic()
+
+    def close(self):
+        if self.file:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+class ProgressEvents:
+    """Hand structured batch events to pluggable sinks.
+
+    A batch is framed by ``batch_started`` and ``batch_finished``; every input
+    gets ``started`` (when its job is submitted to the pool) and then
+    ``finished``, ``failed`` or ``skipped``. Their ``seconds`` are measured
+    inside the worker, so they leave out any wait between the two. Events are
+    JSON-ready dicts; file events also pass the FileResult along for sinks
+    that render it.
+    """
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+
+    def emit(self, kind: str, result: Optional[FileResult] = None, **fields):
+        if not self.sinks:
+            return
+        event = {'event': kind, 'time': round(time.time(), 3)}
+        if result is not None:
+            event.update(input=result.input_path, output=result.output_path, status=result.status,
+                         original_size=result.original_size, output_size=result.output_size,
+                         seconds=round(result.seconds, 4), cpu_seconds=round(result.cpu_seconds, 4),
+                         error=result.error)
+        event.update(fields)
+        for sink in self.sinks:
+            sink.emit(event, result)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+class JsonlSink:
+    """Append events as JSON lines to a file, or to stdout for '-'; flushed at most every PROGRESS_INTERVAL"""
+
+    def __init__(self, path):
+        self.file = sys.__stdout__ if str(path) == '-' else open(path, 'a', encoding='utf-8')
+        self.flushed = time.monotonic()
+
+    def emit(self, event: dict, result: Optional[FileResult] = None):
+        self.file.write(json.dumps(event) + '\n')
+        now = time.monotonic()
+        if now - self.flushed >= PROGRESS_INTERVAL:
+            self.file.flush()
+            self.flushed = now
+
+    def close(self):
+        self.file.flush()
+        if self.file is not sys.__stdout__:
+            self.file.close()
+
+class FileLinesSink:
+    """The detailed report: a progress bar redraw and a few lines for every processed file"""
+
+    def __init__(self, compressor):
+        self.compressor = compressor
+
+    def emit(self, event: dict, result: Optional[FileResult] = None):
+        if event['event'] in ('finished', 'failed') and 'completed' in event:
+            self.compressor.print_progress_bar(event['completed'], event['total'])
+            self.compressor._report_result(result)
+        elif event['event'] == 'batch_finished' and event['total']:
+            self.compressor.print_progress_bar(event['total'], event['total'])
+
+    def close(self):
+        pass
+
+class TerminalProgress:
+    """A status line redrawn at most every ``interval`` seconds with throughput and ETA.
+
+    Failures are still printed as they happen, above the status line.
+    """
+
+    def __init__(self, interval: float = PROGRESS_INTERVAL, width: int = 30):
+        self.interval = interval
+        self.width = width
+        self.started = time.monotonic()
+        self.drawn = 0.0
+        self.completed = self.total = 0
+        self.processed = self.failed = 0
+        self.bytes_in = 0
+
+    def emit(self, event: dict, result: Optional[FileResult] = None):
+        kind = event['event']
+        if kind == 'batch_started':
+            self.started = time.monotonic()
+        if kind in ('finished', 'failed'):
+            if kind == 'failed':
+                self.failed += 1
+                sys.stdout.write(f"\r\033[K{Colors.RED}❌ {Path(event['input']).name}: {event['error']}{Colors.ENDC}\n")
+                self.drawn = 0.0
+            if 'completed' in event:
+                self.processed += 1
+                self.bytes_in += event['original_size']
+                self.completed, self.total = event['completed'], event['total']
+        elif kind == 'batch_finished':
+            self.completed = self.total = event['total']
+
+        now = time.monotonic()
+        if kind == 'batch_finished' or now - self.drawn >= self.interval:
+            self.drawn = now
+            self._draw(now)
+
+    def _draw(self, now: float):
+        if not self.total:
+            return
+        elapsed = max(now - self.started, 1e-6)
+        rate = self.processed / elapsed
+        filled = int(self.width * self.completed / self.total)
+        eta = format_duration((self.total - self.completed) / rate) if rate else "--:--"
+        line = (f"[{'█' * filled}{'░' * (self.width - filled)}] {self.completed / self.total * 100:5.1f}% "
+                f"({self.completed}/{self.total}) · {rate:.1f} img/s · {self.bytes_in / elapsed / (1024 * 1024):.2f} MB/s"
+                f" · ETA {eta}")
+        if self.failed:
+            line += f" · {Colors.RED}{self.failed} failed{Colors.GREEN}"
+        sys.stdout.write(f"\r\033[K{Colors.GREEN}{line}{Colors.ENDC}")
+        sys.stdout.flush()
+
+    def close(self):
+        pass
+
+class Inotify:
+    """Minimal non-blocking inotify reader for a set of directories (Linux only)"""
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_Q_OVERFLOW = 0x4000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+    def __init__(self, folder: Path):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError("inotify is not available on this platform")
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders: Dict[int, str] = {}  # watch descriptor -> folder
+        try:
+            self.add(folder)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def add(self, folder):
+        """Watch one more folder; watching the same folder again is harmless"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(str(folder)), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"cannot watch {folder}")
+        self.folders[wd] = str(folder)
+
+    def read(self, timeout: float) -> Tuple[List[str], List[str], bool]:
+        """Return the file paths and new folder paths seen within timeout, and whether events were dropped"""
+        paths, folders, overflow = [], [], False
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return paths, folders, overflow
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return paths, folders, overflow
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            if mask & self.IN_Q_OVERFLOW:
+                overflow = True
+            elif length and wd in self.folders:
+                path = os.path.join(self.folders[wd], os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+                (folders if mask & self.IN_ISDIR else paths).append(path)
+            offset += length
+        return paths, folders, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+class FolderWatcher:
+    """Report image files in a folder tree once they have stopped changing.
+
+    Uses inotify where available and otherwise rescans the tree every
+    ``poll_interval`` seconds. Subfolders are watched too, including those
+    created later; hidden and symlinked folders and those in ``skip`` (real
+    paths) are left out, as in LocalStorage.walk. A file is handed out after
+    its size and mtime stayed the same for ``settle`` seconds, and again
+    whenever it changes later on.
+    """
+
+    def __init__(self, folder: Path, extensions, settle: float = 1.0, poll_interval: float = 1.0,
+                 use_inotify: bool = True, skip=()):
+        self.folder = Path(folder)
+        self.extensions = {ext.lower() for ext in extensions}
+        self.skip = set(skip)
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.pending: Dict[str, Tuple[int, int, float]] = {}  # path -> (size, mtime_ns, last change)
+        self.arrivals: Dict[str, float] = {}
+        self.handed_out: Dict[str, Tuple[int, int]] = {}
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify(self.folder)
+            except (OSError, AttributeError):
+                self.inotify = None
+        self.backend = 'inotify' if self.inotify else 'polling'
+        self.next_poll = 0.0
+        self.rescan()
+
+    def _saw(self, path: str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.pending.pop(path, None)
+            self.arrivals.pop(path, None)
+            return
+        key = (stat.st_size, stat.st_mtime_ns)
+        if self.handed_out.get(path) == key:
+            return
+        current = self.pending.get(path)
+        if current is None or current[:2] != key:
+            now = time.monotonic()
+            self.pending[path] = (*key, now)
+            self.arrivals.setdefault(path, now)
+
+    def rescan(self, folder=None):
+        """Look at every file under folder (the whole tree by default), watching its subfolders"""
+        stack = [str(folder or self.folder)]
+        while stack:
+            current = stack.pop()
+            if self.inotify:
+                try:
+                    self.inotify.add(current)  # before listing, so nothing created meanwhile is missed
+                except OSError:
+                    continue
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            if os.path.realpath(entry.path) not in self.skip:
+                                stack.append(entry.path)
+                        elif Path(entry.name).suffix.lower() in self.extensions and entry.is_file():
+                            self._saw(entry.path)
+            except OSError:
+                continue
+        if folder is None:
+            self.next_poll = time.monotonic() + self.poll_interval
+
+    def wait(self, timeout: float):
+        """Collect file system changes for up to timeout seconds"""
+        if self.inotify:
+            paths, folders, overflow = self.inotify.read(timeout)
+            if overflow:
+                self.rescan()
+            for folder in folders:
+                if not os.path.basename(folder).startswith('.') and os.path.realpath(folder) not in self.skip:
+                    self.rescan(folder)  # files may have landed in it before its watch was added
+            for path in paths:
+                if Path(path).suffix.lower() in self.extensions and not os.path.basename(path).startswith('.'):
+                    self._saw(path)
+            return
+        time.sleep(max(0.0, min(timeout, self.next_poll - time.monotonic())))
+        if time.monotonic() >= self.next_poll:
+            self.rescan()
+
+    def ready(self, limit: int) -> List[Tuple[str, float]]:
+        """Pop up to limit settled files as (path, arrival time), oldest first"""
+        now = time.monotonic()
+        ready = []
+        for path in sorted(self.pending, key=self.arrivals.get):
+            if len(ready) >= limit:
+                break
+            if now - self.pending[path][2] < self.settle:
+                continue
+            self._saw(path)  # a final stat catches writers that went quiet mid-file
+            entry = self.pending.get(path)
+            if entry is None or now - entry[2] < self.settle:
+                continue
+            del self.pending[path]
+            self.handed_out[path] = entry[:2]
+            ready.append((path, self.arrivals.pop(path)))
+        return ready
+
+    def requeue(self, path: str, arrival: float):
+        """Hand a file out again later, keeping its original arrival time"""
+        self.handed_out.pop(path, None)
+        self.arrivals[path] = arrival
+        self._saw(path)
+
+    @property
+    def settling(self) -> int:
+        return len(self.pending)
+
+    def close(self):
+        if self.inotify:
+            self.inotify.close()
+
+class Storage:
+    """A location inputs are listed and read from, or outputs are written to.
+
+    Readable stores list the names relative to the location with ``walk()``;
+    archives and object stores also expose ``members``, mapping each name to
+    (size, mtime_ns). Remote stores are read ahead and written
+    behind on thread pools (see Prefetcher and process_images) so network
+    latency overlaps encoding. Sequential stores are only read by the main
+    process, in ``walk()`` order, which hands each member's bytes to a worker.
+    """
+    remote = False
+    sequential = False
+
+    def __init__(self, location):
+        self.location = str(location)
+        self.count = 0  # members written
+
+    def path_for(self, name: str) -> str:
+        return f"{self.location}{MEMBER_SEPARATOR}{name}"
+
+    def walk(self, skip=()):
+        """Member names in sorted order; ``skip`` only applies to folders"""
+        return iter(sorted(self.members))
+
+    def read(self, name: str, length: Optional[int] = None) -> bytes:
+        """The member's bytes; stores may return all of them even when ``length`` asks for a prefix"""
+        raise NotImplementedError
+
+    def add(self, name: str, data: bytes):
+        raise NotImplementedError
+
+    def close(self) -> List[Tuple[str, str]]:
+        """Finish pending writes and return (name, error) for those that failed"""
+        return []
+
+class LocalStorage(Storage):
+    """Image files in a folder tree; members are plain paths"""
+
+    def walk(self, skip=()):
+        """Yield file names relative to the folder as they are found, one directory listing at a time.
+
+        Each folder's files come before its subfolders, both sorted. Hidden
+        entries, symlinked folders and the folders in ``skip`` (real paths,
+        e.g. an output folder inside the input) are not entered.
+        """
+        stack = [('', self.location)]
+        while stack:
+            prefix, folder = stack.pop()
+            files, folders = [], []
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue  # hidden, like the shell glob
+                        if entry.is_dir(follow_symlinks=False):
+                            if os.path.realpath(entry.path) not in skip:
+                                folders.append(entry)
+                        elif entry.is_file():
+                            files.append(entry.name)
+            except OSError as e:
+                print(f"{Colors.YELLOW}⚠️  Cannot list {folder}: {e}{Colors.ENDC}")
+                continue
+            for name in sorted(files):
+                yield prefix + name
+            stack.extend((f"{prefix}{entry.name}/", entry.path) for entry in sorted(folders, key=lambda e: e.name, reverse=True))
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.location, name)
+
+    def read(self, name: str, length: Optional[int] = None) -> bytes:
+        with open(self.path_for(name), 'rb') as f:
+            return f.read(-1 if length is None else length)
+
+    def add(self, name: str, data: bytes):
+        path = Path(self.path_for(name))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(path) as f:
+            f.write(data)
+        self.count += 1
+
+class S3Storage(Storage):
+    """Objects under an s3://bucket/prefix location of any S3-compatible store.
+
+    Needs boto3. ``endpoint_url`` points at MinIO, moto's server mode or
+    another S3-compatible service; without it boto3's own configuration
+    (including AWS_ENDPOINT_URL) applies. One client with a pool of
+    ``connections`` serves all threads. Writes are uploaded in the
+    background with at most twice that many waiting in memory.
+    """
+    remote = True
+
+    def __init__(self, location, connections: int = 8, endpoint_url: Optional[str] = None):
+        super().__init__(str(location).rstrip('/'))
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("S3 locations need boto3: pip install boto3") from None
+        self.bucket, _, prefix = self.location[len('s3://'):].partition('/')
+        if not self.bucket:
+            raise ValueError(f"No bucket in S3 location: {location}")
+        self.prefix = f"{prefix}/" if prefix else ''
+        self.connections = connections
+        self.client = boto3.session.Session().client(
+            's3', endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=connections, retries={'mode': 'standard', 'max_attempts': 5}),
+        )
+        self._members: Optional[Dict[str, Tuple[int, int]]] = None
+        self._uploader: Optional[ThreadPoolExecutor] = None
+        self._upload_slots = threading.BoundedSemaphore(connections * 2)
+        self._uploads = []
+
+    @property
+    def members(self) -> Dict[str, Tuple[int, int]]:
+        if self._members is None:
+            self._members = {}
+            for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefix):
+                for item in page.get('Contents', ()):
+                    name = item['Key'][len(self.prefix):]
+                    if name and not name.endswith('/'):
+                        self._members[name] = (item['Size'], int(item['LastModified'].timestamp() * 1e9))
+        return self._members
+
+    def read(self, name: str, length: Optional[int] = None) -> bytes:
+        extra = {'Range': f"bytes=0-{length - 1}"} if length else {}
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + name, **extra)['Body'].read()
+
+    def add(self, name: str, data: bytes):
+        if self._uploader is None:
+            self._uploader = ThreadPoolExecutor(self.connections, thread_name_prefix='s3-upload')
+        # Blocks the caller once enough uploads are queued, so results cannot pile up in memory
+        self._upload_slots.acquire()
+        future = self._uploader.submit(self._put, name, data)
+        future.add_done_callback(lambda _: self._upload_slots.release())
+        self._uploads.append((name, future))
+
+    def _put(self, name: str, data: bytes):
+        content_type = Image.MIME.get(Image.registered_extensions().get(Path(name).suffix.lower()), 'application/octet-stream')
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + name, Body=data, ContentType=content_type)
+
+    def close(self) -> List[Tuple[str, str]]:
+        if self._uploader:
+            self._uploader.shutdown(wait=True)
+            self._uploader = None
+        failures = [(name, str(future.exception())) for name, future in self._uploads if future.exception()]
+        self.count += len(self._uploads) - len(failures)
+        self._uploads = []
+        return failures
+
+class ArchiveReader(Storage):
+    """Members of a zip or tar archive, read without unpacking to disk.
+
+    Zip and plain tar members are read at random; a plain tar is listed once
+    and ``listing`` hands its data offsets to the workers, so they seek
+    straight to each member. A compressed tar cannot be read at random: it is
+    walked in archive order and streamed forward by the main process alone.
+    """
+
+    def __init__(self, path, listing: Optional[Tuple[dict, dict]] = None):
+        super().__init__(path)
+        self.path = str(path)
+        self.zip, self.tar = None, None
+        self.members: Dict[str, Tuple[int, int]] = {}  # name -> (size, mtime_ns)
+        self.offsets: Dict[str, Tuple[int, int]] = {}  # plain tar: name -> (data offset, size)
+        self.lock = threading.Lock()
+        self.passed = set()  # compressed tar: names the stream has already gone by
+        if listing is not None:
+            self.members, self.offsets = listing
+        elif zipfile.is_zipfile(self.path):
+            self.zip = zipfile.ZipFile(self.path)
+            for item in self.zip.infolist():
+                if not item.is_dir():
+                    mtime = time.mktime(item.date_time + (0, 0, -1))
+                    self.members[item.filename] = (item.file_size, int(mtime * 1e9))
+        elif tarfile.is_tarfile(self.path):
+            try:
+                tar = tarfile.open(self.path, 'r:')
+            except tarfile.ReadError:
+                self.sequential = True
+                tar = tarfile.open(self.path, 'r|*')
+            with tar:
+                for item in tar:
+                    if item.isfile():
+                        self.members[item.name] = (item.size, int(item.mtime * 1e9))
+                        self.offsets[item.name] = (item.offset_data, item.size)
+        else:
+            raise ValueError(f"Not a zip or tar archive: {self.path}")
+
+    @property
+    def listing(self) -> Optional[Tuple[dict, dict]]:
+        """What a worker needs to read a plain tar without listing it again"""
+        return None if self.zip or self.sequential else (self.members, self.offsets)
+
+    def walk(self, skip=()):
+        """Sorted names, or archive order for a compressed tar"""
+        return iter(self.members) if self.sequential else super().walk(skip)
+
+    def read(self, name: str, length: Optional[int] = None) -> bytes:
+        if self.zip:
+            return self.zip.read(name)
+        if not self.sequential:
+            offset, size = self.offsets[name]
+            with open(self.path, 'rb') as file:
+                file.seek(offset)
+                return file.read(size if length is None else min(size, length))
+        with self.lock:
+            # Read on from the previous member; only an earlier one restarts the stream
+            if self.tar is None or name in self.passed:
+                if self.tar:
+                    self.tar.close()
+                self.tar, self.passed = tarfile.open(self.path, 'r|*'), set()
+            for item in iter(self.tar.next, None):
+                self.passed.add(item.name)
+                if item.name == name and item.isfile():
+                    return self.tar.extractfile(item).read()
+        raise KeyError(name)
+
+    def close(self) -> List[Tuple[str, str]]:
+        for archive in (self.zip, self.tar):
+            if archive:
+                archive.close()
+        return []
+
+# Open input stores of this process; forked workers must not share the parent's file offsets or connections
+_input_storages: Dict[Tuple[int, str], Storage] = {}
+
+def input_storage(location, connections: int = 8, endpoint_url: Optional[str] = None,
+                  listing: Optional[Tuple[dict, dict]] = None) -> Storage:
+    """The cached Storage for a folder, archive or s3:// location"""
+    key = (os.getpid(), str(location))
+    if key not in _input_storages:
+        if is_s3_url(location):
+            _input_storages[key] = S3Storage(location, connections, endpoint_url)
+        elif is_archive_path(location):
+            _input_storages[key] = ArchiveReader(location, listing)
+        else:
+            _input_storages[key] = LocalStorage(location)
+    return _input_storages[key]
+
+def read_member(path, length: Optional[int] = None) -> bytes:
+    if length is None and path in _preloaded:
+        return _preloaded[path]
+    location, member = split_member_path(path)
+    if location is None:
+        with open(path, 'rb') as f:
+            return f.read(-1 if length is None else length)
+    return input_storage(location).read(member, length)
+
+# Leading bytes fetched to probe a remote object; a retry reads the rest if the header is longer
+PROBE_BYTES = 256 * 1024
+
+# Inputs fetched ahead by the parent (see Prefetcher), keyed by member path
+_preloaded: Dict[str, bytes] = {}
+
+def open_image(path) -> Image.Image:
+    """Image.open for plain files, archive members and objects alike"""
+    if path in _preloaded:
+        return Image.open(io.BytesIO(_preloaded[path]))
+    if split_member_path(path)[0] is None:
+        return Image.open(path)
+    return Image.open(io.BytesIO(read_member(path)))
+
+class Prefetcher:
+    """Read inputs on a thread pool ahead of the jobs that decode them.
+
+    At most ``depth`` reads are in flight or waiting to be collected, which
+    bounds both the connections in use and the bytes held in memory.
+    """
+
+    def __init__(self, paths, depth: int, length: Optional[int] = None, threads: Optional[int] = None):
+        self.pending = deque(paths)
+        self.depth = max(1, depth)
+        self.length = length
+        self.futures = {}
+        # One thread reads a sequential store in the order of ``paths``
+        self.executor = ThreadPoolExecutor(threads or self.depth, thread_name_prefix='prefetch')
+        self._fill()
+
+    def _fill(self):
+        while self.pending and len(self.futures) < self.depth:
+            path = self.pending.popleft()
+            self.futures[path] = self.executor.submit(read_member, path, self.length)
+
+    def get(self, path) -> bytes:
+        future = self.futures.pop(path, None) or self.executor.submit(read_member, path, self.length)
+        self._fill()
+        return future.result()
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.executor.shutdown(wait=True)
+
+class ArchiveWriter(Storage):
+    """Write encoded outputs into a zip or tar, replacing the target once complete"""
+    # Already compressed formats are stored; BMP and TIFF still shrink with Deflate
+    DEFLATE_EXTENSIONS = ('.bmp', '.tiff', '.tif')
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + '.tmp')
+        name = self.path.name.lower()
+        self.zip, self.tar = None, None
+        if name.endswith('.zip'):
+            self.zip = zipfile.ZipFile(self.tmp_path, 'w')
+        else:
+            compression = next((kind for suffixes, kind in ((('.tar.gz', '.tgz'), 'gz'), (('.tar.bz2', '.tbz2'), 'bz2'),
+                                                            (('.tar.xz', '.txz'), 'xz')) if name.endswith(suffixes)), '')
+            self.tar = tarfile.open(self.tmp_path, f"w:{compression}")
+
+    def add(self, name: str, data: bytes):
+        if self.zip:
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = (zipfile.ZIP_DEFLATED if name.lower().endswith(self.DEFLATE_EXTENSIONS)
+                                  else zipfile.ZIP_STORED)
+            self.zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size, info.mtime = len(data), time.time()
+            self.tar.addfile(info, io.BytesIO(data))
+        self.count += 1
+
+    def close(self) -> List[Tuple[str, str]]:
+        (self.zip or self.tar).close()
+        os.replace(self.tmp_path, self.path)
+        return []
+
+# Longest side of the luma plane SSIM is measured on, and the side of its uniform window
+SSIM_SIZE = 512
+SSIM_WINDOW = 7
+
+class SimilarityReference:
+    """SSIM of candidate encodes against one reference frame.
+
+    Both are compared as luminance planes box-downsampled so the longer
+    side is at most SSIM_SIZE, which like the reference implementation
+    approximates a normal viewing distance. The reference plane and its
+    window statistics are computed once and reused for every candidate.
+    Needs NumPy, which is imported on first use.
+    """
+    # Stabilising constants of the SSIM formula for 8-bit samples
+    C1 = (0.01 * 255) ** 2
+    C2 = (0.03 * 255) ** 2
+
+    @staticmethod
+    def load_numpy():
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("--min-ssim needs NumPy: pip install numpy") from None
+        return numpy
+
+    def __init__(self, img: Image.Image):
+        self.np = self.load_numpy()
+        self.factor = max(1, -(-max(img.size) // SSIM_SIZE))
+        self.x = self._plane(img)
+        self.window = max(1, min(SSIM_WINDOW, *self.x.shape))
+        self.mu_x = self._window_mean(self.x)
+        self.var_x = self._window_mean(self.x * self.x) - self.mu_x ** 2
+
+    def _plane(self, img: Image.Image):
+        img = img if img.mode == 'L' else img.convert('L')
+        if self.factor > 1:
+            img = img.reduce(self.factor)
+        return self.np.asarray(img, dtype=self.np.float64)
+
+    def _window_mean(self, plane):
+        """Mean of every window×window block, from a summed-area table"""
+        k = self.window
+        table = self.np.zeros((plane.shape[0] + 1, plane.shape[1] + 1))
+        table[1:, 1:] = plane.cumsum(0).cumsum(1)
+        return (table[k:, k:] - table[:-k, k:] - table[k:, :-k] + table[:-k, :-k]) / (k * k)
+
+    def score(self, data: bytes) -> float:
+        """Mean SSIM of an encoded candidate, 1.0 meaning identical"""
+        with Image.open(io.BytesIO(data)) as img:
+            y = self._plane(img)
+        mu_y = self._window_mean(y)
+        var_y = self._window_mean(y * y) - mu_y ** 2
+        covariance = self._window_mean(self.x * y) - self.mu_x * mu_y
+        ssim = (((2 * self.mu_x * mu_y + self.C1) * (2 * covariance + self.C2))
+                / ((self.mu_x ** 2 + mu_y ** 2 + self.C1) * (self.var_x + var_y + self.C2)))
+        return float(ssim.mean())
+
+class ImageCompressor:
+    def __init__(self, workers: Optional[int] = None):
+        self.supported_formats = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp', '.gif'}
         self.input_dir = Path('./input')
         self.output_dir = Path('./output')
+        # Set by set_locations when the input or output is a zip/tar archive or s3:// location
+        self.input_store: Optional[str] = None
+        self.output_store: Optional[str] = None
+        self.captured: List[Tuple[str, bytes]] = []  # outputs awaiting the output store
+        # Concurrent reads/writes against remote stores, and the S3-compatible endpoint to use
+        self.storage_connections = 8
+        self.s3_endpoint: Optional[str] = None
         # Memory management constants
         self.MAX_IMAGE_SIZE_MB = 100  # Maximum image size in MB
         self.MAX_PIXELS = 50_000_000   # Maximum pixels (e.g., ~7000x7000)
+        # Share of currently available RAM that in-flight jobs may use together
+        self.memory_fraction = 0.7
+        # Number of worker processes used by process_images (1 = run in-process)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # How get_output_filename handles existing outputs: ask, replace, skip or rename
+        self.conflict_policy = "ask"
+        # Cache probe results in <output_dir>/.mami-scan-index.sqlite between runs
+        self.use_scan_index = True
+        self.rebuild_scan_index = False
+        self.scan_counts: Optional[Tuple[int, int]] = None  # (cached, probed) of the last scan, for the summary
+        # Run img.verify() on every file while scanning instead of relying on the decode
+        self.strict_verify = False
+        # Skip inputs recorded as up to date in <output_dir>/.mami-manifest.json
+        self.incremental = False
+        self.prune_orphans = False
+        # Skip inputs <output_dir>/.mami-journal.jsonl records as done; outputs the interrupted run named are reused
+        self.resume = False
+        self.reclaimed_outputs = frozenset()
+        # Byte budget per output image; quality becomes the upper bound of the search
+        self.target_size: Optional[int] = None
+        # Lowest JPEG/WebP quality (up to the chosen one) whose SSIM stays at least this
+        self.min_ssim: Optional[float] = None
+        # Outputs in the source's own format are never larger than the source (see _keep_source)
+        self.never_larger = True
+        self.kept_source: Optional[str] = None
+        # Encode duplicate inputs once; a distance also matches near-duplicates by perceptual hash
+        self.dedupe = False
+        self.dedupe_distance: Optional[int] = None
+        # Fan-out: every input yields each format at each width (see _compress_image_variants)
+        self.variant_formats: Tuple[str, ...] = ()
+        self.variant_widths: Tuple[int, ...] = ()
+        # Threads encoding the variants of one image; None shares the CPUs between workers
+        self.encode_threads: Optional[int] = None
+        # Encoder parameters (ENCODER_PRESETS); auto_tune picks the preset from sample encodes
+        self.encoder_preset = "balanced"
+        self.auto_tune = False
+        self.tune_throughput: Optional[float] = None
+        self.tune_size_slack = 0.05
+        self.tune_samples = 6
+        self.tuning: Optional[dict] = None
+        # Downscale before converting; JPEGs are decoded at 1/2, 1/4 or 1/8 when that suffices
+        self.max_width: Optional[int] = None
+        self.max_height: Optional[int] = None
+        self.scale: Optional[float] = None
+        # Per-stage instrumentation: summary percentiles, optional JSONL trace and cProfile sampling
+        self.instrument = False
+        self.trace_path: Optional[Path] = None
+        self.profile_samples = 0
+        self.profile_paths = frozenset()
+        self.profile_dir: Optional[str] = None
+        self.timer = NULL_TIMER
+        # Progress rendering (PROGRESS_MODES) and an optional JSONL event log ('-' for stdout)
+        self.progress_mode = "files"
+        self.events_path: Optional[str] = None
+        self.events = ProgressEvents()
+        # Conversion plans applied to the current file (see plan_conversion); --show-plans lists them
+        self.plans_used = set()
+        self.show_plans = False
+
+    def set_locations(self, input_path=None, output_path=None):
+        """Point the compressor at folders, zip/tar archives or s3://bucket/prefix locations"""
+        if input_path is not None:
+            # Path() would fold the '//' of an S3 URL
+            self.input_dir = str(input_path).rstrip('/') if is_s3_url(input_path) else Path(input_path)
+            self.input_store = str(self.input_dir) if is_store_location(input_path) else None
+        if output_path is not None:
+            self.output_store = str(output_path).rstrip('/') if is_store_location(output_path) else None
+            # Sidecar files (scan index, profile) live next to an output archive, or in the temp folder for S3,
+            # one folder per bucket and prefix so runs against different outputs never share them
+            if is_s3_url(output_path):
+                digest = hashlib.sha1(self.output_store.encode()).hexdigest()[:16]
+                self.output_dir = Path(tempfile.gettempdir()) / f"mami-image-{digest}"
+            else:
+                self.output_dir = Path(output_path).parent if self.output_store else Path(output_path)
+
+    def input_storage(self) -> Storage:
+        return input_storage(self.input_dir, self.storage_connections, self.s3_endpoint)
+
+    def open_output_storage(self) -> Optional[Storage]:
+        """Writer for outputs captured by the workers; None when they write files themselves"""
+        if not self.output_store:
+            return None
+        if is_s3_url(self.output_store):
+            return S3Storage(self.output_store, self.storage_connections, self.s3_endpoint)
+        return ArchiveWriter(self.output_store)
+
+    def _stat_input(self, path) -> Tuple[int, int]:
+        location, member = split_member_path(path)
+        if location is None:
+            stat = os.stat(path)
+            return stat.st_size, stat.st_mtime_ns
+        return input_storage(location).members[member]
+
+    def print_header(self):
+        print(f"\n{Colors.CYAN}{Colors.BOLD}╔════════════════════════════════════════════════════════════╗{Colors.ENDC}")
+        print(f"{Colors.CYAN}{Colors.BOLD}║                    🖼️  IMAGE COMPRESSOR  🖼️                 ║{Colors.ENDC}")
+        print(f"{Colors.CYAN}{Colors.BOLD}╚════════════════════════════════════════════════════════════╝{Colors.ENDC}\n")
+
+    def get_output_format(self):
+        print(f"\n{Colors.BLUE}{Colors.BOLD}📝 Output Format Selection{Colors.ENDC}\n")
+
+        print("Select output format:")
+        print(f"  {Colors.GREEN}1.{Colors.ENDC} Keep Original  (same as input format) {Colors.BOLD}[RECOMMENDED]{Colors.ENDC}")
+        print(f"  {Colors.YELLOW}2.{Colors.ENDC} JPEG (.jpg)    (best compression, no transparency)")
+        print(f"  {Colors.CYAN}3.{Colors.ENDC} PNG (.png)     (lossless, supports transparency)")
+        print(f"  {Colors.BLUE}4.{Colors.ENDC} WebP (.webp)   (modern format, excellent compression)")
+        print(f"  {Colors.CYAN}5.{Colors.ENDC} GIF (.gif)     (256 colours, keeps animations)")
+
+        while True:
+            choice = input(f"\n{Colors.BOLD}Enter your choice (1-5, or press Enter for recommended):{Colors.ENDC} ").strip()
+            if choice == '' or choice == '1':
+                return None, "Original Format"
+            elif choice == '2':
+                return '.jpg', "JPEG"
+            elif choice == '3':
+                return '.png', "PNG"
+            elif choice == '4':
+                return '.webp', "WebP"
+            elif choice == '5':
+                return '.gif', "GIF"
+            else:
+                print(f"{Colors.RED}Invalid choice. Please select 1, 2, 3, 4, 5, or press Enter for recommended.{Colors.ENDC}")
+
+    def get_processing_mode(self):
+        print(f"\n{Colors.BLUE}{Colors.BOLD}⚙️  Processing Mode Selection{Colors.ENDC}\n")
+
+        print("Choose processing mode:")
+        print(f"  {Colors.GREEN}1.{Colors.ENDC} Compress + Convert (compress quality, then convert format)")
+        print(f"  {Colors.YELLOW}2.{Colors.ENDC} Convert + Compress (convert format first, then compress quality)")
+        print(f"  {Colors.CYAN}3.{Colors.ENDC} Compress Only      (reduce quality, keep original format)")
+        print(f"  {Colors.BLUE}4.{Colors.ENDC} Convert Only       (change format, keep original quality) {Colors.BOLD}[RECOMMENDED]{Colors.ENDC}")
+
+        while True:
+            choice = input(f"\n{Colors.BOLD}Enter your choice (1-4, or press Enter for recommended):{Colors.ENDC} ").strip()
+            if choice == '' or choice == '4':
+                return "convert_only", "Convert Only"
+            elif choice == '1':
+                return "compress_convert", "Compress + Convert"
+            elif choice == '2':
+                return "convert_compress", "Convert + Compress"
+            elif choice == '3':
+                return "compress_only", "Compress Only"
+            else:
+                print(f"{Colors.RED}Invalid choice. Please select 1, 2, 3, 4, or press Enter for recommended.{Colors.ENDC}")
+
+    def get_output_suffix(self, default_suffix: str):
+        print(f"\n{Colors.BLUE}{Colors.BOLD}📝 Output Filename Settings{Colors.ENDC}\n")
+
+        print("Choose output filename format:")
+        print(f"  {Colors.GREEN}1.{Colors.ENDC} Add suffix to filename {Colors.BOLD}[RECOMMENDED]{Colors.ENDC}")
+        print(f"  {Colors.YELLOW}2.{Colors.ENDC} Keep original filename (no suffix)")
+
+        while True:
+            choice = input(f"\n{Colors.BOLD}Enter your choice (1-2, or press Enter for recommended):{Colors.ENDC} ").strip()
+            if choice == '' or choice == '1':
+                # Prompt for custom suffix (default depends on mode)
+                print(f"\n{Colors.CYAN}Enter suffix for output files:{Colors.ENDC}")
+                print(f"Example: '{default_suffix}' will rename 'photo.jpg' to 'photo{default_suffix}.jpg'")
+                suffix = input(f"{Colors.BOLD}Suffix (press Enter for '{default_suffix}'):{Colors.ENDC} ").strip()
+                if not suffix:
+                    return default_suffix
+                return normalize_suffix(suffix)
+            elif choice == '2':
+                return ""  # Empty suffix means keep original name
+            else:
+                print(f"{Colors.RED}Invalid choice. Please select 1, 2, or press Enter for recommended.{Colors.ENDC}")
+
+    def get_compression_settings(self):
+        print(f"{Colors.BLUE}{Colors.BOLD}📋 Compression Configuration{Colors.ENDC}\n")
+
+        # Processing mode selection
+        mode, mode_name = self.get_processing_mode()
+
+        quality, quality_name = None, None
+        output_ext, format_name = None, None
+
+        # Get compression settings if needed
+        if mode in ["compress_convert", "convert_compress", "compress_only"]:
+            print(f"\n{Colors.BLUE}{Colors.BOLD}🎯 Quality Settings{Colors.ENDC}\n")
+            print("Select compression quality:")
+            print(f"  {Colors.GREEN}1.{Colors.ENDC} High Quality   (90% quality, ~30% size reduction)")
+            print(f"  {Colors.YELLOW}2.{Colors.ENDC} Medium Quality (80% quality, ~45% size reduction) {Colors.BOLD}[RECOMMENDED]{Colors.ENDC}")
+            print(f"  {Colors.RED}3.{Colors.ENDC} Low Quality    (60% quality, ~65% size reduction)")
+            print(f"  {Colors.CYAN}4.{Colors.ENDC} Custom Quality (specify your own percentage)")
+            print(f"  {Colors.BLUE}5.{Colors.ENDC} Target File Size (e.g. 200KB per image)")
+            print(f"  {Colors.BLUE}6.{Colors.ENDC} Minimum Similarity (SSIM, e.g. 0.98; JPEG and WebP)")
+
+            while True:
+                choice = input(f"\n{Colors.BOLD}Enter your choice (1-6, or press Enter for recommended):{Colors.ENDC} ").strip()
+                if choice == '' or choice == '2':
+                    quality, quality_name = 80, "Medium (Recommended)"
+                    break
+                elif choice == '1':
+                    quality, quality_name = 90, "High"
+                    break
+                elif choice == '3':
+                    quality, quality_name = 60, "Low"
+                    break
+                elif choice == '4':
+                    while True:
+                        try:
+                            custom_quality = int(input(f"Enter quality percentage (1-100): "))
+                            if 1 <= custom_quality <= 100:
+                                quality, quality_name = custom_quality, "Custom"
+                                break
+                            print(f"{Colors.RED}Please enter a value between 1 and 100.{Colors.ENDC}")
+                        except ValueError:
+                            print(f"{Colors.RED}Please enter a valid number.{Colors.ENDC}")
+                    break
+                elif choice == '5':
+                    while True:
+                        try:
+                            self.target_size = parse_size(input("Enter maximum size per image (e.g. 200KB, 1.5MB): "))
+                            if self.target_size > 0:
+                                quality, quality_name = 95, f"Target ≤ {format_size(self.target_size)}"
+                                break
+                            print(f"{Colors.RED}Please enter a size greater than zero.{Colors.ENDC}")
+                        except ValueError:
+                            print(f"{Colors.RED}Please enter a size such as 200KB or 1.5MB.{Colors.ENDC}")
+                    break
+                elif choice == '6':
+                    while True:
+                        try:
+                            self.min_ssim = float(input("Enter minimum SSIM (e.g. 0.98): "))
+                            if 0 < self.min_ssim <= 1:
+                                quality, quality_name = 95, f"SSIM ≥ {self.min_ssim:g}"
+                                break
+                            print(f"{Colors.RED}Please enter a value greater than 0 and at most 1.{Colors.ENDC}")
+                        except ValueError:
+                            print(f"{Colors.RED}Please enter a number such as 0.98.{Colors.ENDC}")
+                    break
+                else:
+                    print(f"{Colors.RED}Invalid choice. Please select 1, 2, 3, 4, 5, 6, or press Enter for recommended.{Colors.ENDC}")
 
-    def print_header(self):
-        print(f"\n{Colors.CYAN}{Colors.BOLD}╔════════════════════════════════════════════════════════════╗{Colors.ENDC}")
-        print(f"{Colors.CYAN}{Colors.BOLD}║                    🖼️  IMAGE COMPRESSOR  🖼️                 ║{Colors.ENDC}")
-        print(f"{Colors.CYAN}{Colors.BOLD}╚════════════════════════════════════════════════════════════╝{Colors.ENDC}\n")
+        # Get format settings if needed
+        if mode in ["compress_convert", "convert_compress", "convert_only"]:
+            output_ext, format_name = self.get_output_format()
 
-    def get_output_format(self):
-        print(f"\n{Colors.BLUE}{Colors.BOLD}📝 Output Format Selection{Colors.ENDC}\n")
+        # Determine default suffix based on processing mode
+        if mode == "convert_only":
+            default_suffix_val = "-converted"
+        else:
+            default_suffix_val = "-compressed"
+        # Get suffix settings (default varies by mode)
+        suffix = self.get_output_suffix(default_suffix_val)
 
-        print("Select output format:")
-        print(f"  {Colors.GREEN}1.{Colors.ENDC} Keep Original  (same as input format) {Colors.BOLD}[RECOMMENDED]{Colors.ENDC}")
-        print(f"  {Colors.YELLOW}2.{Colors.ENDC} JPEG (.jpg)    (best compression, no transparency)")
-        print(f"  {Colors.CYAN}3.{Colors.ENDC} PNG (.png)     (lossless, supports transparency)")
-        print(f"  {Colors.BLUE}4.{Colors.ENDC} WebP (.webp)   (modern format, excellent compression)")
+        return quality, quality_name, output_ext, format_name, mode, mode_name, suffix
+
+    def _probe_image(self, file_path: str, file_size: int, mtime_ns: int, head: Optional[bytes] = None) -> ImageInfo:
+        """Read the image header, and with strict_verify also check the whole file.
+
+        ``head`` holds the file's leading bytes when they were already fetched.
+        """
+        info = ImageInfo(file_path, file_size, mtime_ns)
+        try:
+            with (Image.open(io.BytesIO(head)) if head is not None else open_image(file_path)) as img:
+                info.width, info.height = img.size
+                info.format, info.mode = img.format, img.mode
+                # Strips need a seekable file on disk
+                info.streamable = StripReader.supports(img) and split_member_path(file_path)[0] is None
+                info.valid = True
+                # Oversized images are rejected on dimensions alone, skip the full read
+                if self.strict_verify and info.width * info.height <= self.MAX_PIXELS:
+                    img.verify()
+                    info.verified = True
+        except Exception as e:
+            info.error = str(e)
+        return info
+
+    def _as_image_info(self, item: Union[str, ImageInfo]) -> ImageInfo:
+        """Accept plain paths from callers that did not go through scan_input_folder"""
+        if isinstance(item, ImageInfo):
+            return item
+        file_size, mtime_ns = self._stat_input(item)
+        return ImageInfo(str(item), file_size, mtime_ns, valid=True)
+
+    def _validate_image_file(self, file_path: str, index: Optional[ScanIndex] = None,
+                             head: Optional[bytes] = None) -> Optional[ImageInfo]:
+        """Validate image file for safety and size constraints, returning its record"""
+        try:
+            file_size, mtime_ns = self._stat_input(file_path)
+            file_size_mb = file_size / (1024 * 1024)
+
+            # Reuse the cached probe when the file is unchanged since the last scan
+            key = self._index_key(file_path)
+            info = index.lookup(key, file_size, mtime_ns, self.strict_verify) if index else None
+            if info is None:
+                info = self._probe_image(key, file_size, mtime_ns, head)
+                if not info.valid and head is not None and len(head) < file_size:
+                    # The header runs past the prefetched bytes
+                    info = self._probe_image(key, file_size, mtime_ns)
+                if index:
+                    index.store(info)
+            info = replace(info, path=file_path)
+
+            if not info.valid:
+                raise ValueError(info.error)
+
+            # Check file size limit
+            if file_size_mb > self.MAX_IMAGE_SIZE_MB and not info.streamable:
+                print(f"{Colors.YELLOW}⚠️  Warning: {Path(file_path).name} ({file_size_mb:.1f}MB) exceeds size limit ({self.MAX_IMAGE_SIZE_MB}MB), skipping{Colors.ENDC}")
+                return None
+
+            # Check image dimensions
+            if info.width * info.height > self.MAX_PIXELS and not info.streamable:
+                print(f"{Colors.YELLOW}⚠️  Warning: {Path(file_path).name} ({info.width}×{info.height}) exceeds pixel limit, skipping{Colors.ENDC}")
+                return None
+
+            if self._needs_strips(info):
+                print(f"{Colors.CYAN}🧩 {Path(file_path).name} ({info.width}×{info.height}) exceeds the size limits, will be processed in strips{Colors.ENDC}")
+
+            if info.error:
+                raise ValueError(info.error)
+
+            return info
+
+        except Exception as e:
+            print(f"{Colors.RED}❌ Invalid image file {Path(file_path).name}: {str(e)}{Colors.ENDC}")
+            return None
+
+    @staticmethod
+    def _index_key(file_path: str) -> str:
+        return file_path if split_member_path(file_path)[0] else str(Path(file_path).resolve())
+
+    def open_scan_index(self) -> ScanIndex:
+        return ScanIndex(self.output_dir / ScanIndex.FILENAME)
+
+    def scan_input_folder(self) -> List[ImageInfo]:
+        if not is_s3_url(self.input_dir) and not self.input_dir.exists():
+            print(f"{Colors.RED}❌ Input folder not found!{Colors.ENDC}")
+            print(f"Please create the 'input' folder and add your images.")
+            return []
+        return list(self.iter_input_files())
+
+    def iter_input_files(self):
+        """Yield an ImageInfo for each valid input as the scan reaches it.
+
+        Folders are walked recursively (see LocalStorage.walk), so processing
+        can start before a large tree has been listed.
+        """
+        # The same name filter for folders, archives and object stores
+        storage = self.input_storage()
+        skip = () if self.output_store else {os.path.realpath(self.output_dir)}
+        image_files = (storage.path_for(name) for name in storage.walk(skip)
+                       if Path(name).suffix.lower() in self.supported_formats)
+
+        index = self.open_scan_index() if self.use_scan_index else None
+        self.scan_counts = None
+        if index and self.rebuild_scan_index:
+            index.clear()
+
+        heads = None
+        if storage.remote:
+            # Fetch the headers of new or changed objects concurrently; cached ones are not fetched at all
+            image_files = list(image_files)
+            stale = [path for path in image_files
+                     if not index or index.lookup(self._index_key(path), *self._stat_input(path),
+                                                  self.strict_verify, count=False) is None]
+            heads = Prefetcher(stale, self.storage_connections, None if self.strict_verify else PROBE_BYTES)
+            stale = set(stale)
+
+        found = 0
+        try:
+            for file_path in image_files:
+                found += 1
+                head = heads.get(file_path) if heads and file_path in stale else None
+                info = self._validate_image_file(file_path, index, head)
+                if info:
+                    yield info
+        finally:
+            if heads:
+                heads.close()
+            if index:
+                index.close()
+
+        # Reported with the summary: a streamed scan ends while the workers are still busy
+        if index and found:
+            self.scan_counts = (index.hits, index.misses)
+
+    def display_found_images(self, image_files):
+        if not image_files:
+            print(f"{Colors.RED}❌ No supported image files found in the input folder!{Colors.ENDC}")
+            print(f"Supported formats: {', '.join(self.supported_formats)}")
+            return False
 
+        print(f"{Colors.GREEN}{Colors.BOLD}📁 Found {len(image_files)} image(s) in input folder:{Colors.ENDC}\n")
+
+        for i, item in enumerate(image_files, 1):
+            try:
+                info = self._as_image_info(item)
+                file_name = Path(info.path).name
+                file_size = info.file_size / (1024 * 1024)  # MB
+                print(f"  {Colors.CYAN}{i:2d}.{Colors.ENDC} {file_name}")
+                if info.width:
+                    print(f"      📐 {info.width}x{info.height} pixels | 💾 {file_size:.2f} MB")
+                else:
+                    print(f"      💾 {file_size:.2f} MB")
+            except Exception as e:
+                print(f"  {Colors.RED}{i:2d}.{Colors.ENDC} {Path(item).name} (Error: {str(e)})")
+
+        return True
+
+    def confirm_processing(self):
+        print(f"\n{Colors.YELLOW}{Colors.BOLD}⚠️  Are these the correct images to compress?{Colors.ENDC}")
         while True:
-            choice = input(f"\n{Colors.BOLD}Enter your choice (1-4, or press Enter for recommended):{Colors.ENDC} ").strip()
-            if choice == '' or choice == '1':
-                return None, "Original Format"
-            elif choice == '2':
-                return '.jpg', "JPEG"
-            elif choice == '3':
-                return '.png', "PNG"
-            elif choice == '4':
-                return '.webp', "WebP"
+            response = input(f"Continue with compression? (y/n): ").strip().lower()
+            if response in ['y', 'yes']:
+                return True
+            elif response in ['n', 'no']:
+                return False
+            print(f"{Colors.RED}Please enter 'y' or 'n'.{Colors.ENDC}")
+
+    def get_output_filename(self, input_path, output_ext=None, suffix="-compressed", reserved=None):
+        """Pick the output path for input_path, prompting on conflicts.
+
+        ``reserved`` holds output paths already claimed by earlier files of the
+        same batch; they are treated as conflicts just like files on disk.
+        """
+        reserved = reserved if reserved is not None else ()
+
+        def is_taken(path):
+            # An output store is written from scratch, so only this batch can collide
+            return (path.exists() and not self.output_store and path not in self.reclaimed_outputs) or path in reserved
+
+        input_file = Path(input_path)
+        name_without_ext = input_file.stem
+        extension = output_ext if output_ext else input_file.suffix
+        folder = self.output_dir / self._relative_folder(input_path)
+
+        # Handle no suffix mode (keep original name)
+        if suffix == "":
+            # Keep original filename, save to output directory
+            output_name = f"{name_without_ext}{extension}"
+            output_path = folder / output_name
+
+            # Check if file already exists in output directory
+            if is_taken(output_path):
+                choice = self._resolve_conflict(f"File '{output_name}' already exists in output directory.")
+                if choice == 'replace':
+                    return output_path
+                elif choice == 'skip':
+                    return None
+                # Add numbered suffix for conflict resolution
+                counter = 2
+                while True:
+                    output_name = f"{name_without_ext}-{counter}{extension}"
+                    output_path = folder / output_name
+                    if not is_taken(output_path):
+                        return output_path
+                    counter += 1
+
+            return output_path
+
+        # Normal suffix mode
+        counter = 0
+        while True:
+            if counter == 0:
+                output_name = f"{name_without_ext}{suffix}{extension}"
             else:
-                print(f"{Colors.RED}Invalid choice. Please select 1, 2, 3, 4, or press Enter for recommended.{Colors.ENDC}")
+                output_name = f"{name_without_ext}{suffix}-{counter + 1}{extension}"
 
-    def get_processing_mode(self):
-        print(f"\n{Colors.BLUE}{Colors.BOLD}⚙️  Processing Mode Selection{Colors.ENDC}\n")
+            output_path = folder / output_name
 
-        print("Choose processing mode:")
-        print(f"  {Colors.GREEN}1.{Colors.ENDC} Compress + Convert (compress quality, then convert format)")
-        print(f"  {Colors.YELLOW}2.{Colors.ENDC} Convert + Compress (convert format first, then compress quality)")
-        print(f"  {Colors.CYAN}3.{Colors.ENDC} Compress Only      (reduce quality, keep original format)")
-        print(f"  {Colors.BLUE}4.{Colors.ENDC} Convert Only       (change format, keep original quality) {Colors.BOLD}[RECOMMENDED]{Colors.ENDC}")
+            if not is_taken(output_path):
+                return output_path
+
+            # File exists, ask user (or apply the configured policy)
+            choice = self._resolve_conflict(f"File '{output_name}' already exists.")
+            if choice == 'replace':
+                return output_path
+            elif choice == 'skip':
+                return None
+            counter += 1
+
+    def _relative_folder(self, input_path) -> Path:
+        """Subfolder of the input an input sits in, mirrored under the output folder"""
+        location, member = split_member_path(input_path)
+        if location is not None:
+            return Path(member).parent
+        folder = os.path.relpath(os.path.dirname(input_path), self.input_dir)
+        return Path() if folder.startswith('..') else Path(folder)
 
+    def _resolve_conflict(self, message) -> str:
+        """Return 'replace', 'skip' or 'rename' for an existing output file"""
+        if self.conflict_policy != "ask":
+            return self.conflict_policy
+
+        print(f"\n{Colors.YELLOW}⚠️  {message}{Colors.ENDC}")
         while True:
-            choice = input(f"\n{Colors.BOLD}Enter your choice (1-4, or press Enter for recommended):{Colors.ENDC} ").strip()
-            if choice == '' or choice == '4':
-                return "convert_only", "Convert Only"
-            elif choice == '1':
-                return "compress_convert", "Compress + Convert"
-            elif choice == '2':
-                return "convert_compress", "Convert + Compress"
-            elif choice == '3':
-                return "compress_only", "Compress Only"
+            choice = input("Choose: (r)eplace, (s)kip, or (n)ew name? ").strip().lower()
+            if choice in ['r', 'replace']:
+                return 'replace'
+            elif choice in ['s', 'skip']:
+                return 'skip'
+            elif choice in ['n', 'new', 'new name']:
+                return 'rename'
+            print(f"{Colors.RED}Please enter 'r', 's', or 'n'.{Colors.ENDC}")
+
+    def compress_image(self, input_path, output_path, quality, mode="compress_convert"):
+        try:
+            self._compress_image(input_path, output_path, quality, mode)
+            return True
+        except Exception as e:
+            print(f"{Colors.RED}❌ Error compressing {Path(input_path).name}: {str(e)}{Colors.ENDC}")
+            return False
+
+    def _compress_image(self, input_path, output_path, quality, mode="compress_convert"):
+        """Decode, process and save a single image; raises on failure"""
+        output_path = Path(output_path)
+        with open_image(input_path) as img:
+            # Determine target format from output path extension
+            output_ext = self._target_ext(input_path, output_path, mode)
+            data, search = self._encode_frame(img, Path(input_path).suffix.lower(), output_ext, quality, mode,
+                                              source=lambda: read_member(input_path))
+        self._write_output(data, output_path)
+        return search
+
+    def compress_bytes(self, data: bytes, quality, mode="compress_convert",
+                       output_ext: Optional[str] = None) -> Tuple[bytes, str, Optional[dict]]:
+        """In-memory counterpart of _compress_image.
+
+        Returns the encoded bytes, their extension and the target-size search
+        outcome. ``output_ext`` None keeps the input format. Raises ValueError
+        for unsupported or oversized images.
+        """
+        with Image.open(io.BytesIO(data)) as img:
+            input_ext = FORMAT_EXTENSIONS.get(img.format)
+            if input_ext is None:
+                raise ValueError(f"Unsupported image format: {img.format}")
+            if img.width * img.height > self.MAX_PIXELS:
+                raise ValueError(f"Image ({img.width}×{img.height}) exceeds the pixel limit")
+            if mode == "compress_only" or not output_ext:
+                output_ext = input_ext
+            encoded, search = self._encode_frame(img, input_ext, output_ext, quality, mode, source=lambda: data)
+        return encoded, output_ext, search
+
+    def _encode_frame(self, img, input_ext, output_ext, quality, mode, source=None) -> Tuple[bytes, Optional[dict]]:
+        """Decode, orient, convert and encode an opened image into memory.
+
+        ``source`` returns the input's bytes. With it and never_larger, an
+        output in the input's own format that is not smaller than the input
+        is replaced by the input (see _keep_source), and a JPEG already at
+        or below the requested quality is kept without decoding it.
+        """
+        keep = source is not None and self.never_larger and self._can_keep_source(img, input_ext, output_ext)
+        searching = (self.target_size or self.min_ssim) and mode != "convert_only"
+        if keep and img.format == 'JPEG' and not searching:
+            estimate = estimate_jpeg_quality(img)
+            if estimate is not None and estimate <= (quality or 95):
+                kept = self._keep_source(source(), output_ext, f"source quality ~{estimate} ≤ {quality or 95}, not decoded")
+                if kept is not None:
+                    return kept, None
+
+        animated = getattr(img, 'is_animated', False)
+        if animated and normalize_ext(output_ext) in ANIMATED_OUTPUT_FORMATS:
+            # Quality searches apply to stills only
+            data, search = self._encode_animation(img, input_ext, normalize_ext(output_ext), quality, mode), None
+        else:
+            if animated:
+                self.plans_used.add(f"{img.n_frames} frames → {output_ext}: first frame only")
+            img = self._decode_frame(img)
+            img = self._apply_mode(img, input_ext, output_ext, quality, mode)
+
+            if self.target_size and mode != "convert_only":
+                # Search in memory and keep only the winning encode
+                data, search = self._search_target_size(img, output_ext, quality)
+            elif self.min_ssim and mode != "convert_only":
+                data, search = self._search_min_ssim(img, output_ext, quality)
             else:
-                print(f"{Colors.RED}Invalid choice. Please select 1, 2, 3, 4, or press Enter for recommended.{Colors.ENDC}")
+                data, search = self._encode_image(img, output_ext, quality), None
+
+        if keep:
+            original = source()
+            kept = len(data) >= len(original) and self._keep_source(original, output_ext,
+                                                                     f"re-encode was {format_size(len(data))}")
+            if kept:
+                data = kept
+                if search:
+                    # The source is identical to itself and no larger than any encode tried
+                    search = dict(search, met=bool(search.get('metric')) or len(data) <= self.target_size)
+        return data, search
+
+    def _encode_animation(self, img, input_ext, output_ext, quality, mode) -> bytes:
+        """Re-encode every frame of an animation, keeping durations and the loop count.
+
+        Frames are decoded one at a time and converted like a still (see
+        _apply_mode). Encodes run on up to encode_threads threads; only the
+        frames waiting for them plus the previous and next frame (to find
+        the changed area) are held in memory, never the whole animation.
+        """
+        timer = self.timer
+        params = ENCODER_PRESETS[self.encoder_preset][output_ext]
+        transparent = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+        size = self._fit_size(*img.size)
+        loop = img.info.get('loop')
+        if output_ext == '.gif':
+            writer = GifAnimationWriter(size, loop)
+        else:
+            writer = WebPAnimationWriter(size, loop)
+
+        def frames():
+            for index in range(img.n_frames):
+                with timer.stage('decode'):
+                    img.seek(index)
+                    frame = img.convert('RGBA' if transparent else 'RGB')
+                timer.count('decoded', frame.width * frame.height * len(frame.getbands()))
+                if frame.size != size:
+                    with timer.stage('resize'):
+                        frame = self._resize(frame, size)
+                yield self._apply_mode(frame, input_ext, output_ext, quality, mode), img.info.get('duration', 0)
+
+        def flush(limit):
+            while len(window) > limit:
+                future, box, disposal, duration = window.popleft()
+                with timer.stage('encode'):
+                    writer.add(future.result(), box, disposal, duration)
+
+        threads = max(1, self.encode_threads or 1)
+        window = deque()
+        decoded = frames()
+        current = next(decoded)
+        with ThreadPoolExecutor(threads, thread_name_prefix='frame') as executor:
+            while current:
+                following = next(decoded, None)
+                frame, duration = current
+                box, disposal = writer.place(frame, following and following[0])
+                window.append((executor.submit(writer.encode, frame.crop(box), quality, params),
+                               box, disposal, duration))
+                flush(threads)
+                current = following
+            flush(0)
+
+        data = writer.getvalue()
+        timer.count('encoded', len(data))
+        return data
+
+    def _can_keep_source(self, img, input_ext, output_ext) -> bool:
+        """Whether the source itself is a valid output: same format, upright and no resize"""
+        try:
+            if normalize_ext(input_ext) != normalize_ext(output_ext):
+                return False
+        except ValueError:
+            return False
+        if img.getexif().get(0x0112, 1) != 1:
+            return False  # kept sources lose their EXIF, orientation included
+        return self._fit_size(*img.size) == img.size
+
+    def _keep_source(self, original: bytes, output_ext, reason: str) -> Optional[bytes]:
+        """The source bytes as output, or for JPEG their lossless Huffman rewrite when that is smaller.
+
+        Metadata is stripped first (see strip_metadata); None when that is
+        not possible and the source cannot be kept.
+        """
+        with self.timer.stage('encode'):
+            data = strip_metadata(original)
+        if data is None:
+            return None
+        how = "source copied through" if len(data) == len(original) else "source copied without metadata"
+        if normalize_ext(output_ext) == '.jpg':
+            with self.timer.stage('encode'):
+                optimized = optimize_jpeg_losslessly(data)
+            if optimized and len(optimized) < len(data):
+                data, how = optimized, "lossless Huffman re-optimization"
+        self.kept_source = f"{how} ({reason})"
+        return data
+
+    def _search_target_size(self, img, output_ext, max_quality) -> Tuple[bytes, dict]:
+        """Find the best encode of an already converted frame that fits self.target_size.
+
+        JPEG/WebP bisect the quality; PNG keeps the lossless encode when it
+        fits and otherwise bisects the palette size of a quantized copy.
+        Formats without a size knob are encoded once.
+        """
+        target = self.target_size
+        attempts = 0
+        max_quality = max_quality or 95
+
+        def encode(candidate, quality):
+            nonlocal attempts
+            attempts += 1
+            return self._encode_image(candidate, output_ext, quality)
+
+        if output_ext in ('.jpg', '.jpeg', '.webp'):
+            param, low, high = 'quality', 1, max_quality
+            make = lambda value: encode(img, value)
+        elif output_ext == '.png':
+            param, low, high = 'colors', 2, 256
+            source = img if img.mode in ('RGB', 'RGBA', 'L') else img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+            method = Image.Quantize.FASTOCTREE if source.mode == 'RGBA' else Image.Quantize.MEDIANCUT
+            make = lambda value: encode(source.quantize(value, method=method), None)
+        else:
+            data = encode(img, max_quality)
+            return data, {'param': None, 'value': None, 'attempts': attempts, 'met': len(data) <= target}
+
+        # The unconstrained encode wins whenever it already fits
+        best = encode(img, max_quality)
+        best_value = high if param == 'quality' else None
+        if len(best) > target:
+            best, best_value = None, None
+            smallest = None
+            while low <= high:
+                value = (low + high) // 2
+                data = make(value)
+                if len(data) <= target:
+                    best, best_value = data, value
+                    low = value + 1
+                else:
+                    if smallest is None or len(data) < len(smallest[0]):
+                        smallest = (data, value)
+                    high = value - 1
+            if best is None:
+                # Nothing fits: keep the smallest attempt and report the miss
+                best, best_value = smallest
+
+        return best, {'param': param, 'value': best_value, 'attempts': attempts, 'met': len(best) <= target}
+
+    def _search_min_ssim(self, img, output_ext, max_quality) -> Tuple[bytes, Optional[dict]]:
+        """Find the lowest quality whose encode keeps SSIM ≥ self.min_ssim.
+
+        JPEG/WebP bisect the quality up to max_quality, assuming the score
+        rises with quality; if even max_quality misses, that encode is kept
+        and the miss reported. Other formats are encoded once.
+        """
+        max_quality = max_quality or 95
+        if output_ext not in ('.jpg', '.jpeg', '.webp'):
+            return self._encode_image(img, output_ext, max_quality), None
+
+        started = time.perf_counter()
+        reference = SimilarityReference(img)
+        attempts = 0
+
+        def encode(quality):
+            nonlocal attempts
+            attempts += 1
+            data = self._encode_image(img, output_ext, quality)
+            return data, reference.score(data)
+
+        best, best_score = encode(max_quality)
+        best_quality = max_quality
+        if best_score >= self.min_ssim:
+            low, high = 1, max_quality - 1
+            while low <= high:
+                quality = (low + high) // 2
+                data, score = encode(quality)
+                if score >= self.min_ssim:
+                    best, best_score, best_quality = data, score, quality
+                    high = quality - 1
+                else:
+                    low = quality + 1
+
+        return best, {'param': 'quality', 'value': best_quality, 'attempts': attempts,
+                      'met': best_score >= self.min_ssim, 'metric': 'ssim', 'score': round(best_score, 4),
+                      'target': self.min_ssim, 'seconds': round(time.perf_counter() - started, 3)}
+
+    @property
+    def resize_options(self) -> Optional[list]:
+        if not (self.max_width or self.max_height or self.scale):
+            return None
+        return [self.max_width, self.max_height, self.scale]
+
+    def _fit_size(self, width: int, height: int, max_width: Optional[int] = None) -> Tuple[int, int]:
+        """Size of an upright frame after applying the resize options; never larger"""
+        factor = min(1.0, self.scale or 1.0)
+        for bound, extent in ((self.max_width, width), (max_width, width), (self.max_height, height)):
+            if bound:
+                factor = min(factor, bound / extent)
+        if factor >= 1.0:
+            return width, height
+        return max(1, round(width * factor)), max(1, round(height * factor))
+
+    def _decode_frame(self, img, max_width: Optional[int] = None) -> Image.Image:
+        """Load an opened image upright and at its final size.
+
+        When the frame will be shrunk, JPEGs are decoded through Pillow's
+        draft mode, which lets libjpeg scale the DCT by 1/2, 1/4 or 1/8 so
+        the full-resolution bitmap is never built. A high-quality resample
+        then brings the frame to the exact size before any conversion runs.
+        """
+        timer = self.timer
+        # Bounds refer to the upright image, the decoder sees the stored one
+        swapped = img.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+        upright = (img.height, img.width) if swapped else img.size
+        size = self._fit_size(*upright, max_width)
+        if size != upright and img.format == 'JPEG':
+            img.draft(img.mode, (size[1], size[0]) if swapped else size)
+
+        with timer.stage('decode'):
+            img.load()
+        timer.count('decoded', img.width * img.height * len(img.getbands()))
+
+        # Apply EXIF orientation first
+        with timer.stage('exif_transpose'):
+            img = ImageOps.exif_transpose(img)
+
+        if img.size != size:
+            with timer.stage('resize'):
+                img = self._resize(img, size)
+        return img
+
+    @staticmethod
+    def _resize(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+        if img.mode in ('1', 'P'):
+            # Palette images resample with nearest neighbour only
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        return img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+    @property
+    def fan_out(self) -> bool:
+        return bool(self.variant_formats or self.variant_widths)
+
+    def _compress_image_variants(self, input_path, variants: Tuple[Variant, ...], quality, mode) -> List[dict]:
+        """Decode once and write every planned variant of an image.
+
+        Widths are produced largest first, each one downscaled from the
+        previous variant rather than from the original. Conversions run once
+        per (width, format) on the already reduced frame, and the encodes of
+        all variants run in parallel threads (Pillow releases the GIL while
+        encoding).
+        """
+        timer = self.timer
+        input_ext = Path(input_path).suffix.lower()
+        widths = sorted({v.width for v in variants if v.width}, reverse=True)
+        with open_image(input_path) as img:
+            # Without a full-size variant the decode only has to cover the largest width
+            largest = widths[0] if all(v.width for v in variants) else None
+            frame = self._decode_frame(img, largest)
+
+        frames = {None: frame}
+        current = frame
+        for width in widths:
+            if width < current.width:
+                with timer.stage('resize'):
+                    current = self._resize(current, (width, max(1, round(current.height * width / current.width))))
+            frames[width] = current
+
+        converted = {}
+        for variant in variants:
+            key = (variant.width, variant.output_ext)
+            if key not in converted:
+                converted[key] = self._apply_mode(frames[variant.width], input_ext, variant.output_ext, quality, mode)
+
+        def encode(variant):
+            img = converted[(variant.width, variant.output_ext)]
+            if self.target_size and mode != "convert_only":
+                return self._search_target_size(img, variant.output_ext, quality)
+            if self.min_ssim and mode != "convert_only":
+                return self._search_min_ssim(img, variant.output_ext, quality)
+            return self._encode_image(img, variant.output_ext, quality), None
+
+        threads = min(len(variants), self.encode_threads or 1)
+        if threads > 1:
+            with ThreadPoolExecutor(threads) as executor:
+                encoded = list(executor.map(encode, variants))
+        else:
+            encoded = [encode(variant) for variant in variants]
+
+        outputs = []
+        for variant, (data, search) in zip(variants, encoded):
+            self._write_output(data, variant.output_path)
+            outputs.append({'path': str(variant.output_path), 'format': variant.output_ext, 'width': variant.width,
+                            'size': len(data), 'search': search})
+        return outputs
+
+    def _target_ext(self, input_path, output_path, mode) -> str:
+        if mode == "compress_only":
+            return Path(input_path).suffix.lower()  # Use original format
+        return Path(output_path).suffix.lower()
+
+    def _apply_mode(self, img, input_ext, output_ext, quality, mode):
+        """Run the conversion steps of a processing mode on a decoded image"""
+        plan = plan_conversion(img.mode, 'transparency' in img.info, input_ext, output_ext, mode)
+        self.plans_used.add(str(plan))
+        with self.timer.stage('convert'):
+            return plan.apply(img)
+
+    def _needs_strips(self, info: ImageInfo) -> bool:
+        """Whether an image is too big for a full-frame decode and can be striped instead"""
+        too_big = (info.width * info.height > self.MAX_PIXELS
+                   or info.file_size > self.MAX_IMAGE_SIZE_MB * 1024 * 1024)
+        return too_big and info.streamable
+
+    def _compress_image_in_strips(self, input_path, output_path, quality, mode="compress_convert"):
+        """Process an oversized image band by band so memory is bounded by the strip size.
+
+        PNG and BMP outputs are encoded incrementally; other formats are
+        assembled into one output frame first (see STREAMING_OUTPUT_FORMATS).
+        """
+        output_ext = self._target_ext(input_path, output_path, mode)
+        input_ext = Path(input_path).suffix.lower()
+        reader = StripReader(input_path)
+        size = (reader.width, reader.height)
+
+        if output_ext == '.png':
+            writer = PngStripWriter(output_path, size, ENCODER_PRESETS[self.encoder_preset]['.png']['compress_level'])
+        elif output_ext == '.bmp':
+            writer = BmpStripWriter(output_path, size)
+        else:
+            writer = FullFrameWriter(self, output_path, size, output_ext, quality)
+
+        timer = self.timer
+        try:
+            for top in range(0, reader.height, reader.rows_per_strip):
+                with timer.stage('decode'):
+                    band = reader.read(top, min(top + reader.rows_per_strip, reader.height))
+                band = self._apply_mode(band, input_ext, output_ext, quality, mode)
+                with timer.stage('encode'):
+                    writer.write(band)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+
+        if self.never_larger and normalize_ext(input_ext) == normalize_ext(output_ext):
+            output_size = os.path.getsize(output_path)
+            if output_size >= os.path.getsize(input_path) and self._source_is_clean(input_path):
+                # Copied in chunks: the source is too big to hold in memory
+                with open(input_path, 'rb') as source, atomic_write(output_path) as file:
+                    shutil.copyfileobj(source, file, 1024 * 1024)
+                self.kept_source = f"source copied through (re-encode was {format_size(output_size)})"
+
+    @staticmethod
+    def _source_is_clean(input_path) -> bool:
+        """Whether a strip-processed source (BMP or uncompressed TIFF) holds no private metadata"""
+        with Image.open(input_path) as img:
+            return img.format == 'BMP' or not TIFF_METADATA_TAGS & set(getattr(img, 'tag_v2', {}))
+
+    def _convert_format_only(self, img, target_ext):
+        """Convert image format without quality loss"""
+        return plan_conversion(img.mode, 'transparency' in img.info, target_ext, target_ext, "convert_only").apply(img)
+
+    def _compress_quality_only(self, img: Image.Image, format_ext: str, quality: int) -> Image.Image:
+        """Apply quality-based processing without changing format"""
+        format_ext = format_ext.lower()
+        return plan_conversion(img.mode, 'transparency' in img.info, format_ext, format_ext, "compress_only").apply(img)
+
+    def _save_image(self, img, output_path, output_ext, quality):
+        """Save image with appropriate format settings"""
+        self._write_output(self._encode_image(img, output_ext, quality), output_path)
+
+    def _encode_image(self, img, output_ext, quality) -> bytes:
+        """Encode into memory with the format settings used for saving"""
+        timer = self.timer
+        params = ENCODER_PRESETS[self.encoder_preset]
+
+        # Encode in memory first so encoding and disk writes can be told apart
+        buffer = io.BytesIO()
+        with timer.stage('encode'):
+            if output_ext in ['.jpg', '.jpeg']:
+                img.save(buffer, 'JPEG', quality=quality or 95, **params['.jpg'])
+            elif output_ext == '.png':
+                img.save(buffer, 'PNG', **params['.png'])
+            elif output_ext == '.webp':
+                img.save(buffer, 'WebP', quality=quality or 95, lossless=False, **params['.webp'])
+            elif output_ext == '.bmp':
+                img.save(buffer, 'BMP')
+            elif output_ext in ['.tiff', '.tif']:
+                # libtiff refuses a quality setting with any compression but JPEG
+                quality_param = {} if params['.tiff'].get('compression') else {'quality': quality or 95}
+                img.save(buffer, 'TIFF', **quality_param, **params['.tiff'])
+            elif output_ext == '.gif':
+                img.save(buffer, 'GIF', **params['.gif'])
+            else:
+                # Fallback
+                img.save(buffer, Image.registered_extensions()[output_ext], optimize=True)
+
+        data = buffer.getvalue()
+        timer.count('encoded', len(data))
+        return data
+
+    def _write_output(self, data: bytes, output_path):
+        if self.output_store:
+            # The parent process hands it to the output store (see process_images)
+            self.captured.append((str(output_path), data))
+            return
+        with self.timer.stage('write'):
+            with atomic_write(output_path) as f:
+                f.write(data)
+
+    def open_progress(self) -> ProgressEvents:
+        sinks = []
+        mode = self.progress_mode
+        if mode == "auto":
+            # The status line only makes sense on a terminal; logs keep each file's quality, SSIM and timing
+            mode = "bar" if sys.stdout.isatty() else "files"
+        if mode == "files":
+            sinks.append(FileLinesSink(self))
+        elif mode == "bar":
+            sinks.append(TerminalProgress())
+        if self.events_path:
+            sinks.append(JsonlSink(self.events_path))
+        return ProgressEvents(sinks)
+
+    def print_progress_bar(self, current, total, width=50):
+        progress = current / total
+        filled_width = int(width * progress)
+        bar = '█' * filled_width + '░' * (width - filled_width)
+        percentage = progress * 100
+        print(f"\r{Colors.GREEN}[{bar}] {percentage:5.1f}% ({current}/{total}){Colors.ENDC}", end='', flush=True)
+
+    def _plan_jobs(self, image_files, output_ext, suffix, manifest: Optional[BuildManifest] = None,
+                   settings: Optional[dict] = None, claimed: Optional[set] = None) -> Tuple[List[Tuple[ImageInfo, Path]], List[FileResult]]:
+        """Assign an output path to every input before any processing starts.
 
-    def get_output_suffix(self, default_suffix: str):
-        print(f"\n{Colors.BLUE}{Colors.BOLD}📝 Output Filename Settings{Colors.ENDC}\n")
+        Returns the (image_info, output_path) jobs to run and the results for
+        inputs that were skipped while resolving name conflicts or, with a
+        manifest, found to be up to date already. ``claimed`` carries the
+        outputs of earlier chunks of a streamed batch (see _stream_jobs).
+        """
+        planned: Dict[Path, ImageInfo] = {}
+        skipped: List[FileResult] = []
+        claimed = set() if claimed is None else claimed
 
-        print("Choose output filename format:")
-        print(f"  {Colors.GREEN}1.{Colors.ENDC} Add suffix to filename {Colors.BOLD}[RECOMMENDED]{Colors.ENDC}")
-        print(f"  {Colors.YELLOW}2.{Colors.ENDC} Keep original filename (no suffix)")
+        if self.fan_out:
+            return self._plan_variant_jobs(image_files, output_ext, suffix, claimed)
 
-        while True:
-            choice = input(f"\n{Colors.BOLD}Enter your choice (1-2, or press Enter for recommended):{Colors.ENDC} ").strip()
-            if choice == '' or choice == '1':
-                # Prompt for custom suffix (default depends on mode)
-                print(f"\n{Colors.CYAN}Enter suffix for output files:{Colors.ENDC}")
-                print(f"Example: '{default_suffix}' will rename 'photo.jpg' to 'photo{default_suffix}.jpg'")
-                suffix = input(f"{Colors.BOLD}Suffix (press Enter for '{default_suffix}'):{Colors.ENDC} ").strip()
-                if not suffix:
-                    suffix = default_suffix
-                elif not suffix.startswith('-') and not suffix.startswith('_'):
-                    # Add separator if user omitted it
-                    suffix = f"-{suffix}"
-                return suffix
-            elif choice == '2':
-                return ""  # Empty suffix means keep original name
+        for item in image_files:
+            info = self._as_image_info(item)
+            entry = None
+            if manifest:
+                up_to_date, entry = manifest.check(info, settings)
+                if up_to_date:
+                    skipped.append(FileResult(info.path, str(self.output_dir / entry['output']), "unchanged",
+                                              info.file_size, entry['output_size'], content_hash=info.content_hash))
+                    continue
+
+            previous = entry and self.output_dir / entry['output']
+            if (previous and previous not in claimed and entry['settings']['suffix'] == suffix
+                    and entry['settings']['output_ext'] == output_ext):
+                # Stale output from an earlier run: overwrite it in place
+                output_path = previous
             else:
-                print(f"{Colors.RED}Invalid choice. Please select 1, 2, or press Enter for recommended.{Colors.ENDC}")
+                output_path = self.get_output_filename(info.path, output_ext, suffix, reserved=claimed)
+            if output_path is None:
+                print(f"{Colors.YELLOW}⏭️  Skipped: {Path(info.path).name}{Colors.ENDC}")
+                skipped.append(FileResult(info.path, status="skipped"))
+                continue
+            if output_path in claimed and output_path not in planned:
+                # Claimed by an earlier chunk whose job may already be running
+                print(f"{Colors.YELLOW}⏭️  Skipped: {Path(info.path).name} (its output is taken earlier in the batch){Colors.ENDC}")
+                skipped.append(FileResult(info.path, status="skipped"))
+                continue
 
-    def get_compression_settings(self):
-        print(f"{Colors.BLUE}{Colors.BOLD}📋 Compression Configuration{Colors.ENDC}\n")
+            # Replacing an output claimed earlier in this batch drops the earlier job
+            previous = planned.pop(output_path, None)
+            if previous is not None:
+                print(f"{Colors.YELLOW}⏭️  Skipped: {Path(previous.path).name} (replaced by {Path(info.path).name}){Colors.ENDC}")
+                skipped.append(FileResult(previous.path, status="skipped"))
+            planned[output_path] = info
+            claimed.add(output_path)
 
-        # Processing mode selection
-        mode, mode_name = self.get_processing_mode()
+        jobs = [(info, output_path) for output_path, info in planned.items()]
+        return jobs, skipped
 
-        quality, quality_name = None, None
-        output_ext, format_name = None, None
+    def _plan_variant_jobs(self, image_files, output_ext, suffix,
+                           claimed: set) -> Tuple[List[Tuple[ImageInfo, tuple]], List[FileResult]]:
+        """Fan-out counterpart of _plan_jobs: each job carries a tuple of Variants.
 
-        # Get compression settings if needed
-        if mode in ["compress_convert", "convert_compress", "compress_only"]:
-            print(f"\n{Colors.BLUE}{Colors.BOLD}🎯 Quality Settings{Colors.ENDC}\n")
-            print("Select compression quality:")
-            print(f"  {Colors.GREEN}1.{Colors.ENDC} High Quality   (90% quality, ~30% size reduction)")
-            print(f"  {Colors.YELLOW}2.{Colors.ENDC} Medium Quality (80% quality, ~45% size reduction) {Colors.BOLD}[RECOMMENDED]{Colors.ENDC}")
-            print(f"  {Colors.RED}3.{Colors.ENDC} Low Quality    (60% quality, ~65% size reduction)")
-            print(f"  {Colors.CYAN}4.{Colors.ENDC} Custom Quality (specify your own percentage)")
+        Width variants extend the suffix, e.g. ``photo-compressed-800w.webp``.
+        """
+        jobs, skipped = [], []
+        for item in image_files:
+            info = self._as_image_info(item)
+            variants = []
+            for width in self.variant_widths or (None,):
+                variant_suffix = f"{suffix}-{width}w" if width else suffix
+                for ext in self.variant_formats or (output_ext,):
+                    output_path = self.get_output_filename(info.path, ext, variant_suffix, reserved=claimed)
+                    if output_path is None:
+                        print(f"{Colors.YELLOW}⏭️  Skipped: {Path(info.path).name} → {ext or 'original'}"
+                              f"{f' @ {width}px' if width else ''}{Colors.ENDC}")
+                        continue
+                    claimed.add(output_path)
+                    variants.append(Variant(output_path, output_path.suffix.lower(), width))
+            if variants:
+                jobs.append((info, tuple(variants)))
+            else:
+                skipped.append(FileResult(info.path, status="skipped"))
+        return jobs, skipped
 
-            while True:
-                choice = input(f"\n{Colors.BOLD}Enter your choice (1-4, or press Enter for recommended):{Colors.ENDC} ").strip()
-                if choice == '' or choice == '2':
-                    quality, quality_name = 80, "Medium (Recommended)"
-                    break
-                elif choice == '1':
-                    quality, quality_name = 90, "High"
-                    break
-                elif choice == '3':
-                    quality, quality_name = 60, "Low"
-                    break
-                elif choice == '4':
-                    while True:
-                        try:
-                            custom_quality = int(input(f"Enter quality percentage (1-100): "))
-                            if 1 <= custom_quality <= 100:
-                                quality, quality_name = custom_quality, "Custom"
-                                break
-                            print(f"{Colors.RED}Please enter a value between 1 and 100.{Colors.ENDC}")
-                        except ValueError:
-                            print(f"{Colors.RED}Please enter a valid number.{Colors.ENDC}")
-                    break
-                else:
-                    print(f"{Colors.RED}Invalid choice. Please select 1, 2, 3, 4, or press Enter for recommended.{Colors.ENDC}")
+    def _prepare_jobs(self, jobs, mode, journal: Optional[JobJournal], infos: Dict[str, ImageInfo]):
+        """Register planned jobs and warn about very large images that cannot be written in strips"""
+        for info, output_path in jobs:
+            infos[info.path] = info
+        if journal:
+            journal.plan([variant.output_path for _, variants in jobs for variant in variants] if self.fan_out
+                         else [output_path for _, output_path in jobs])
 
-        # Get format settings if needed
-        if mode in ["compress_convert", "convert_compress", "convert_only"]:
-            output_ext, format_name = self.get_output_format()
+        for info, output_path in jobs:
+            if isinstance(output_path, tuple):
+                continue  # fan-out jobs never stream (see _process_file)
+            target_ext = self._target_ext(info.path, output_path, mode)
+            if self._needs_strips(info) and target_ext not in STREAMING_OUTPUT_FORMATS:
+                print(f"{Colors.YELLOW}⚠️  {Path(info.path).name}: {target_ext.lstrip('.').upper()} output needs a full-frame "
+                      f"encode ({info.width}×{info.height}); only PNG and BMP are written strip by strip{Colors.ENDC}")
 
-        # Determine default suffix based on processing mode
-        if mode == "convert_only":
-            default_suffix_val = "-converted"
-        else:
-            default_suffix_val = "-compressed"
-        # Get suffix settings (default varies by mode)
-        suffix = self.get_output_suffix(default_suffix_val)
+    def _stream_jobs(self, image_files, output_ext, suffix, mode, manifest: Optional[BuildManifest], settings: dict,
+                     journal: Optional[JobJournal], infos: Dict[str, ImageInfo], skipped: List[FileResult],
+                     chunk_size: int = 16):
+        """Plan a lazily scanned batch chunk by chunk, yielding jobs while the scan goes on.
 
-        return quality, quality_name, output_ext, format_name, mode, mode_name, suffix
+        Unlike a planned-up-front batch, an output name claimed by an earlier
+        chunk is never taken over by a later input, even with the replace policy.
+        """
+        claimed = set()
+        image_files = iter(image_files)
+        while True:
+            chunk = list(itertools.islice(image_files, chunk_size))
+            if not chunk:
+                return
+            jobs, chunk_skipped = self._plan_jobs(chunk, output_ext, suffix, manifest, settings, claimed)
+            skipped.extend(chunk_skipped)
+            self._prepare_jobs(jobs, mode, journal, infos)
+            yield from jobs
 
-    def _validate_image_file(self, file_path: str) -> bool:
-        """Validate image file for safety and size constraints"""
-        try:
-            file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    @staticmethod
+    def _content_hash(path, length: Optional[int] = None) -> str:
+        if length is None and split_member_path(path)[0] is None:
+            return hash_file(path)  # the manifest hash, streamed
+        return hashlib.blake2b(read_member(path, length), digest_size=16).hexdigest()
 
-            # Check file size limit
-            if file_size_mb > self.MAX_IMAGE_SIZE_MB:
-                print(f"{Colors.YELLOW}⚠️  Warning: {Path(file_path).name} ({file_size_mb:.1f}MB) exceeds size limit ({self.MAX_IMAGE_SIZE_MB}MB), skipping{Colors.ENDC}")
-                return False
+    @staticmethod
+    def _perceptual_hash(path) -> Tuple[int, int, bytes]:
+        """(EXIF orientation, difference hash, 8×8 RGB thumbnail) of an image"""
+        size = PERCEPTUAL_HASH_SIZE
+        with open_image(path) as img:
+            orientation = img.getexif().get(0x0112, 1)
+            img.draft('RGB', (size * 4, size * 4))  # JPEGs decode at up to 1/8 scale
+            small = img.convert('RGB').resize((size + 1, size), Image.BILINEAR)
+        pixels = small.convert('L').tobytes()
+        bits = 0
+        for row in range(size):
+            for col in range(size):
+                offset = row * (size + 1) + col
+                bits = bits << 1 | (pixels[offset] < pixels[offset + 1])
+        return orientation, bits, small.resize((8, 8), Image.BOX).tobytes()
 
-            # Try to open and validate the image
-            with Image.open(file_path) as img:
-                # Check image dimensions
-                width, height = img.size
-                total_pixels = width * height
+    def find_duplicates(self, infos: List[ImageInfo]) -> Dict[str, str]:
+        """Map each duplicate input to the input whose output it can reuse.
 
-                if total_pixels > self.MAX_PIXELS:
-                    print(f"{Colors.YELLOW}⚠️  Warning: {Path(file_path).name} ({width}×{height}) exceeds pixel limit, skipping{Colors.ENDC}")
-                    return False
+        Exact duplicates are bucketed by size, then by a hash of their first
+        64 KB; only what still collides is hashed in full. That hash is kept
+        on the ImageInfo, where incremental runs reuse it. With
+        dedupe_distance set, the remaining images that share dimensions,
+        format, mode and EXIF orientation are compared by difference hash
+        and a small colour thumbnail; the largest file of each cluster is
+        the one encoded.
+        """
+        duplicates: Dict[str, str] = {}
+        by_size: Dict[int, List[ImageInfo]] = {}
+        for info in infos:
+            by_size.setdefault(info.file_size, []).append(info)
+        for bucket in by_size.values():
+            if len(bucket) < 2:
+                continue
+            by_head: Dict[str, List[ImageInfo]] = {}
+            for info in bucket:
+                by_head.setdefault(self._content_hash(info.path, DEDUPE_HEAD_BYTES), []).append(info)
+            for group in by_head.values():
+                if len(group) < 2:
+                    continue
+                first_by_hash: Dict[str, ImageInfo] = {}
+                for info in group:
+                    info.content_hash = info.content_hash or self._content_hash(info.path)
+                    first = first_by_hash.setdefault(info.content_hash, info)
+                    if first is not info:
+                        duplicates[info.path] = first.path
 
-                # Verify image integrity by loading a small portion
-                img.verify()
+        if self.dedupe_distance is not None:
+            by_shape: Dict[tuple, List[ImageInfo]] = {}
+            for info in infos:
+                if info.path not in duplicates:
+                    by_shape.setdefault((info.width, info.height, info.format, info.mode), []).append(info)
+            for bucket in by_shape.values():
+                if len(bucket) < 2:
+                    continue
+                kept = []  # (orientation, hash, thumbnail, path) of the images that will be encoded
+                for info in sorted(bucket, key=lambda i: i.file_size, reverse=True):
+                    try:
+                        orientation, bits, colors = self._perceptual_hash(info.path)
+                    except Exception:
+                        continue  # the real run reports unreadable files
+                    match = next((path for kept_orientation, kept_bits, kept_colors, path in kept
+                                  if kept_orientation == orientation
+                                  and bin(kept_bits ^ bits).count('1') <= self.dedupe_distance
+                                  and max(abs(a - b) for a, b in zip(kept_colors, colors)) <= NEAR_DUPLICATE_COLOR_TOLERANCE),
+                                 None)
+                    if match:
+                        duplicates[info.path] = match
+                    else:
+                        kept.append((orientation, bits, colors, info.path))
+            # Exact copies of a near-duplicate follow it to the image that is encoded
+            for path, original in duplicates.items():
+                while original in duplicates:
+                    original = duplicates[original]
+                duplicates[path] = original
+        return duplicates
 
-            return True
+    def _share_output(self, original: FileResult, info: ImageInfo, output_path) -> FileResult:
+        """Give a duplicate input its own name for the output encoded for ``original``"""
+        variants = output_path if isinstance(output_path, tuple) else None
+        result = FileResult(info.path, str(variants[0].output_path if variants else output_path),
+                            original_size=info.file_size, content_hash=info.content_hash,
+                            duplicate_of=original.input_path)
+        if original.status != "success":
+            result.status, result.error = original.status, f"duplicate of {Path(original.input_path).name}: {original.error}"
+            return result
 
+        if variants:
+            result.variants = [dict(shared, path=str(variant.output_path))
+                               for shared, variant in zip(original.variants, variants)]
+            pairs = [(shared['path'], variant.output_path) for shared, variant in zip(original.variants, variants)]
+        else:
+            pairs = [(original.output_path, output_path)]
+        try:
+            if self.incremental and result.content_hash is None:
+                result.content_hash = hash_file(info.path)  # near-duplicates differ from the original
+            if self.output_store:
+                # Copies of the same bytes under the duplicate's names
+                payload = dict(original.payload or ())
+                result.payload = [(str(target), payload[source]) for source, target in pairs]
+            else:
+                result.linked = all([link_or_copy(source, target) for source, target in pairs])
+            result.output_size, result.search, result.plans = original.output_size, original.search, original.plans
+            result.kept_source = original.kept_source
+            result.status = "success"
         except Exception as e:
-            print(f"{Colors.RED}❌ Invalid image file {Path(file_path).name}: {str(e)}{Colors.ENDC}")
-            return False
+            result.status, result.error = "failed", str(e)
+        return result
 
-    def scan_input_folder(self) -> List[str]:
-        if not self.input_dir.exists():
-            print(f"{Colors.RED}❌ Input folder not found!{Colors.ENDC}")
-            print(f"Please create the 'input' folder and add your images.")
-            return []
+    def _process_file(self, info: ImageInfo, output_path, quality, mode, data: Optional[bytes] = None) -> FileResult:
+        """Process one planned job and describe the outcome without printing.
 
-        image_files = []
-        for ext in self.supported_formats:
-            pattern = str(self.input_dir / f"*{ext}")
-            image_files.extend(glob.glob(pattern, recursive=False))
-            pattern = str(self.input_dir / f"*{ext.upper()}")
-            image_files.extend(glob.glob(pattern, recursive=False))
+        ``data`` holds the input's bytes when the parent prefetched them.
+        """
+        variants = output_path if isinstance(output_path, tuple) else None
+        result = FileResult(info.path, str(variants[0].output_path if variants else output_path))
+        self.timer = StageTimer() if self.instrument else NULL_TIMER
+        self.plans_used = set()
+        self.kept_source = None
+        self.captured = []
+        if data is not None:
+            _preloaded[info.path] = data
+        started, wall_started = time.process_time(), time.perf_counter()
+        profiler = cProfile.Profile() if info.path in self.profile_paths else None
+        if profiler:
+            profiler.enable()
+        try:
+            result.original_size = info.file_size
+            self.timer.count('input', info.file_size)
+            if self.incremental:
+                result.content_hash = info.content_hash or hash_file(info.path)
+            if variants:
+                if self._needs_strips(info):
+                    raise ValueError(f"{info.width}×{info.height} is too large for fan-out")
+                result.variants = self._compress_image_variants(info.path, variants, quality, mode)
+                result.output_size = sum(v['size'] for v in result.variants)
+            elif self._needs_strips(info):
+                if self.resize_options:
+                    raise ValueError(f"{info.width}×{info.height} is processed in strips, which cannot be resized")
+                if self.output_store:
+                    raise ValueError(f"{info.width}×{info.height} is processed in strips, which cannot go into an output store")
+                self._compress_image_in_strips(info.path, output_path, quality, mode)
+                result.output_size = os.path.getsize(output_path)
+            else:
+                result.search = self._compress_image(info.path, output_path, quality, mode)
+                result.output_size = len(self.captured[-1][1]) if self.output_store else os.path.getsize(output_path)
+            result.status = "success"
+        except Exception as e:
+            result.status = "failed"
+            result.error = str(e)
+        finally:
+            if profiler:
+                profiler.disable()
+                name = hashlib.blake2b(info.path.encode(), digest_size=8).hexdigest()
+                profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+            if self.timer.enabled:
+                result.stats = self.timer.as_dict()
+            result.plans = sorted(self.plans_used)
+            result.kept_source = self.kept_source
+            if self.captured:
+                result.payload, self.captured = self.captured, []
+            _preloaded.pop(info.path, None)
+            self.timer = NULL_TIMER
+            result.cpu_seconds = time.process_time() - started
+            result.seconds = time.perf_counter() - wall_started
+        return result
 
-        # Validate all found files
-        validated_files = []
-        for file_path in sorted(list(set(image_files))):
-            if self._validate_image_file(file_path):
-                validated_files.append(file_path)
+    def estimate_job_memory(self, info: ImageInfo, output_ext: str) -> int:
+        """Rough peak RAM in bytes needed to process one image.
 
-        return validated_files
+        Counts the decoded frame, the copy made by exif_transpose and the
+        buffers the conversion plan allocates to flatten alpha or leave
+        palette mode for the target format.
+        """
+        if not info.width:
+            # No header info (plain path from a caller); assume ~10x expansion
+            return JOB_MEMORY_OVERHEAD + info.file_size * 10
 
-    def display_found_images(self, image_files):
-        if not image_files:
-            print(f"{Colors.RED}❌ No supported image files found in the input folder!{Colors.ENDC}")
-            print(f"Supported formats: {', '.join(self.supported_formats)}")
-            return False
+        if self._needs_strips(info):
+            band = min(info.height, max(1, StripReader.STRIP_PIXELS // info.width)) * info.width
+            # Source band, converted band and encoder input
+            estimate = JOB_MEMORY_OVERHEAD + band * 4 * 3
+            if output_ext.lower() not in STREAMING_OUTPUT_FORMATS:
+                estimate += info.width * info.height * 4  # assembled output frame
+            return estimate
 
-        print(f"{Colors.GREEN}{Colors.BOLD}📁 Found {len(image_files)} image(s) in input folder:{Colors.ENDC}\n")
+        pixels = info.width * info.height
+        # Pillow stores L/P/1 in one byte per pixel and every multi-band mode in four
+        source = pixels * (1 if info.mode in ('1', 'L', 'P') else 2 if info.mode in ('I;16', 'I;16B') else 4)
+        estimate = source * 2  # decoded frame + transposed copy
 
-        for i, file_path in enumerate(image_files, 1):
-            file_name = Path(file_path).name
-            try:
-                with Image.open(file_path) as img:
-                    size = img.size
-                    file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
-                print(f"  {Colors.CYAN}{i:2d}.{Colors.ENDC} {file_name}")
-                print(f"      📐 {size[0]}x{size[1]} pixels | 💾 {file_size:.2f} MB")
-            except Exception as e:
-                print(f"  {Colors.RED}{i:2d}.{Colors.ENDC} {file_name} (Error: {str(e)})")
+        output_ext = output_ext.lower()
+        if info.mode in ('RGBA', 'LA', 'PA') and output_ext in ('.jpg', '.jpeg', '.bmp'):
+            # White RGB background; the image itself serves as the paste mask
+            estimate += pixels * 4
+            if info.mode != 'RGBA':
+                estimate += pixels * 4  # the one convert before pasting
+        elif info.mode == 'P' or info.mode not in ('1', 'L', 'RGB', 'RGBA'):
+            estimate += pixels * 4  # convert to RGB/RGBA
 
-        return True
+        return JOB_MEMORY_OVERHEAD + estimate
 
-    def confirm_processing(self):
-        print(f"\n{Colors.YELLOW}{Colors.BOLD}⚠️  Are these the correct images to compress?{Colors.ENDC}")
-        while True:
-            response = input(f"Continue with compression? (y/n): ").strip().lower()
-            if response in ['y', 'yes']:
-                return True
-            elif response in ['n', 'no']:
-                return False
-            print(f"{Colors.RED}Please enter 'y' or 'n'.{Colors.ENDC}")
+    def _auto_tune(self, jobs, quality, mode) -> dict:
+        """Encode a random sample of the batch with every preset and pick one.
 
-    def get_output_filename(self, input_path, output_ext=None, suffix="-compressed"):
-        input_file = Path(input_path)
-        name_without_ext = input_file.stem
-        extension = output_ext if output_ext else input_file.suffix
+        Each sample is decoded and converted once; the preset encodes are
+        timed on that frame and the shared preparation time is added to each.
+        With tune_throughput the smallest preset whose projected images/s
+        (across all workers) meets it wins, otherwise the fastest. Without it
+        the fastest preset whose output is within tune_size_slack of the
+        smallest one wins.
+        """
+        candidates = [(info, output_path) for info, output_path in jobs if not self._needs_strips(info)]
+        sample = random.Random(0).sample(candidates, min(self.tune_samples, len(candidates)))
+        seconds = {name: 0.0 for name in ENCODER_PRESETS}
+        sizes = {name: 0 for name in ENCODER_PRESETS}
+        previous_preset = self.encoder_preset
+        measured = 0
+        try:
+            for info, output_path in sample:
+                output_ext = (output_path[0].output_ext if isinstance(output_path, tuple)
+                              else self._target_ext(info.path, output_path, mode))
+                try:
+                    started = time.perf_counter()
+                    with open_image(info.path) as img:
+                        frame = self._decode_frame(img)
+                    frame = self._apply_mode(frame, Path(info.path).suffix.lower(), output_ext, quality, mode)
+                    prepare = time.perf_counter() - started
+                    timings = {}
+                    for name in ENCODER_PRESETS:
+                        self.encoder_preset = name
+                        started = time.perf_counter()
+                        size = len(self._encode_image(frame, output_ext, quality))
+                        timings[name] = (prepare + time.perf_counter() - started, size)
+                except Exception:
+                    continue  # broken files are reported by the real run
+                for name, (elapsed, size) in timings.items():
+                    seconds[name] += elapsed
+                    sizes[name] += size
+                measured += 1
+        finally:
+            self.encoder_preset = previous_preset
+            self.plans_used = set()
 
-        # Handle no suffix mode (keep original name)
-        if suffix == "":
-            # Keep original filename, save to output directory
-            output_name = f"{name_without_ext}{extension}"
-            output_path = self.output_dir / output_name
+        if not measured:
+            return {'preset': self.encoder_preset, 'samples': 0, 'goal': None, 'candidates': {}}
 
-            # Check if file already exists in output directory
-            if output_path.exists():
-                print(f"\n{Colors.YELLOW}⚠️  File '{output_name}' already exists in output directory.{Colors.ENDC}")
-                while True:
-                    choice = input("Choose: (r)eplace, (s)kip, or (n)ew name? ").strip().lower()
-                    if choice in ['r', 'replace']:
-                        return output_path
-                    elif choice in ['s', 'skip']:
-                        return None
-                    elif choice in ['n', 'new', 'new name']:
-                        # Add numbered suffix for conflict resolution
-                        counter = 2
-                        while True:
-                            output_name = f"{name_without_ext}-{counter}{extension}"
-                            output_path = self.output_dir / output_name
-                            if not output_path.exists():
-                                return output_path
-                            counter += 1
-                    print(f"{Colors.RED}Please enter 'r', 's', or 'n'.{Colors.ENDC}")
+        workers = min(self.workers, len(jobs))
+        stats = {name: {'ms_per_image': seconds[name] / measured * 1000,
+                        'images_per_second': workers * measured / seconds[name] if seconds[name] else float('inf'),
+                        'bytes': sizes[name]} for name in ENCODER_PRESETS}
+        by_speed = sorted(ENCODER_PRESETS, key=lambda name: seconds[name])
+        if self.tune_throughput:
+            goal = f"≥ {self.tune_throughput:g} img/s"
+            fast_enough = [name for name in by_speed if stats[name]['images_per_second'] >= self.tune_throughput]
+            chosen = min(fast_enough, key=lambda name: sizes[name]) if fast_enough else by_speed[0]
+        else:
+            goal = f"within {self.tune_size_slack:.0%} of the smallest output"
+            limit = min(sizes.values()) * (1 + self.tune_size_slack)
+            chosen = next(name for name in by_speed if sizes[name] <= limit)
+        return {'preset': chosen, 'samples': measured, 'goal': goal, 'candidates': stats}
 
-            return output_path
+    def _estimate_job(self, info: ImageInfo, output_path) -> int:
+        if not isinstance(output_path, tuple):
+            return self.estimate_job_memory(info, Path(output_path).suffix)
+        # Fan-out: the worst single conversion plus one converted frame per format and the encoded variants
+        base = max(self.estimate_job_memory(info, variant.output_ext) for variant in output_path)
+        formats = len({variant.output_ext for variant in output_path})
+        return base + (info.width or 0) * (info.height or 0) * 4 * formats
 
-        # Normal suffix mode
-        counter = 0
-        while True:
-            if counter == 0:
-                output_name = f"{name_without_ext}{suffix}{extension}"
-            else:
-                output_name = f"{name_without_ext}{suffix}-{counter + 1}{extension}"
+    def _prefetcher(self, jobs, pooled: bool = False) -> Optional[Prefetcher]:
+        """Read remote or sequential inputs ahead in job order so reading overlaps encoding.
 
-            output_path = self.output_dir / output_name
+        Pool workers fetch remote inputs themselves, by key; only a sequential
+        store, which the workers cannot read, is handed to them as bytes.
+        """
+        storage = self.input_storage() if self.input_store else None
+        if storage and storage.sequential:
+            return Prefetcher([job[0].path for job in jobs], self.workers * 2, threads=1)
+        if not storage or not storage.remote or pooled:
+            return None
+        return Prefetcher([job[0].path for job in jobs], self.storage_connections)
 
-            if not output_path.exists():
-                return output_path
+    def _worker_input(self) -> Optional[dict]:
+        """input_storage() arguments for the pool workers' own input store"""
+        if not self.input_store or self.input_storage().sequential:
+            return None
+        # Workers reuse the listing of a plain tar and the S3 endpoint and connection settings
+        return {'location': self.input_store, 'connections': self.storage_connections,
+                'endpoint_url': self.s3_endpoint, 'listing': getattr(self.input_storage(), 'listing', None)}
 
-            # File exists, ask user
-            print(f"\n{Colors.YELLOW}⚠️  File '{output_name}' already exists.{Colors.ENDC}")
-            while True:
-                choice = input("Choose: (r)eplace, (s)kip, or (n)ew name? ").strip().lower()
-                if choice in ['r', 'replace']:
-                    return output_path
-                elif choice in ['s', 'skip']:
-                    return None
-                elif choice in ['n', 'new', 'new name']:
-                    counter += 1
-                    break
-                print(f"{Colors.RED}Please enter 'r', 's', or 'n'.{Colors.ENDC}")
+    def _run_jobs(self, jobs, quality, mode):
+        """Yield a FileResult for each job as soon as it finishes.
+
+        ``jobs`` may also be an iterator (see _stream_jobs); it is then read a
+        few jobs ahead of the workers in scan order instead of largest first.
+        """
+        streamed = not isinstance(jobs, list)
+        workers = self.workers if streamed else min(self.workers, len(jobs))
+        if workers <= 1:
+            prefetcher = None if streamed else self._prefetcher(jobs)
+            try:
+                for info, output_path in jobs:
+                    data = prefetcher.get(info.path) if prefetcher else None
+                    self.events.emit('started', input=info.path)
+                    yield self._process_file(info, output_path, quality, mode, data)
+            finally:
+                if prefetcher:
+                    prefetcher.close()
+            return
+
+        budget = int(psutil.virtual_memory().available * self.memory_fraction)
+        source = iter(jobs) if streamed else None
+        if streamed:
+            pending, prefetcher = deque(), None  # remote and sequential inputs are never streamed
+        else:
+            pending = deque((info, output_path, self._estimate_job(info, output_path)) for info, output_path in jobs)
+            if not (self.input_store and self.input_storage().sequential):
+                # Largest first: big images start while there is room and small ones backfill at the end
+                pending = deque(sorted(pending, key=lambda job: job[2], reverse=True))
+            prefetcher = self._prefetcher(pending, pooled=True)
+        done = queue.Queue()
+        running = 0
+        reserved = 0
 
-    def compress_image(self, input_path, output_path, quality, mode="compress_convert"):
         try:
-            with Image.open(input_path) as img:
-                # Apply EXIF orientation first
-                img = ImageOps.exif_transpose(img)
-
-                # Determine target format from output path extension
-                output_ext = output_path.suffix.lower()
-                input_ext = Path(input_path).suffix.lower()
-
-                # Handle different processing modes
-                if mode == "convert_only":
-                    # Convert format only, keep original quality
-                    img = self._convert_format_only(img, output_ext)
-                elif mode == "compress_only":
-                    # Compress only, keep original format
-                    output_ext = input_ext  # Use original format
-                    img = self._compress_quality_only(img, output_ext, quality)
-                elif mode == "convert_compress":
-                    # Convert format first, then compress
-                    img = self._convert_format_only(img, output_ext)
-                    img = self._compress_quality_only(img, output_ext, quality)
-                else:  # "compress_convert" (default)
-                    # Compress quality first, then convert format
-                    temp_img = self._compress_quality_only(img, input_ext, quality)
-                    img = self._convert_format_only(temp_img, output_ext)
-
-                # Final save with proper format handling
-                self._save_image(img, output_path, output_ext, quality)
-                return True
-        except Exception as e:
-            print(f"{Colors.RED}❌ Error compressing {Path(input_path).name}: {str(e)}{Colors.ENDC}")
-            return False
+            with multiprocessing.Pool(workers, initializer=_init_worker,
+                                      initargs=(self._worker_options(), self._worker_input())) as pool:
+                while pending or running or source:
+                    while source and len(pending) < workers * 2:
+                        job = next(source, None)
+                        if job is None:
+                            source = None
+                        else:
+                            pending.append((*job, self._estimate_job(*job)))
+                    if not pending and not running:
+                        break
 
-    def _convert_format_only(self, img, target_ext):
-        """Convert image format without quality loss"""
-        if target_ext in ['.jpg', '.jpeg']:
-            # JPEG doesn't support transparency, add white background
-            if img.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'RGBA':
-                    background.paste(img, mask=img.split()[-1])
-                else:  # LA mode
-                    background.paste(img.convert('RGB'), mask=img.split()[-1])
-                return background
-            elif img.mode == 'P':
-                return img.convert('RGB')
-        elif target_ext == '.png':
-            # PNG supports all modes
-            if img.mode == 'P' and 'transparency' in img.info:
-                return img.convert('RGBA')
-        elif target_ext == '.webp':
-            # WebP supports transparency
-            if img.mode not in ('RGB', 'RGBA', 'L'):
-                if img.mode == 'P':
-                    return img.convert('RGBA' if 'transparency' in img.info else 'RGB')
-                return img.convert('RGB')
-        elif target_ext == '.bmp':
-            # BMP doesn't support transparency well
-            if img.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'RGBA':
-                    background.paste(img, mask=img.split()[-1])
-                else:
-                    background.paste(img.convert('RGB'), mask=img.split()[-1])
-                return background
-            elif img.mode == 'P':
-                return img.convert('RGB')
+                    # Admit jobs while they fit the budget; a job bigger than the budget runs alone
+                    while pending and running < workers:
+                        info, output_path, estimate = pending[0]
+                        if running and reserved + estimate > budget:
+                            break
+                        pending.popleft()
+                        data = prefetcher.get(info.path) if prefetcher else None
+                        self.events.emit('started', input=info.path, estimate=estimate)
+                        self._submit_job(pool, done, info, output_path, quality, mode, estimate, data)
+                        running += 1
+                        reserved += estimate
 
-        return img  # No conversion needed
+                    result, estimate = done.get()
+                    running -= 1
+                    reserved -= estimate
+                    yield result
+        finally:
+            if prefetcher:
+                prefetcher.close()
 
-    def _compress_quality_only(self, img: Image.Image, format_ext: str, quality: int) -> Image.Image:
-        """Apply quality-based processing without changing format"""
-        # For lossy formats, we can apply some preprocessing
-        if format_ext.lower() in ['.jpg', '.jpeg', '.webp']:
-            # For JPEG/WebP, ensure appropriate color mode
-            if img.mode not in ('RGB', 'L'):
-                if img.mode in ('RGBA', 'LA'):
-                    # Add white background for transparency
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'RGBA':
-                        background.paste(img, mask=img.split()[-1])
-                    else:
-                        background.paste(img.convert('RGB'), mask=img.split()[-1])
-                    return background
-                else:
-                    img = img.convert('RGB')
+    @staticmethod
+    def _submit_job(pool, done: queue.Queue, info: ImageInfo, output_path, quality, mode, estimate: int,
+                    data: Optional[bytes] = None):
+        """Start one job on the pool; its (FileResult, estimate) arrives on done"""
+        pool.apply_async(
+            _process_job, ((info, output_path, quality, mode, data),),
+            callback=lambda result: done.put((result, estimate)),
+            error_callback=lambda exc: done.put(
+                (FileResult(info.path, str(output_path), "failed", info.file_size, error=str(exc)), estimate)),
+        )
 
-        # For PNG, optimize palette if applicable
-        elif format_ext.lower() == '.png':
-            if img.mode == 'P' and len(img.getcolors() or []) > 256:
-                # Convert to RGBA if too many colors for palette
-                img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    def _worker_options(self) -> dict:
+        """Attributes copied onto each pool worker's own ImageCompressor"""
+        return {
+            'MAX_IMAGE_SIZE_MB': self.MAX_IMAGE_SIZE_MB,
+            'MAX_PIXELS': self.MAX_PIXELS,
+            'incremental': self.incremental,
+            'target_size': self.target_size,
+            'min_ssim': self.min_ssim,
+            'never_larger': self.never_larger,
+            'variant_formats': self.variant_formats,
+            'variant_widths': self.variant_widths,
+            'max_width': self.max_width,
+            'max_height': self.max_height,
+            'scale': self.scale,
+            'encode_threads': self.encode_threads or max(1, (os.cpu_count() or 1) // self.workers),
+            'encoder_preset': self.encoder_preset,
+            'output_store': self.output_store,
+            'instrument': self.instrument,
+            'profile_paths': self.profile_paths,
+            'profile_dir': self.profile_dir,
+        }
 
-        return img
+    def _report_result(self, result: FileResult):
+        file_name = Path(result.input_path).name
+        print(f"\n{Colors.CYAN}📸 Processed: {file_name}{Colors.ENDC}")
 
-    def _save_image(self, img, output_path, output_ext, quality):
-        """Save image with appropriate format settings"""
-        if output_ext in ['.jpg', '.jpeg']:
-            img.save(output_path, 'JPEG', quality=quality or 95, optimize=True, progressive=True)
-        elif output_ext == '.png':
-            if img.mode == 'P' and len(img.getcolors() or []) <= 256:
-                img.save(output_path, 'PNG', optimize=True)
+        if result.status == "success":
+            original_size = result.original_size / (1024 * 1024)
+            compressed_size = result.output_size / (1024 * 1024)
+            reduction = ((original_size - compressed_size) / original_size) * 100 if original_size else 0.0
+
+            print(f"   {Colors.GREEN}✅ Success:{Colors.ENDC} {original_size:.2f}MB → {compressed_size:.2f}MB ({reduction:.1f}% reduction)")
+            if result.variants:
+                for variant in result.variants:
+                    print(f"   {Colors.BLUE}💾 Saved as:{Colors.ENDC} {Path(variant['path']).name} ({format_size(variant['size'])})")
             else:
-                img.save(output_path, 'PNG', optimize=True, compress_level=6)
-        elif output_ext == '.webp':
-            img.save(output_path, 'WebP', quality=quality or 95, optimize=True, lossless=False)
-        elif output_ext == '.bmp':
-            img.save(output_path, 'BMP')
-        elif output_ext in ['.tiff', '.tif']:
-            img.save(output_path, 'TIFF', quality=quality or 95, optimize=True)
+                print(f"   {Colors.BLUE}💾 Saved as:{Colors.ENDC} {Path(result.output_path).name}")
+            if result.kept_source:
+                print(f"   {Colors.CYAN}↩️  Kept source:{Colors.ENDC} {result.kept_source}")
+            if result.duplicate_of:
+                print(f"   {Colors.CYAN}🧬 Duplicate of {Path(result.duplicate_of).name}:{Colors.ENDC} "
+                      f"output {'hardlinked' if result.linked else 'copied'}, not encoded again")
+            search = result.search
+            if search and search.get('metric'):
+                verdict = '≥' if search['met'] else '<'
+                color = Colors.CYAN if search['met'] else Colors.YELLOW
+                print(f"   {color}🔍 SSIM {search['score']:.4f} {verdict} {search['target']:g}:{Colors.ENDC} "
+                      f"quality {search['value']} after {search['attempts']} encode(s) in {search['seconds']:.2f}s")
+            elif search and search['met']:
+                chosen = f"{search['param']} {search['value']}" if search['value'] is not None else "default settings"
+                print(f"   {Colors.CYAN}🎯 Target met:{Colors.ENDC} {chosen} after {search['attempts']} encode(s)")
+            elif search:
+                print(f"   {Colors.YELLOW}⚠️  Target missed:{Colors.ENDC} smallest encode is {format_size(result.output_size)} "
+                      f"after {search['attempts']} encode(s)")
         else:
-            # Fallback
-            img.save(output_path, optimize=True)
-
-    def print_progress_bar(self, current, total, width=50):
-        progress = current / total
-        filled_width = int(width * progress)
-        bar = '█' * filled_width + '░' * (width - filled_width)
-        percentage = progress * 100
-        print(f"\r{Colors.GREEN}[{bar}] {percentage:5.1f}% ({current}/{total}){Colors.ENDC}", end='', flush=True)
+            print(f"{Colors.RED}❌ Error compressing {file_name}: {result.error}{Colors.ENDC}")
 
     def process_images(self, image_files, quality, quality_name, output_ext=None, format_name="Original Format", mode="compress_convert", mode_name="Compress + Convert", suffix="-compressed"):
         if not self.output_dir.exists():
             self.output_dir.mkdir(parents=True, exist_ok=True)
 
         # Create appropriate status message based on mode
+        quality_label = quality_name if self.target_size or self.min_ssim else f"{quality_name} - {quality}%"
         if mode == "compress_only":
-            status_msg = f"🔄 Processing images: {mode_name} ({quality_name} - {quality}%)"
+            status_msg = f"🔄 Processing images: {mode_name} ({quality_label})"
         elif mode == "convert_only":
             status_msg = f"🔄 Processing images: {mode_name} → {format_name}"
         else:
-            status_msg = f"🔄 Processing images: {mode_name} ({quality_name} - {quality}%) → {format_name}"
+            status_msg = f"🔄 Processing images: {mode_name} ({quality_label}) → {format_name}"
 
         print(f"\n{Colors.BLUE}{Colors.BOLD}{status_msg}{Colors.ENDC}\n")
 
-        successful = 0
-        skipped = 0
-        failed = 0
+        settings = BuildManifest.settings_for(mode, quality, output_ext, suffix, self.target_size, self.resize_options,
+                                              'auto' if self.auto_tune else self.encoder_preset, self.min_ssim,
+                                              self.never_larger)
+        manifest = BuildManifest(self.input_dir, self.output_dir) if self.incremental else None
 
-        for i, input_path in enumerate(image_files):
-            file_name = Path(input_path).name
+        # A lazy scan streams into the workers unless a step needs the whole batch first
+        if not isinstance(image_files, list) and (self.dedupe or self.auto_tune or self.profile_samples
+                                                  or (self.input_store and (self.input_storage().remote
+                                                                            or self.input_storage().sequential))):
+            image_files = list(image_files)
+        streaming = not isinstance(image_files, list)
 
-            # Show progress
-            self.print_progress_bar(i, len(image_files))
-            print(f"\n{Colors.CYAN}📸 Processing: {file_name}{Colors.ENDC}")
+        journal, resumed = None, []
+        if not self.output_store:
+            journal = JobJournal(self.output_dir)
+            journal.open(dict(settings, variant_formats=list(self.variant_formats),
+                              variant_widths=list(self.variant_widths)), self.resume)
+            if self.resume:
+                image_files = self._resume_from(journal, image_files, resumed)
+                if not streaming:
+                    image_files = list(image_files)
 
-            # Get output filename
-            output_path = self.get_output_filename(input_path, output_ext, suffix)
-            if output_path is None:
-                print(f"{Colors.YELLOW}⏭️  Skipped: {file_name}{Colors.ENDC}")
-                skipped += 1
-                continue
+        infos: Dict[str, ImageInfo] = {}
+        skipped: List[FileResult] = []
+        if streaming:
+            jobs = self._stream_jobs(image_files, output_ext, suffix, mode, manifest, settings, journal, infos, skipped)
+        else:
+            # Resolve every output name up front so workers never need to prompt
+            jobs, skipped = self._plan_jobs(image_files, output_ext, suffix, manifest, settings)
+            self._prepare_jobs(jobs, mode, journal, infos)
 
-            # Get file sizes
-            original_size = os.path.getsize(input_path) / (1024 * 1024)
+        # Duplicates wait for the input they copy and are finished from its output
+        held: Dict[str, list] = {}
+        if self.dedupe and len(jobs) > 1:
+            duplicates = self.find_duplicates([info for info, _ in jobs])
+            for info, output_path in jobs:
+                if info.path in duplicates:
+                    held.setdefault(duplicates[info.path], []).append((info, output_path))
+            jobs = [(info, output_path) for info, output_path in jobs if info.path not in duplicates]
+            if duplicates:
+                print(f"{Colors.CYAN}🧬 {len(duplicates)} duplicate input(s) of {len(held)} image(s) will reuse their "
+                      f"output instead of being encoded again{Colors.ENDC}")
+        results: List[FileResult] = []
 
-            # Process image with selected mode
-            if self.compress_image(input_path, output_path, quality, mode):
-                compressed_size = os.path.getsize(output_path) / (1024 * 1024)
-                reduction = ((original_size - compressed_size) / original_size) * 100
+        self.tuning = None
+        if self.auto_tune and jobs:
+            print(f"{Colors.BLUE}🎛️  Auto-tuning encoder settings on a sample of the batch...{Colors.ENDC}")
+            self.tuning = self._auto_tune(jobs, quality, mode)
+            self.encoder_preset = self.tuning['preset']
 
-                print(f"   {Colors.GREEN}✅ Success:{Colors.ENDC} {original_size:.2f}MB → {compressed_size:.2f}MB ({reduction:.1f}% reduction)")
-                print(f"   {Colors.BLUE}💾 Saved as:{Colors.ENDC} {output_path.name}")
-                successful += 1
-            else:
-                failed += 1
+        trace = open(self.trace_path, 'a', encoding='utf-8') if self.trace_path else None
+        storage = self.open_output_storage()
+        written: Dict[str, FileResult] = {}  # output store member -> result, to report failed uploads
+        self.events = events = self.open_progress()
+        batch_started = time.perf_counter()
+        events.emit('batch_started', mode=mode, quality=quality, output_ext=output_ext, workers=self.workers,
+                    streaming=streaming)
+        announced = [0, 0]  # skipped and resumed inputs already emitted
+
+        def announce():
+            for result in skipped[announced[0]:]:
+                events.emit('skipped', result)
+            for _, result in resumed[announced[1]:]:
+                events.emit('skipped', result)
+            announced[:] = [len(skipped), len(resumed)]
+        if self.profile_samples and jobs:
+            # Spread the profiled files evenly over the batch
+            step = max(1, len(jobs) // self.profile_samples)
+            self.profile_paths = frozenset(info.path for info, _ in jobs[::step][:self.profile_samples])
+            self.profile_dir = tempfile.mkdtemp(prefix='mami-profile-')
+
+        try:
+            for outcome in self._run_jobs(jobs, quality, mode):
+                copies = [self._share_output(outcome, info, output_path)
+                          for info, output_path in held.pop(outcome.input_path, ())]
+                for result in [outcome] + copies:
+                    for output_path, data in result.payload or ():
+                        name = Path(output_path).relative_to(self.output_dir).as_posix()
+                        storage.add(name, data)
+                        written[name] = result
+                    result.payload = None
+                    results.append(result)
+                    announce()
+                    # A streamed batch's total grows as the scan finds more inputs
+                    done = len(skipped) + len(resumed)
+                    events.emit('finished' if result.status == "success" else 'failed', result,
+                                completed=done + len(results), total=done + len(infos))
+                    if manifest and result.status == "success":
+                        manifest.record(infos[result.input_path], result, settings)
+                    if journal and result.status in ("success", "failed"):
+                        journal.record(self._index_key(result.input_path), infos[result.input_path], result)
+                    if trace:
+                        self._write_trace(trace, result)
+            announce()
+            for info, result in resumed:
+                if manifest:
+                    manifest.record(info, result, settings)
+        except BaseException:
+            events.close()  # keep the event log of an interrupted batch
+            self.events = ProgressEvents()
+            raise
+        finally:
+            self.reclaimed_outputs = frozenset()
+            if journal:
+                journal.close()
+            if manifest:
+                manifest.save()
+            if trace:
+                trace.close()
+            if storage:
+                for name, error in storage.close():
+                    print(f"{Colors.RED}❌ Error writing {name} to {self.output_store}: {error}{Colors.ENDC}")
+                    written[name].status, written[name].error = "failed", f"write to output store failed: {error}"
+                    events.emit('failed', written[name], stage='upload')
+
+        results = skipped + [result for _, result in resumed] + results
+        total = len(results)
+        removed = []
+        if manifest and self.prune_orphans:
+            removed = manifest.prune_orphans()
+            manifest.save()
 
-            # Small delay for visual effect
-            time.sleep(0.1)
+        successful = sum(1 for r in results if r.status == "success")
+        unchanged = sum(1 for r in results if r.status == "unchanged")
+        skipped = sum(1 for r in results if r.status == "skipped")
+        failed = sum(1 for r in results if r.status == "failed")
 
-        # Final progress bar
-        self.print_progress_bar(len(image_files), len(image_files))
+        events.emit('batch_finished', total=total, succeeded=successful, unchanged=unchanged, resumed=len(resumed),
+                    skipped=skipped, failed=failed, bytes_in=sum(r.original_size for r in results),
+                    bytes_out=sum(r.output_size for r in results), seconds=round(time.perf_counter() - batch_started, 3))
+        events.close()
+        self.events = ProgressEvents()
 
         # Print summary
         print(f"\n\n{Colors.GREEN}{Colors.BOLD}📊 Compression Summary:{Colors.ENDC}")
         print(f"   ✅ Successfully compressed: {Colors.GREEN}{successful}{Colors.ENDC}")
+        if unchanged > 0:
+            print(f"   ♻️  Up to date: {Colors.CYAN}{unchanged}{Colors.ENDC}")
+        if resumed:
+            print(f"   ⏯️  Already done (journal): {Colors.CYAN}{len(resumed)}{Colors.ENDC}")
+        if removed:
+            print(f"   🧹 Removed orphaned outputs: {Colors.CYAN}{len(removed)}{Colors.ENDC}")
         if skipped > 0:
             print(f"   ⏭️  Skipped: {Colors.YELLOW}{skipped}{Colors.ENDC}")
         if failed > 0:
             print(f"   ❌ Failed: {Colors.RED}{failed}{Colors.ENDC}")
+        if self.scan_counts:
+            print(f"   🗂️  Scan index: {self.scan_counts[0]} cached, {self.scan_counts[1]} probed")
+            self.scan_counts = None
+
+        searches = [r.search for r in results if r.search]
+        searches += [v['search'] for r in results for v in (r.variants or ()) if v['search']]
+        similarity = [s for s in searches if s.get('metric')]
+        searches = [s for s in searches if not s.get('metric')]
+        if similarity:
+            met = sum(1 for s in similarity if s['met'])
+            print(f"   🔍 SSIM ≥ {self.min_ssim:g} met: {Colors.GREEN}{met}{Colors.ENDC}/{len(similarity)} "
+                  f"(quality {sum(s['value'] for s in similarity) / len(similarity):.0f} on average, "
+                  f"{sum(s['attempts'] for s in similarity) / len(similarity):.1f} encodes and "
+                  f"{sum(s['seconds'] for s in similarity) / len(similarity):.2f}s per image)")
+        if searches:
+            attempts = [s['attempts'] for s in searches]
+            met = sum(1 for s in searches if s['met'])
+            print(f"   🎯 Target size met: {Colors.GREEN}{met}{Colors.ENDC}/{len(searches)} "
+                  f"({sum(attempts) / len(attempts):.1f} encodes per file on average, max {max(attempts)})")
+
+        kept = [r for r in results if r.kept_source and r.status == "success"]
+        if kept:
+            undecoded = sum(1 for r in kept if 'not decoded' in r.kept_source)
+            print(f"   ↩️  Sources kept instead of a larger re-encode: {Colors.CYAN}{len(kept)}{Colors.ENDC}"
+                  f"{f' ({undecoded} without decoding)' if undecoded else ''}")
+
+        reused = [r for r in results if r.duplicate_of and r.status == "success"]
+        if reused:
+            cpu_seconds = {r.input_path: r.cpu_seconds for r in results}
+            saved_cpu = sum(cpu_seconds.get(r.duplicate_of, 0.0) for r in reused)
+            saved_bytes = sum(r.output_size for r in reused if r.linked)
+            print(f"   🧬 Duplicates not re-encoded: {Colors.CYAN}{len(reused)}{Colors.ENDC} "
+                  f"(saved ~{saved_cpu:.1f}s CPU and {format_size(saved_bytes)} of output through hardlinks)")
+
+        self._print_encoder_report(results)
+        if self.show_plans:
+            self._print_plan_report(results)
+        if self.instrument:
+            self._print_stage_report(results)
+        if self.profile_dir:
+            self._print_profile_report()
+
+        if storage:
+            print(f"   📦 Written to {Colors.CYAN}{self.output_store}{Colors.ENDC}: {storage.count} file(s)")
 
         if successful > 0:
             print(f"\n{Colors.GREEN}{Colors.BOLD}🎉 Compression completed! Check the output folder for your compressed images.{Colors.ENDC}")
 
-def main():
+        return results
+
+    def _resume_from(self, journal: JobJournal, image_files, resumed: List[Tuple[ImageInfo, FileResult]]):
+        """Inputs an interrupted run did not finish, lazily; the finished ones go to ``resumed``.
+
+        Outputs the interrupted run named for the remaining inputs may be
+        overwritten, and its leftover temp files for them are removed before
+        this returns. Temp files of other outputs (e.g. another run writing
+        to the same folder) are left alone.
+        """
+        finished = {name for entry in journal.done.values() for name, _ in entry['outputs']}
+        unfinished = [self.output_dir / name for name in journal.planned - finished]
+        self.reclaimed_outputs = frozenset(unfinished)
+
+        by_folder: Dict[Path, set] = {}
+        for path in unfinished:
+            by_folder.setdefault(path.parent, set()).add(path.name)
+        for folder, names in by_folder.items():
+            try:
+                entries = list(os.scandir(folder))
+            except OSError:
+                continue
+            for entry in entries:
+                # Temp files are named .<output name>.<pid>.tmp (see temp_path_for)
+                name, _, pid = entry.name[1:-4].rpartition('.')
+                if entry.name.startswith('.') and entry.name.endswith('.tmp') and pid.isdigit() and name in names:
+                    with contextlib.suppress(OSError):
+                        os.unlink(entry.path)
+        return self._unfinished_inputs(journal, image_files, resumed)
+
+    def _unfinished_inputs(self, journal: JobJournal, image_files, resumed: List[Tuple[ImageInfo, FileResult]]):
+        for item in image_files:
+            info = self._as_image_info(item)
+            entry = journal.lookup(self._index_key(info.path), info)
+            if entry is None:
+                yield info
+                continue
+            info.content_hash = entry['hash']
+            output_path = str(self.output_dir / entry['outputs'][0][0]) if entry['outputs'] else None
+            resumed.append((info, FileResult(info.path, output_path, "resumed", info.file_size,
+                                             sum(size for _, size in entry['outputs']), content_hash=entry['hash'])))
+
+    @staticmethod
+    def _write_trace(trace, result: FileResult):
+        trace.write(json.dumps({
+            'input': result.input_path, 'output': result.output_path, 'status': result.status,
+            'original_size': result.original_size, 'output_size': result.output_size,
+            'error': result.error, 'plans': result.plans,
+            **({'variants': result.variants} if result.variants else {}), **(result.stats or {}),
+        }) + '\n')
+
+    def _print_encoder_report(self, results: List[FileResult]):
+        """Preset and concrete encoder parameters used, with the auto-tune measurements"""
+        formats = set()
+        for result in results:
+            if result.status != "success":
+                continue
+            for path in ([v['path'] for v in result.variants] if result.variants else [result.output_path]):
+                formats.add(normalize_ext(Path(path).suffix))
+        params = ENCODER_PRESETS[self.encoder_preset]
+        details = "; ".join(
+            f"{OUTPUT_FORMATS[ext]} {', '.join(f'{k}={v}' for k, v in params[ext].items()) or 'defaults'}"
+            for ext in sorted(formats) if ext in params)
+        how = " (auto-tuned)" if self.tuning else ""
+        print(f"   ⚙️  Encoder preset: {Colors.CYAN}{self.encoder_preset}{Colors.ENDC}{how}"
+              f"{f' — {details}' if details else ''}")
+        if self.tuning and self.tuning['candidates']:
+            print(f"      sampled {self.tuning['samples']} file(s), goal {self.tuning['goal']}:")
+            for name, stats in self.tuning['candidates'].items():
+                marker = "→" if name == self.encoder_preset else " "
+                print(f"      {marker} {name:<9}{stats['ms_per_image']:8.1f} ms/img"
+                      f"{stats['images_per_second']:9.2f} img/s{stats['bytes'] / 1024:10.1f} KB")
+
+    def _print_plan_report(self, results: List[FileResult]):
+        """Distinct conversion plans of the batch and how many files used each"""
+        counts: Dict[str, int] = {}
+        for result in results:
+            for plan in result.plans or ():
+                counts[plan] = counts.get(plan, 0) + 1
+        if not counts:
+            return
+        print(f"\n{Colors.BLUE}{Colors.BOLD}🧭 Conversion plans:{Colors.ENDC}")
+        for plan, count in sorted(counts.items(), key=lambda item: -item[1]):
+            print(f"   {count:>5} × {plan}")
+
+    def _print_stage_report(self, results: List[FileResult]):
+        """Per-stage percentiles of wall time across the processed files"""
+        stats = [r.stats for r in results if r.stats]
+        if not stats:
+            return
+
+        names = [n for n in PIPELINE_STAGES if any(n in s['stages'] for s in stats)]
+        names += sorted({n for s in stats for n in s['stages']} - set(names))
+        grand_total = sum(t['wall'] for s in stats for t in s['stages'].values()) or 1.0
+
+        print(f"\n{Colors.BLUE}{Colors.BOLD}⏱️  Stage timings ({len(stats)} files, ms per file):{Colors.ENDC}")
+        print(f"   {'stage':<15}{'p50':>9}{'p90':>9}{'p99':>9}{'cpu total':>11}{'share':>8}")
+        for name in names:
+            walls = sorted(s['stages'][name]['wall'] * 1000 for s in stats if name in s['stages'])
+            cpu = sum(s['stages'][name]['cpu'] for s in stats if name in s['stages'])
+            share = sum(walls) / 1000 / grand_total * 100
+            print(f"   {name:<15}{percentile(walls, 50):9.1f}{percentile(walls, 90):9.1f}{percentile(walls, 99):9.1f}"
+                  f"{cpu:10.2f}s{share:7.1f}%")
+
+        counters = sorted({n for s in stats for n in s['bytes']})
+        totals = ", ".join(f"{n} {sum(s['bytes'].get(n, 0) for s in stats) / (1024 * 1024):.2f}MB" for n in counters)
+        print(f"   bytes: {totals}")
+
+    def _print_profile_report(self, limit: int = 15):
+        """Merge the per-file cProfile dumps and show the most expensive calls"""
+        dumps = sorted(Path(self.profile_dir).glob('*.prof'))
+        try:
+            if dumps:
+                merged_path = self.output_dir / '.mami-profile.prof'
+                stats = pstats.Stats(*(str(p) for p in dumps))
+                stats.dump_stats(str(merged_path))
+                print(f"\n{Colors.BLUE}{Colors.BOLD}🔬 cProfile of {len(dumps)} sampled file(s) (saved to {merged_path}):{Colors.ENDC}")
+                stats.sort_stats('cumulative').print_stats(limit)
+        finally:
+            for dump in dumps:
+                dump.unlink()
+            os.rmdir(self.profile_dir)
+            self.profile_dir = None
+            self.profile_paths = frozenset()
+
+    def _apply_config(self, config: BatchConfig):
+        self.set_locations(config.input_dir, config.output_dir)
+        if config.workers:
+            self.workers = max(1, config.workers)
+        self.memory_fraction = config.memory_fraction
+        self.target_size = config.target_size
+        self.min_ssim = config.min_ssim
+        self.never_larger = config.never_larger
+        self.dedupe, self.dedupe_distance = config.dedupe, config.dedupe_distance
+        self.variant_formats = tuple(config.variant_formats or ())
+        self.variant_widths = tuple(config.variant_widths or ())
+        self.max_width, self.max_height, self.scale = config.max_width, config.max_height, config.scale
+        self.encoder_preset = config.encoder_preset
+        self.auto_tune = config.auto_tune
+        self.tune_throughput = config.tune_throughput
+        self.tune_size_slack = config.tune_size_slack
+        self.tune_samples = config.tune_samples
+        self.conflict_policy = config.on_conflict
+        self.use_scan_index = config.scan_index
+        self.rebuild_scan_index = config.rebuild_scan_index
+        self.strict_verify = config.strict_verify
+        self.incremental = config.incremental
+        self.prune_orphans = config.prune_orphans
+        self.resume = config.resume
+        self.instrument = config.instrument
+        self.trace_path = Path(config.trace_path) if config.trace_path else None
+        self.profile_samples = config.profile_samples
+        self.progress_mode = config.progress
+        self.events_path = config.events_path
+
+        self.storage_connections = config.storage_connections
+        self.s3_endpoint = config.s3_endpoint
+        self.show_plans = config.show_plans
+        if self.min_ssim:
+            SimilarityReference.load_numpy()  # fail before scanning rather than on every file
+
+    def _check_input(self):
+        """Raise before an unattended run if the input folder or archive is missing"""
+        if is_s3_url(self.input_dir):
+            pass  # listed (and any access error raised) by scan_input_folder
+        elif self.input_store and not self.input_dir.is_file():
+            raise FileNotFoundError(f"Input archive not found: {self.input_dir}")
+        elif not self.input_store and not self.input_dir.is_dir():
+            raise FileNotFoundError(f"Input folder not found: {self.input_dir}")
+
+    def run(self, config: BatchConfig) -> List[FileResult]:
+        """Process a whole input folder without prompting and return per-file results"""
+        self._apply_config(config)
+        self._check_input()
+        # Processing starts with the first valid input instead of after the whole scan
+        image_files = self.iter_input_files()
+        first = next(image_files, None)
+        if first is None:
+            return []
+        image_files = itertools.chain([first], image_files)
+
+        return self.process_images(image_files, config.quality, config.quality_name, config.output_ext,
+                                   config.format_name, config.mode, config.mode_name, config.suffix)
+
+    def watch(self, config: BatchConfig, settle: float = 1.0, queue_size: int = 64, stats_interval: float = 30.0,
+              poll_interval: float = 1.0):
+        """Process files as they appear in the input folder until interrupted.
+
+        Settled files are validated and planned one at a time, then queued for
+        a pool that stays up for the whole session. At most ``queue_size``
+        jobs wait for a worker; further arrivals stay with the watcher until
+        there is room. Outputs are tracked in the build manifest, so a file
+        that changes again overwrites its earlier output and a restart skips
+        everything already done.
+        """
+        self._apply_config(config)
+        self._check_input()
+        if self.input_store or self.output_store:
+            raise ValueError("Watch mode needs an input and output folder, not an archive or object store")
+        if self.fan_out:
+            raise ValueError("Watch mode does not support fan-out outputs yet")
+        if self.dedupe:
+            raise ValueError("Watch mode does not support --dedupe: files arrive one at a time")
+        self.incremental = True  # the manifest maps each input to its output across changes
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        mode, quality, output_ext, suffix = config.mode, config.quality, config.output_ext, config.suffix
+        manifest = BuildManifest(self.input_dir, self.output_dir)
+        settings = BuildManifest.settings_for(mode, quality, output_ext, suffix, self.target_size, self.resize_options,
+                                                  'auto' if self.auto_tune else self.encoder_preset, self.min_ssim,
+                                                  self.never_larger)
+        watcher = FolderWatcher(self.input_dir, self.supported_formats, settle, poll_interval,
+                                skip={os.path.realpath(self.output_dir)})
+        budget = int(psutil.virtual_memory().available * self.memory_fraction)
+
+        backlog = deque()  # (info, output_path, estimate)
+        active: Dict[str, Tuple[ImageInfo, float, Path]] = {}  # queued or running: path -> (info, arrival, output)
+        claimed = set()  # outputs of queued or running jobs, not yet on disk
+        done = queue.Queue()
+        running = reserved = 0
+        counts = {"success": 0, "failed": 0, "skipped": 0, "unchanged": 0}
+        finished = deque(maxlen=10_000)  # (completion time, latency) for rate and percentiles
+        started = time.monotonic()
+        next_stats = started + stats_interval
+        trace = open(self.trace_path, 'a', encoding='utf-8') if self.trace_path else None
+
+        def print_stats():
+            now = time.monotonic()
+            window = [latency for at, latency in finished if now - at <= stats_interval]
+            latencies = sorted(window)
+            rate = len(window) / min(stats_interval, max(now - started, 1e-9))
+            latency = (f"latency p50 {percentile(latencies, 50):.2f}s p90 {percentile(latencies, 90):.2f}s "
+                       f"p99 {percentile(latencies, 99):.2f}s" if latencies else "no files finished")
+            print(f"{Colors.BLUE}📈 Queue {len(backlog)} waiting, {running} running, {watcher.settling} settling | "
+                  f"{counts['success']} done, {counts['failed']} failed | {rate:.2f} img/s | {latency}{Colors.ENDC}")
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+
+        previous_sigterm = signal.signal(signal.SIGTERM, stop)
+        print(f"\n{Colors.BLUE}{Colors.BOLD}👀 Watching {self.input_dir} ({watcher.backend}, {self.workers} worker(s)); "
+              f"press Ctrl+C to stop{Colors.ENDC}\n")
+        try:
+            with multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self._worker_options(),)) as pool:
+                while True:
+                    watcher.wait(0.1 if running or backlog else 0.5)
+
+                    # Backpressure: only take settled files while the queue has room
+                    for path, arrival in watcher.ready(queue_size - len(backlog)):
+                        if path in active:
+                            watcher.requeue(path, arrival)  # changed again while queued; redo it afterwards
+                            continue
+                        info = self._validate_image_file(path)
+                        if info is None:
+                            counts["skipped"] += 1
+                            continue
+                        jobs, skipped = self._plan_jobs([info], output_ext, suffix, manifest, settings, claimed)
+                        for result in skipped:
+                            counts[result.status] += 1
+                        for info, output_path in jobs:
+                            active[info.path] = (info, arrival, output_path)
+                            backlog.append((info, output_path, self._estimate_job(info, output_path)))
+
+                    while backlog and running < self.workers:
+                        info, output_path, estimate = backlog[0]
+                        if running and reserved + estimate > budget:
+                            break
+                        backlog.popleft()
+                        self._submit_job(pool, done, info, output_path, quality, mode, estimate)
+                        running += 1
+                        reserved += estimate
+
+                    while True:
+                        try:
+                            result, estimate = done.get_nowait()
+                        except queue.Empty:
+                            break
+                        running -= 1
+                        reserved -= estimate
+                        info, arrival, output_path = active.pop(result.input_path)
+                        claimed.discard(output_path)
+                        now = time.monotonic()
+                        finished.append((now, now - arrival))
+                        counts[result.status] += 1
+                        self._report_result(result)
+                        if result.status == "success":
+                            manifest.record(info, result, settings)
+                        if trace:
+                            self._write_trace(trace, result)
+                            trace.flush()
+
+                    if time.monotonic() >= next_stats:
+                        print_stats()
+                        manifest.save()
+                        next_stats = time.monotonic() + stats_interval
+        except KeyboardInterrupt:
+            print(f"\n\n{Colors.YELLOW}Stopping watch mode.{Colors.ENDC}")
+        finally:
+            signal.signal(signal.SIGTERM, previous_sigterm)
+            watcher.close()
+            manifest.save()
+            if trace:
+                trace.close()
+        print_stats()
+        return counts
+
+# Fixed per-job allowance (encoder state, Python objects) on top of pixel buffers
+JOB_MEMORY_OVERHEAD = 8 * 1024 * 1024
+
+# Per-process compressor used by pool workers (see ImageCompressor._run_jobs), and the options it was built with
+_worker_compressor = None
+_worker_settings = {}
+
+def _make_worker_compressor(options: dict) -> 'ImageCompressor':
+    compressor = ImageCompressor(workers=1)
+    for name, value in options.items():
+        setattr(compressor, name, value)
+    return compressor
+
+def _init_worker(options: dict, input_store: Optional[dict] = None):
+    global _worker_compressor, _worker_settings
+    # Let the parent handle Ctrl+C and tear the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    Image.init()  # load every format plugin once, not on the first file of each format
+    if input_store:
+        input_storage(**input_store)
+    _worker_settings = options
+    _worker_compressor = _make_worker_compressor(options)
+
+def _process_job(task) -> FileResult:
+    info, output_path, quality, mode, data = task
+    return _worker_compressor._process_file(info, output_path, quality, mode, data)
+
+def _compress_request(task):
+    """Pool entry point for CompressionService; never raises so errors map to HTTP codes"""
+    data, config = task
+    # A fresh compressor per request, so no setting or per-file state leaks between requests
+    compressor = _make_worker_compressor(_worker_settings)
+    compressor.target_size = config.target_size
+    compressor.min_ssim = config.min_ssim
+    compressor.never_larger = config.never_larger
+    compressor.max_width, compressor.max_height = config.max_width, config.max_height
+    compressor.scale = config.scale
+    compressor.encoder_preset = config.encoder_preset
+    try:
+        encoded, output_ext, search = compressor.compress_bytes(data, config.quality, config.mode, config.output_ext)
+        return 200, encoded, output_ext, search
+    except Image.UnidentifiedImageError:
+        return 415, "Unrecognised image data", None, None
+    except (ValueError, Image.DecompressionBombError) as e:
+        return 422, str(e), None, None
+    except Exception as e:
+        return 500, str(e), None, None
+
+class ServiceMetrics:
+    """Thread-safe request counters plus a sliding window of latencies"""
+    WINDOW_SECONDS = 60.0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.by_status: Dict[int, int] = {}
+        self.in_flight = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.recent = deque()  # (finished at, latency seconds)
+
+    def record(self, status: int, latency: float, bytes_in: int = 0, bytes_out: int = 0):
+        now = time.monotonic()
+        with self.lock:
+            self.by_status[status] = self.by_status.get(status, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.recent.append((now, latency))
+            while self.recent and now - self.recent[0][0] > self.WINDOW_SECONDS:
+                self.recent.popleft()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            latencies = sorted(latency * 1000 for at, latency in self.recent if now - at <= self.WINDOW_SECONDS)
+            uptime = now - self.started
+            return {
+                'uptime_seconds': round(uptime, 1),
+                'requests': {str(code): count for code, count in sorted(self.by_status.items())},
+                'in_flight': self.in_flight,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'rate_per_second': round(len(latencies) / min(self.WINDOW_SECONDS, max(uptime, 1e-9)), 3),
+                'latency_ms': {f'p{p}': round(percentile(latencies, p), 1) for p in (50, 90, 99)},
+                'window_seconds': self.WINDOW_SECONDS,
+            }
+
+class CompressionService:
+    """HTTP front end that runs uploads through a warm worker pool.
+
+    ``POST /compress?mode=&quality=&format=&target_size=&min_ssim=`` with the image as
+    the request body returns the encoded image. ``GET /metrics`` reports
+    request counts, rate and latency percentiles; ``GET /health`` answers ok.
+    At most ``workers + queue_size`` requests are admitted at once, the rest
+    get 503.
+    """
+
+    def __init__(self, compressor: ImageCompressor, host: str = "127.0.0.1", port: int = 8080,
+                 queue_size: int = 64):
+        self.compressor = compressor
+        self.max_body = compressor.MAX_IMAGE_SIZE_MB * 1024 * 1024
+        self.slots = threading.BoundedSemaphore(compressor.workers + queue_size)
+        self.metrics = ServiceMetrics()
+        self.pool = None
+        Image.init()  # fills Image.MIME for the response headers
+        # Each server gets its own handler class bound to this service
+        handler = type('ServiceHandler', (_ServiceHandler,), {'service': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+
+    def serve_forever(self):
+        host, port = self.server.server_address[:2]
+        with multiprocessing.Pool(self.compressor.workers, initializer=_init_worker,
+                                  initargs=(self.compressor._worker_options(),)) as self.pool:
+            print(f"\n{Colors.BLUE}{Colors.BOLD}🌐 Serving on http://{host}:{port} "
+                  f"({self.compressor.workers} worker(s)); press Ctrl+C to stop{Colors.ENDC}\n")
+            try:
+                self.server.serve_forever()
+            except KeyboardInterrupt:
+                print(f"\n\n{Colors.YELLOW}Stopping server.{Colors.ENDC}")
+            finally:
+                self.server.server_close()
+
+    def compress(self, data: bytes, config: BatchConfig):
+        return self.pool.apply(_compress_request, ((data, config),))
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    service: CompressionService = None
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, headers: Optional[dict] = None):
+        self._send(status, json.dumps({'error': message}).encode(), headers=headers)
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/metrics":
+            self._send(200, json.dumps(self.service.metrics.snapshot()).encode())
+        elif path == "/health":
+            self._send(200, b'{"status": "ok"}')
+        else:
+            self._send_error(404, "Not found")
+
+    def do_POST(self):
+        started = time.monotonic()
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/compress":
+            self.close_connection = True
+            return self._send_error(404, "Not found")
+
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            self.close_connection = True
+            return self._send_error(411, "Content-Length is required")
+        length = int(length)
+        if length > self.service.max_body:
+            # Do not read the body; drop the connection after answering
+            self.close_connection = True
+            return self._finish(started, 413, f"Body exceeds {self.service.compressor.MAX_IMAGE_SIZE_MB}MB")
+
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            config = BatchConfig(
+                mode=params.get("mode", "compress_only"),
+                quality=int(params["quality"]) if "quality" in params else None,
+                target_size=parse_size(params["target_size"]) if "target_size" in params else None,
+                min_ssim=float(params["min_ssim"]) if "min_ssim" in params else None,
+                output_ext=None if params.get("format", "original") == "original" else params["format"],
+                max_width=int(params["max_width"]) if "max_width" in params else None,
+                max_height=int(params["max_height"]) if "max_height" in params else None,
+                scale=float(params["scale"]) if "scale" in params else None,
+                encoder_preset=params.get("preset", "balanced"),
+            )
+        except ValueError as e:
+            self.rfile.read(length)
+            return self._finish(started, 400, str(e))
+
+        if not self.service.slots.acquire(blocking=False):
+            self.rfile.read(length)
+            return self._finish(started, 503, "Server busy, retry later", headers={"Retry-After": "1"})
+        metrics = self.service.metrics
+        with metrics.lock:
+            metrics.in_flight += 1
+        try:
+            data = self.rfile.read(length)
+            status, payload, output_ext, search = self.service.compress(data, config)
+        finally:
+            with metrics.lock:
+                metrics.in_flight -= 1
+            self.service.slots.release()
+
+        if status != 200:
+            return self._finish(started, status, payload, bytes_in=length)
+        headers = {"X-Original-Size": str(length), "X-Output-Format": output_ext.lstrip('.')}
+        if search:
+            headers["X-Target-Met"] = "true" if search['met'] else "false"
+            if search['value'] is not None:
+                headers[f"X-Chosen-{search['param'].capitalize()}"] = str(search['value'])
+            if search.get('metric'):
+                headers["X-SSIM"] = str(search['score'])
+        content_type = Image.MIME.get(OUTPUT_FORMATS[output_ext].upper(), "application/octet-stream")
+        self._send(200, payload, content_type, headers)
+        self.service.metrics.record(200, time.monotonic() - started, length, len(payload))
+
+    def _finish(self, started: float, status: int, message: str, bytes_in: int = 0, headers: Optional[dict] = None):
+        self._send_error(status, message, headers)
+        self.service.metrics.record(status, time.monotonic() - started, bytes_in)
+
+    def log_message(self, format, *args):
+        print(f"{Colors.CYAN}🌐 {self.address_string()} {format % args}{Colors.ENDC}")
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='mami-image',
+        description="Compress and convert images. Runs interactively unless --mode, --yes or --watch is given.",
+    )
+    parser.add_argument('-i', '--input', metavar='DIR',
+                        help="input folder, .zip/.tar archive or s3://bucket/prefix (default: ./input)")
+    parser.add_argument('-o', '--output', metavar='DIR',
+                        help="output folder, .zip/.tar archive or s3://bucket/prefix (default: ./output)")
+    parser.add_argument('--s3-endpoint', metavar='URL',
+                        help="S3-compatible endpoint for s3:// locations, e.g. a MinIO server (default: AWS)")
+    parser.add_argument('--storage-connections', type=int, default=8, metavar='N',
+                        help="concurrent downloads and uploads for s3:// locations (default: 8)")
+    parser.add_argument('-m', '--mode', choices=list(PROCESSING_MODES),
+                        help="processing mode; enables unattended mode (default: convert_only)")
+    parser.add_argument('-q', '--quality', type=int, metavar='1-100',
+                        help="quality for compressing modes (default: 80)")
+    parser.add_argument('-t', '--target-size', type=parse_size, metavar='SIZE',
+                        help="largest output per image, e.g. 200KB; searches quality (up to --quality, default 95)")
+    parser.add_argument('--min-ssim', type=float, metavar='SSIM',
+                        help="lowest JPEG/WebP quality (up to --quality, default 95) keeping SSIM at least this, "
+                             "e.g. 0.98; needs NumPy")
+    parser.add_argument('--allow-larger', action='store_true',
+                        help="write re-encodes even when they are larger than a source in the same format "
+                             "(by default the source is kept)")
+    parser.add_argument('--preset', choices=list(ENCODER_PRESETS), default='balanced',
+                        help="encoder speed/size trade-off (default: balanced)")
+    parser.add_argument('--auto-tune', action='store_true',
+                        help="pick the preset by encoding a sample of the batch with each one")
+    parser.add_argument('--tune-throughput', type=float, metavar='IMG_PER_S',
+                        help="with --auto-tune, smallest output that still reaches this many images/s")
+    parser.add_argument('--tune-size-slack', type=float, default=0.05, metavar='F',
+                        help="with --auto-tune and no throughput goal, fastest preset within F of the smallest "
+                             "output (default: 0.05)")
+    parser.add_argument('--tune-samples', type=int, default=6, metavar='N',
+                        help="with --auto-tune, number of files to sample (default: 6)")
+    parser.add_argument('-f', '--format', choices=['original', 'jpg', 'jpeg', 'png', 'webp', 'bmp', 'tiff', 'gif'],
+                        default='original', help="output format (default: original)")
+    parser.add_argument('--max-width', type=int, metavar='PX', help="shrink outputs wider than PX (keeps aspect ratio)")
+    parser.add_argument('--max-height', type=int, metavar='PX', help="shrink outputs taller than PX (keeps aspect ratio)")
+    parser.add_argument('--scale', type=float, metavar='F', help="shrink outputs by factor F, e.g. 0.5")
+    parser.add_argument('--variants', metavar='FORMATS',
+                        help="fan-out: comma separated output formats written from one decode, e.g. jpg,webp,png")
+    parser.add_argument('--widths', metavar='PX',
+                        help="fan-out: comma separated widths per format, e.g. 1600,800,400 (adds -<width>w to names)")
+    parser.add_argument('-s', '--suffix', help="output filename suffix, '' keeps original names "
+                                               "(default: -compressed, or -converted for convert_only)")
+    parser.add_argument('--on-conflict', choices=CONFLICT_POLICIES, default=None,
+                        help="what to do when an output file exists (default: rename, or ask when interactive)")
+    parser.add_argument('-w', '--workers', type=int, metavar='N',
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument('--memory-fraction', type=float, default=0.7, metavar='F',
+                        help="share of available RAM that concurrent jobs may use (default: 0.7)")
+    parser.add_argument('--no-scan-index', action='store_true',
+                        help="probe every input file instead of using the cached scan index")
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help="discard the scan index and probe every input file again")
+    parser.add_argument('--strict-verify', action='store_true',
+                        help="fully verify every image while scanning instead of during decode")
+    parser.add_argument('--incremental', action='store_true',
+                        help="skip inputs whose output is up to date according to the build manifest")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted batch, skipping inputs its journal records as done")
+    parser.add_argument('--prune-orphans', action='store_true',
+                        help="with --incremental, delete outputs whose input no longer exists")
+    parser.add_argument('--stats', action='store_true',
+                        help="time every pipeline stage and print percentiles in the summary")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="append per-file stage timings as JSON lines to FILE (implies --stats)")
+    parser.add_argument('--progress', choices=PROGRESS_MODES,
+                        help="files: a few lines per file; bar: one status line with img/s, MB/s and ETA, redrawn "
+                             "twice a second; none (default: files when interactive; unattended, bar on a terminal "
+                             "and files when output is redirected)")
+    parser.add_argument('--events', metavar='FILE',
+                        help="append started/finished/skipped/failed events as JSON lines to FILE, or to stdout "
+                             "with '-' (everything else then goes to stderr)")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="encode byte-identical inputs once and hardlink (or copy) the output for the others")
+    parser.add_argument('--dedupe-similar', type=int, nargs='?', const=8, metavar='BITS',
+                        help="also reuse outputs for near-identical images whose 256-bit perceptual hashes differ "
+                             "in at most BITS bits (default: 8); implies --dedupe")
+    parser.add_argument('--show-plans', action='store_true',
+                        help="list the conversion plan (mode conversions, alpha flattening) used per source/target pair")
+    parser.add_argument('--profile', type=int, nargs='?', const=5, default=0, metavar='N',
+                        help="run N sampled files (default: 5) under cProfile and print the hot spots")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and process files as they appear in the input folder")
+    parser.add_argument('--settle', type=float, default=1.0, metavar='SECONDS',
+                        help="with --watch, how long a file must stay unchanged before processing (default: 1.0)")
+    parser.add_argument('--queue-size', type=int, default=64, metavar='N',
+                        help="with --watch or --serve, most jobs waiting for a worker before new work is held back "
+                             "or rejected (default: 64)")
+    parser.add_argument('--stats-interval', type=float, default=30.0, metavar='SECONDS',
+                        help="with --watch, how often to print queue depth, throughput and latency (default: 30)")
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help="run an HTTP compression service on PORT instead of processing folders")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="with --serve, address to listen on (default: 127.0.0.1)")
+    parser.add_argument('-y', '--yes', action='store_true',
+                        help="run unattended with defaults for anything not given")
+    return parser
+
+def config_from_args(args, input_dir, output_dir, trace_path, events_path) -> BatchConfig:
+    """The BatchConfig for command-line flags; interactive runs keep asking about conflicts"""
+    unattended = bool(args.mode or args.yes or args.watch)
+    return BatchConfig(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        mode=args.mode or "convert_only",
+        quality=args.quality,
+        target_size=args.target_size,
+        min_ssim=args.min_ssim,
+        never_larger=not args.allow_larger,
+        output_ext=None if args.format == 'original' else args.format,
+        variant_formats=args.variants.split(',') if args.variants else None,
+        variant_widths=[int(w) for w in args.widths.split(',')] if args.widths else None,
+        max_width=args.max_width,
+        max_height=args.max_height,
+        scale=args.scale,
+        encoder_preset=args.preset,
+        auto_tune=args.auto_tune,
+        tune_throughput=args.tune_throughput,
+        tune_size_slack=args.tune_size_slack,
+        tune_samples=args.tune_samples,
+        suffix=args.suffix,
+        on_conflict=args.on_conflict or ("rename" if unattended else "ask"),
+        workers=args.workers,
+        memory_fraction=args.memory_fraction,
+        scan_index=not args.no_scan_index,
+        rebuild_scan_index=args.rebuild_index,
+        strict_verify=args.strict_verify,
+        incremental=args.incremental,
+        resume=args.resume,
+        prune_orphans=args.prune_orphans,
+        instrument=args.stats,
+        trace_path=trace_path,
+        progress=args.progress or ("auto" if unattended else "files"),
+        events_path=events_path,
+        profile_samples=args.profile,
+        storage_connections=args.storage_connections,
+        dedupe=args.dedupe,
+        dedupe_distance=args.dedupe_similar,
+        s3_endpoint=args.s3_endpoint,
+        show_plans=args.show_plans,
+    )
+
+def run_unattended(compressor: ImageCompressor, config: BatchConfig, args) -> int:
+    """Run from command-line flags only; returns the process exit code"""
+    if args.watch:
+        counts = compressor.watch(config, args.settle, max(1, args.queue_size), args.stats_interval)
+        return 1 if counts["failed"] else 0
+
+    results = compressor.run(config)
+    if not results:
+        compressor.display_found_images([])
+        return 1
+    return 1 if any(r.status == "failed" for r in results) else 0
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.quality is not None and not 1 <= args.quality <= 100:
+        print(f"{Colors.RED}❌ Quality must be between 1 and 100{Colors.ENDC}")
+        sys.exit(2)
+
     try:
+        # Resolve user supplied folders before leaving the caller's directory
+        # The defaults stay relative to the project directory
+        input_dir = (args.input if is_s3_url(args.input) else Path(args.input).resolve()) if args.input else './input'
+        output_dir = (args.output if is_s3_url(args.output) else Path(args.output).resolve()) if args.output else './output'
+        trace_path = str(Path(args.trace).resolve()) if args.trace else None
+        events_path = args.events if args.events in (None, '-') else str(Path(args.events).resolve())
+        config = config_from_args(args, input_dir, output_dir, trace_path, events_path)
+        if args.events == '-':
+            sys.stdout = sys.stderr  # stdout carries only the JSON lines (see JsonlSink)
+
         # Change to the project directory
         script_dir = Path(__file__).parent
         os.chdir(script_dir)
 
-        compressor = ImageCompressor()
+        compressor = ImageCompressor(workers=args.workers)
+        compressor._apply_config(config)
         compressor.print_header()
 
+        if args.serve is not None:
+            CompressionService(compressor, args.host, args.serve, max(0, args.queue_size)).serve_forever()
+            sys.exit(0)
+
+        if args.mode or args.yes or args.watch:
+            sys.exit(run_unattended(compressor, config, args))
+
         # Scan for images
         image_files = compressor.scan_input_folder()
         if not compressor.display_found_images(image_files):
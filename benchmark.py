@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Reproducible performance benchmark for the image processing pipeline.
+
+Generates a deterministic synthetic corpus (every supported input format, in
+RGB/RGBA/P/LA/L where the format can store it, with EXIF-rotated variants),
+runs every processing mode against every target format and reports
+images/sec, MB/sec, peak RSS and output-size ratio. Results can be saved as a
+baseline and later runs compared against it with a regression threshold.
+
+    python benchmark.py                              # quick run (thumb + medium)
+    python benchmark.py --sizes thumb,medium,large --save-baseline bench-baseline.json
+    python benchmark.py --baseline bench-baseline.json --threshold 0.1
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import PIL
+import psutil
+from PIL import Image, ImageChops
+
+from app import Colors, ImageCompressor, PROCESSING_MODES
+
+CORPUS_VERSION = 1
+SEED = 20240901
+
+# Name -> (width, height); near_max sits just under ImageCompressor.MAX_PIXELS
+SIZES = {
+    'thumb': (160, 120),
+    'medium': (1600, 1200),
+    'large': (4000, 3000),
+    'near_max': (8100, 6075),
+}
+DEFAULT_SIZES = ('thumb', 'medium')
+
+SOURCE_MODES = ('RGB', 'RGBA', 'P', 'LA', 'L')
+TARGET_FORMATS = ('.jpg', '.png', '.webp', '.bmp', '.tiff')
+EXIF_FORMATS = {'.jpg', '.jpeg', '.png', '.tiff', '.webp'}
+SAVE_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.bmp': 'BMP', '.tiff': 'TIFF', '.webp': 'WEBP'}
+QUALITY = 80
+
+def synthetic_image(mode: str, size, seed: int) -> Image.Image:
+    """Deterministic photo-like content: fractal detail, gradients and seeded grain"""
+    rng = random.Random(seed)
+    fractal = Image.effect_mandelbrot(size, (-2.1 + rng.random() * 0.2, -1.2, 0.7, 1.2), 96)
+    linear = Image.linear_gradient('L').resize(size)
+    radial = Image.radial_gradient('L').resize(size)
+    grain_tile = Image.frombytes('L', (64, 64), bytes(rng.getrandbits(8) for _ in range(64 * 64)))
+    grain = grain_tile.resize(size, Image.Resampling.BICUBIC)
+
+    rgb = Image.merge('RGB', (
+        ImageChops.add(fractal, grain, scale=2.0),
+        ImageChops.blend(linear, grain, 0.3),
+        ImageChops.multiply(ImageChops.invert(radial), fractal),
+    ))
+
+    if mode == 'RGB':
+        return rgb
+    if mode == 'L':
+        return rgb.convert('L')
+    if mode == 'P':
+        return rgb.quantize(256)
+    alpha = ImageChops.invert(radial)
+    if mode == 'RGBA':
+        rgba = rgb.copy()
+        rgba.putalpha(alpha)
+        return rgba
+    if mode == 'LA':
+        return Image.merge('LA', (rgb.convert('L'), alpha))
+    raise ValueError(f"Unsupported mode {mode}")
+
+def _save(img: Image.Image, path: Path, orientation: int = 1) -> bool:
+    """Save img to path; False if the format cannot store the mode as-is"""
+    ext = path.suffix.lower()
+    kwargs = {}
+    if ext in ('.jpg', '.jpeg', '.webp'):
+        kwargs['quality'] = 90
+    if orientation != 1:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        kwargs['exif'] = exif
+    try:
+        img.save(path, SAVE_FORMATS[ext], **kwargs)
+        with Image.open(path) as check:
+            if check.mode == img.mode:
+                return True
+    except (OSError, ValueError, KeyError):
+        pass
+    if path.exists():
+        path.unlink()
+    return False
+
+def _corpus_stamp(sizes, formats) -> dict:
+    return {'version': CORPUS_VERSION, 'seed': SEED, 'sizes': list(sizes), 'formats': sorted(formats)}
+
+def _clear_corpus(dest: Path):
+    """Delete the generated files in dest, leaving anything else there alone"""
+    for path in dest.iterdir():
+        if path.is_file() and (path.name == 'corpus.json' or path.name.split('-', 1)[0] in SIZES):
+            path.unlink()
+
+def generate_corpus(dest: Path, sizes, formats) -> list:
+    """Write the corpus into dest and return the file list.
+
+    Files that already exist are reused only when corpus.json records the
+    same generator version, seed, sizes and formats; otherwise (or when it
+    is missing, e.g. after an interrupted run) the corpus is rebuilt.
+    """
+    dest.mkdir(parents=True, exist_ok=True)
+    stamp_path = dest / 'corpus.json'
+    try:
+        stamp = json.loads(stamp_path.read_text())
+    except (OSError, ValueError):
+        stamp = None
+    if stamp != _corpus_stamp(sizes, formats):
+        _clear_corpus(dest)
+    files = []
+    for size_index, size_name in enumerate(sizes):
+        size = SIZES[size_name]
+        for mode_index, mode in enumerate(SOURCE_MODES):
+            img = None
+            for ext in sorted(formats):
+                path = dest / f"{size_name}-{mode}{ext}"
+                if not path.exists():
+                    img = img or synthetic_image(mode, size, SEED + size_index * 100 + mode_index)
+                    if not _save(img, path):
+                        continue
+                files.append(path)
+
+        # One EXIF-rotated variant per format that can carry the tag
+        rotated = None
+        for ext in sorted(formats & EXIF_FORMATS):
+            path = dest / f"{size_name}-RGB-rot6{ext}"
+            if not path.exists():
+                rotated = rotated or synthetic_image('RGB', size, SEED + size_index * 100 + 99)
+                if not _save(rotated, path, orientation=6):
+                    continue
+            files.append(path)
+
+    stamp_path.write_text(json.dumps(_corpus_stamp(sizes, formats)))
+    return sorted(files)
+
+class PeakRSS:
+    """Samples the RSS of this process and its pool workers in the background"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._process = psutil.Process()
+
+    def _sample(self):
+        rss = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak = max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+def run_case(compressor: ImageCompressor, infos, mode: str, target_ext, workdir: Path) -> dict:
+    """Process the whole corpus once with one mode/target combination"""
+    if workdir.exists():
+        shutil.rmtree(workdir)
+    workdir.mkdir(parents=True)
+
+    jobs = []
+    for info in infos:
+        source = Path(info.path)
+        ext = source.suffix.lower() if mode == "compress_only" else target_ext
+        jobs.append((info, workdir / f"{source.name}{ext}"))
+    quality = None if mode == "convert_only" else QUALITY
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        results = list(compressor._run_jobs(jobs, quality, mode))
+        elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r.status == "success"]
+    input_bytes = sum(r.original_size for r in ok)
+    output_bytes = sum(r.output_size for r in ok)
+    return {
+        'images': len(ok),
+        'failed': [f"{Path(r.input_path).name}: {r.error}" for r in results if r.status != "success"],
+        'seconds': elapsed,
+        'images_per_sec': len(ok) / elapsed if elapsed else 0.0,
+        'mb_per_sec': input_bytes / (1024 * 1024) / elapsed if elapsed else 0.0,
+        'peak_rss_mb': rss.peak / (1024 * 1024),
+        'size_ratio': output_bytes / input_bytes if input_bytes else 0.0,
+    }
+
+def failures(results: dict) -> list:
+    """Every corpus file that was rejected or failed to process, as "case: file: error" lines"""
+    return ([f"scan: {name}: rejected" for name in results.get('rejected', ())]
+            + [f"{case}: {failure}" for case, current in results['cases'].items() for failure in current['failed']])
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return human readable regressions of results against baseline; any failed image is one"""
+    regressions = failures(results)
+    for case, current in results['cases'].items():
+        base = baseline.get('cases', {}).get(case)
+        if not base:
+            continue
+        if base['images_per_sec'] and current['images_per_sec'] < base['images_per_sec'] * (1 - threshold):
+            regressions.append(f"{case}: throughput {base['images_per_sec']:.1f} → {current['images_per_sec']:.1f} img/s")
+        if base['peak_rss_mb'] and current['peak_rss_mb'] > base['peak_rss_mb'] * (1 + threshold):
+            regressions.append(f"{case}: peak RSS {base['peak_rss_mb']:.0f} → {current['peak_rss_mb']:.0f} MB")
+        if base['size_ratio'] and current['size_ratio'] > base['size_ratio'] * (1 + threshold):
+            regressions.append(f"{case}: output ratio {base['size_ratio']:.3f} → {current['size_ratio']:.3f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compress_image over a synthetic corpus")
+    parser.add_argument('--corpus', default='benchmark-corpus', help="corpus folder (default: ./benchmark-corpus)")
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help=f"comma separated sizes from {', '.join(SIZES)} (default: {','.join(DEFAULT_SIZES)})")
+    parser.add_argument('--regenerate', action='store_true', help="delete and rebuild the corpus")
+    parser.add_argument('--modes', default=','.join(PROCESSING_MODES), help="processing modes to run")
+    parser.add_argument('--targets', default=','.join(t.lstrip('.') for t in TARGET_FORMATS),
+                        help="target formats for converting modes")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes (default: 1 for stable numbers)")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per case; the fastest is kept")
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--baseline', help="compare against this results JSON")
+    parser.add_argument('--save-baseline', help="write results JSON as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="allowed relative regression before failing (default: 0.10)")
+    args = parser.parse_args()
+
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    targets = [f".{t.strip().lstrip('.')}" for t in args.targets.split(',') if t.strip()]
+
+    compressor = ImageCompressor(workers=args.workers)
+    corpus_dir = Path(args.corpus)
+    if args.regenerate and corpus_dir.exists():
+        shutil.rmtree(corpus_dir)
+
+    print(f"{Colors.BLUE}{Colors.BOLD}🧪 Generating corpus in {corpus_dir} ({', '.join(sizes)}){Colors.ENDC}")
+    files = generate_corpus(corpus_dir, sizes, set(compressor.supported_formats))
+    probed = [(path, compressor._validate_image_file(str(path))) for path in files]
+    infos = [info for _, info in probed if info]
+    print(f"   {len(infos)} images, {sum(i.file_size for i in infos) / (1024 * 1024):.1f} MB\n")
+
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpus': psutil.cpu_count(),
+            'workers': args.workers,
+        },
+        'corpus': dict(_corpus_stamp(sizes, compressor.supported_formats), images=len(infos)),
+        'cases': {},
+        'rejected': [path.name for path, info in probed if info is None],  # corpus files the scan refused
+    }
+
+    print(f"{'case':<32} {'img/s':>8} {'MB/s':>8} {'peak MB':>8} {'ratio':>7}")
+    with tempfile.TemporaryDirectory(prefix='mami-bench-') as tmp:
+        for mode in modes:
+            for target in ([None] if mode == "compress_only" else targets):
+                case = mode if target is None else f"{mode}→{target.lstrip('.')}"
+                runs = [run_case(compressor, infos, mode, target, Path(tmp) / 'out') for _ in range(max(1, args.repeat))]
+                best = max(runs, key=lambda r: r['images_per_sec'])
+                results['cases'][case] = best
+                print(f"{case:<32} {best['images_per_sec']:8.1f} {best['mb_per_sec']:8.1f} "
+                      f"{best['peak_rss_mb']:8.0f} {best['size_ratio']:7.3f}")
+                for failure in best['failed']:
+                    print(f"   {Colors.RED}❌ {failure}{Colors.ENDC}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get('corpus') != results['corpus']:
+            print(f"\n{Colors.YELLOW}⚠️  Baseline was recorded on a different corpus; comparison may be meaningless{Colors.ENDC}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{Colors.RED}{Colors.BOLD}📉 Regressions beyond {args.threshold:.0%} or failed images:{Colors.ENDC}")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"\n{Colors.GREEN}✅ No regressions beyond {args.threshold:.0%} against {args.baseline}{Colors.ENDC}")
+    elif failures(results):
+        # Numbers from a run that dropped images are not comparable to anything
+        print(f"\n{Colors.RED}{Colors.BOLD}❌ {len(failures(results))} image(s) failed; see the cases above{Colors.ENDC}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -60,6 +60,13 @@ setup(
             'black>=21.0',
             'flake8>=3.8',
             'pre-commit>=2.20',
+            'moto[s3]>=5.0',
+        ],
+        's3': [
+            'boto3>=1.20',
+        ],
+        'ssim': [
+            'numpy>=1.17',
         ],
     },
 
@@ -0,0 +1,65 @@
+"""Animated GIF/WebP are re-encoded frame by frame (see ImageCompressor._encode_animation)"""
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+import app
+
+
+def animation(fmt, mode, **options):
+    frames = []
+    for i in range(8):
+        img = Image.new(mode, (64, 48), (30, 60, 90, 0) if mode == 'RGBA' else (30, 60, 90))
+        ImageDraw.Draw(img).ellipse((i * 5, 10, i * 5 + 20, 30), fill=(255, 200, 0, 255) if mode == 'RGBA' else (255, 200, 0))
+        frames.append(img)
+    buffer = io.BytesIO()
+    frames[0].save(buffer, fmt, save_all=True, append_images=frames[1:], **options)
+    return buffer.getvalue()
+
+
+def frames(data):
+    with Image.open(io.BytesIO(data)) as img:
+        for index in range(img.n_frames):
+            img.seek(index)
+            frame = img.convert('RGBA')
+            yield frame, img.info.get('duration'), img.info.get('loop')
+
+
+def visible(frame):
+    """Pixels as displayed: colour only where at least half opaque"""
+    clear = Image.new('RGBA', frame.size)
+    clear.paste(frame, mask=frame.getchannel('A').point(lambda a: 255 if a >= 128 else 0))
+    return clear
+
+
+@pytest.mark.parametrize('source', [
+    ('GIF', 'RGB', {'duration': [40, 50, 60, 70, 80, 90, 100, 110], 'loop': 0}),
+    ('GIF', 'RGBA', {'duration': 80, 'loop': 3, 'disposal': 2}),
+    ('WEBP', 'RGBA', {'duration': 70, 'loop': 2, 'lossless': True}),
+])
+@pytest.mark.parametrize('output_ext', ['.gif', '.webp'])
+def test_frames_durations_and_loop_survive(source, output_ext):
+    fmt, mode, options = source
+    data = animation(fmt, mode, **options)
+    compressor = app.ImageCompressor(workers=1)
+    compressor.encode_threads = 3
+    encoded, ext, _ = compressor.compress_bytes(data, 90, "convert_only", output_ext)
+
+    expected, actual = list(frames(data)), list(frames(encoded))
+    assert ext == output_ext and len(actual) == len(expected) == 8
+    assert [d for _, d, _ in actual] == [d for _, d, _ in expected]
+    assert actual[0][2] == expected[0][2]
+    if output_ext == '.gif':
+        # Few colours: the palette is exact, so every displayed frame matches
+        for (want, _, _), (got, _, _) in zip(expected, actual):
+            assert visible(got).tobytes() == visible(want).tobytes()
+
+
+def test_other_formats_get_the_first_frame():
+    data = animation('GIF', 'RGB', duration=50, loop=0)
+    compressor = app.ImageCompressor(workers=1)
+    encoded, _, _ = compressor.compress_bytes(data, 90, "convert_only", ".png")
+    with Image.open(io.BytesIO(encoded)) as img:
+        assert not getattr(img, 'is_animated', False)
+    assert "8 frames → .png: first frame only" in compressor.plans_used
@@ -0,0 +1,75 @@
+"""Zip and tar inputs and outputs, read without unpacking to disk"""
+import io
+import tarfile
+import zipfile
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def png_bytes(seed):
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 24), (seed * 60, 120, 200)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def make_tar(path, names, mode):
+    with tarfile.open(path, mode) as tar:
+        for seed, name in enumerate(names):
+            data = png_bytes(seed)
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+NAMES = ["z.png", "a.png", "sub/m.png", "notes.txt"]
+
+
+@pytest.mark.parametrize('suffix, mode', [(".tar", "w"), (".tar.gz", "w:gz")])
+def test_tar_to_zip(tmp_path, suffix, mode):
+    source = tmp_path / f"in{suffix}"
+    make_tar(source, NAMES, mode)
+    results = app.ImageCompressor(workers=2).run(app.BatchConfig(
+        input_dir=source, output_dir=tmp_path / "out.zip", mode="convert_only", output_ext=".webp",
+        workers=2, progress="none"))
+    assert sorted(r.status for r in results) == ["success"] * 3
+    with zipfile.ZipFile(tmp_path / "out.zip") as archive:
+        assert sorted(archive.namelist()) == ["a-converted.webp", "sub/m-converted.webp", "z-converted.webp"]
+
+
+def test_zip_to_folder(tmp_path):
+    with zipfile.ZipFile(tmp_path / "in.zip", 'w') as archive:
+        for seed, name in enumerate(NAMES):
+            archive.writestr(name, png_bytes(seed))
+    results = app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in.zip", output_dir=tmp_path / "out", mode="compress_only", workers=1,
+        progress="none"))
+    assert [r.status for r in results] == ["success"] * 3
+    assert (tmp_path / "out" / "sub" / "m-compressed.png").exists()
+
+
+def test_plain_tar_workers_reuse_the_parent_listing(tmp_path):
+    make_tar(tmp_path / "in.tar", NAMES, "w")
+    parent = app.ArchiveReader(tmp_path / "in.tar")
+    assert not parent.sequential and list(parent.walk()) == sorted(NAMES)
+    worker = app.ArchiveReader(tmp_path / "in.tar", parent.listing)
+    assert worker.read("sub/m.png") == png_bytes(2)
+    assert worker.read("a.png", 8) == png_bytes(1)[:8]
+
+
+def test_compressed_tar_is_streamed_once_in_archive_order(tmp_path, monkeypatch):
+    make_tar(tmp_path / "in.tgz", NAMES, "w:gz")
+    reader = app.ArchiveReader(tmp_path / "in.tgz")
+    assert reader.sequential and list(reader.walk()) == NAMES
+    assert reader.listing is None
+
+    opened = []
+    real_open = tarfile.open
+    monkeypatch.setattr(app.tarfile, 'open', lambda *args: opened.append(args) or real_open(*args))
+    assert [reader.read(name) for name in NAMES[:3]] == [png_bytes(0), png_bytes(1), png_bytes(2)]
+    assert len(opened) == 1
+    assert reader.read("z.png") == png_bytes(0)  # an earlier member restarts the stream
+    assert len(opened) == 2
+    reader.close()
@@ -0,0 +1,64 @@
+"""The unattended command line and the importable batch API"""
+import pytest
+from PIL import Image
+
+import app
+
+
+def make_inputs(folder, count=3):
+    folder.mkdir()
+    for index in range(count):
+        Image.new('RGB', (30, 20), (index * 80, 40, 90)).save(folder / f"img{index}.png")
+
+
+def test_main_runs_unattended(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # main changes to the project folder; restore it afterwards
+    make_inputs(tmp_path / "in")
+    with pytest.raises(SystemExit) as exit_info:
+        app.main(["-i", str(tmp_path / "in"), "-o", str(tmp_path / "out"), "-m", "convert_only", "-f", "webp",
+                  "--workers", "1", "--progress", "none"])
+    assert exit_info.value.code == 0
+    assert sorted(p.name for p in (tmp_path / "out").iterdir() if not p.name.startswith('.')) == [
+        "img0-converted.webp", "img1-converted.webp", "img2-converted.webp"]
+
+
+def test_main_fails_on_a_missing_input(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit) as exit_info:
+        app.main(["-i", str(tmp_path / "missing"), "-o", str(tmp_path / "out"), "-m", "compress_only"])
+    assert exit_info.value.code == 1
+
+
+def test_flags_are_applied_once_through_the_config():
+    args = app.build_arg_parser().parse_args(["--prune-orphans", "--dedupe-similar", "4", "--trace", "t.jsonl",
+                                              "--show-plans"])
+    config = app.config_from_args(args, "in", "out", "t.jsonl", None)
+    assert (config.incremental, config.dedupe, config.instrument, config.show_plans) == (True, True, True, True)
+    # Without --mode or --yes the run is interactive: conflicts are asked about and every file is reported
+    assert (config.on_conflict, config.progress) == ("ask", "files")
+
+    compressor = app.ImageCompressor(workers=1)
+    compressor._apply_config(config)
+    assert (compressor.incremental, compressor.dedupe_distance, compressor.show_plans) == (True, 4, True)
+
+    args = app.build_arg_parser().parse_args(["-y"])
+    config = app.config_from_args(args, "in", "out", None, None)
+    assert (config.on_conflict, config.progress) == ("rename", "auto")
+
+
+@pytest.mark.parametrize('fields, message', [
+    ({'mode': 'shrink'}, "Unknown mode"),
+    ({'mode': 'compress_only', 'quality': 0}, "Quality"),
+    ({'target_size': 1000, 'min_ssim': 0.9, 'mode': 'compress_only'}, "either"),
+    ({'incremental': True, 'output_dir': 'web.zip'}, "Incremental"),
+])
+def test_batch_config_rejects_bad_settings(fields, message):
+    with pytest.raises(ValueError, match=message):
+        app.BatchConfig(**fields)
+
+
+def test_run_returns_a_result_per_input(tmp_path):
+    make_inputs(tmp_path / "in")
+    results = app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="compress_only", quality=60, progress="none"))
+    assert sorted((r.status, r.output_path.endswith("-compressed.png")) for r in results) == [("success", True)] * 3
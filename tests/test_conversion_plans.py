@@ -0,0 +1,78 @@
+"""plan_conversion must reproduce the step-by-step conversion chain it replaced"""
+import itertools
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def flatten(img):
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    if img.mode == 'RGBA':
+        background.paste(img, mask=img.split()[-1])
+    else:
+        background.paste(img.convert('RGB'), mask=img.split()[-1])
+    return background
+
+
+def legacy_convert_format_only(img, target_ext):
+    if target_ext in ('.jpg', '.jpeg', '.bmp'):
+        if img.mode in ('RGBA', 'LA'):
+            return flatten(img)
+        if img.mode == 'P':
+            return img.convert('RGB')
+    elif target_ext == '.png':
+        if img.mode == 'P' and 'transparency' in img.info:
+            return img.convert('RGBA')
+    elif target_ext == '.webp':
+        if img.mode not in ('RGB', 'RGBA', 'L'):
+            if img.mode == 'P':
+                return img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+            return img.convert('RGB')
+    return img
+
+
+def legacy_compress_quality_only(img, format_ext):
+    if format_ext in ('.jpg', '.jpeg', '.webp') and img.mode not in ('RGB', 'L'):
+        if img.mode in ('RGBA', 'LA'):
+            return flatten(img)
+        return img.convert('RGB')
+    return img
+
+
+def legacy_apply_mode(img, input_ext, output_ext, mode):
+    if mode == "convert_only":
+        return legacy_convert_format_only(img, output_ext)
+    if mode == "compress_only":
+        return legacy_compress_quality_only(img, output_ext)
+    if mode == "convert_compress":
+        return legacy_compress_quality_only(legacy_convert_format_only(img, output_ext), output_ext)
+    return legacy_convert_format_only(legacy_compress_quality_only(img, input_ext), output_ext)
+
+
+def sample(kind):
+    rgba = Image.effect_noise((23, 17), 80).convert('RGB')
+    rgba.putalpha(Image.effect_noise((23, 17), 120).convert('L'))
+    if kind == 'P+transparency':
+        img = rgba.convert('RGB').quantize(16)
+        img.info['transparency'] = 3
+        return img
+    if kind == 'P':
+        return rgba.convert('RGB').quantize(16)
+    return rgba.convert(kind)
+
+
+EXTS = ('.jpg', '.png', '.webp', '.bmp', '.tiff')
+
+
+@pytest.mark.parametrize('kind', ['RGB', 'RGBA', 'L', 'LA', 'P', 'P+transparency', 'CMYK'])
+@pytest.mark.parametrize('mode', list(app.PROCESSING_MODES))
+def test_plans_match_the_legacy_chain(kind, mode):
+    img = sample(kind)
+    for input_ext, output_ext in itertools.product(EXTS, EXTS):
+        plan = app.plan_conversion(img.mode, 'transparency' in img.info, input_ext, output_ext, mode)
+        expected = legacy_apply_mode(img, input_ext, output_ext, mode)
+        actual = plan.apply(img)
+        assert actual.mode == expected.mode, plan
+        assert actual.tobytes() == expected.tobytes(), plan
@@ -0,0 +1,48 @@
+"""ImageCompressor.find_duplicates (--dedupe and --dedupe-similar)"""
+import shutil
+
+from PIL import Image, ImageEnhance
+
+import app
+
+
+def infos(paths):
+    result = []
+    for path in paths:
+        with Image.open(path) as img:
+            result.append(app.ImageInfo(str(path), path.stat().st_size, path.stat().st_mtime_ns, *img.size,
+                                        format=img.format, mode=img.mode))
+    return result
+
+
+def test_exact_duplicates_point_at_the_first_copy(tmp_path):
+    original = tmp_path / "a.png"
+    Image.effect_noise((64, 48), 50).convert('RGB').save(original)
+    shutil.copy(original, tmp_path / "b.png")
+    shutil.copy(original, tmp_path / "c.png")
+    # Same size, different content: must not match
+    other = Image.open(original).transpose(Image.FLIP_LEFT_RIGHT)
+    other.save(tmp_path / "d.png")
+
+    compressor = app.ImageCompressor(workers=1)
+    files = infos(sorted(tmp_path.iterdir()))
+    duplicates = compressor.find_duplicates(files)
+    assert duplicates == {str(tmp_path / "b.png"): str(original), str(tmp_path / "c.png"): str(original)}
+    assert files[0].content_hash == app.hash_file(original)
+
+
+def test_near_duplicates_need_a_distance(tmp_path):
+    img = Image.new('RGB', (128, 96))
+    img.paste((200, 40, 40), (0, 0, 64, 96))
+    img.paste((40, 40, 200), (64, 0, 128, 96))
+    img.save(tmp_path / "a.jpg", quality=95)
+    img.save(tmp_path / "b.jpg", quality=70)
+    ImageEnhance.Brightness(img).enhance(0.3).save(tmp_path / "dark.jpg", quality=95)
+
+    compressor = app.ImageCompressor(workers=1)
+    files = infos(sorted(tmp_path.iterdir()))
+    assert compressor.find_duplicates(files) == {}
+
+    compressor.dedupe_distance = 8
+    # The largest file of the cluster is the one encoded; colour keeps the darker copy apart
+    assert compressor.find_duplicates(files) == {str(tmp_path / "b.jpg"): str(tmp_path / "a.jpg")}
@@ -0,0 +1,47 @@
+"""Fan-out: several formats and widths written from one decode"""
+import pytest
+from PIL import Image
+
+import app
+
+
+def run(tmp_path, **fields):
+    (tmp_path / "in").mkdir()
+    Image.linear_gradient('L').resize((1000, 500)).convert('RGB').save(tmp_path / "in" / "a.png")
+    return app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="compress_convert", workers=1,
+        progress="none", **fields))
+
+
+def test_every_format_and_width_is_written(tmp_path, monkeypatch):
+    opened = []
+    real_open = app.open_image
+    monkeypatch.setattr(app, 'open_image', lambda path: opened.append(path) or real_open(path))
+
+    results = run(tmp_path, variant_formats=["jpg", "webp"], variant_widths=[1600, 800, 400])
+    assert [r.status for r in results] == ["success"]
+    variants = {(v['format'], v['width']): v for v in results[0].variants}
+    assert sorted(variants) == [(ext, width) for ext in (".jpg", ".webp") for width in (400, 800, 1600)]
+
+    expected = {1600: (1000, 500), 800: (800, 400), 400: (400, 200)}  # never upscaled
+    for (ext, width), variant in variants.items():
+        assert variant['path'] == str(tmp_path / "out" / f"a-compressed-{width}w{ext}")
+        with Image.open(variant['path']) as img:
+            assert (img.format, img.size) == ({".jpg": "JPEG", ".webp": "WEBP"}[ext], expected[width])
+    assert len(opened) == 2  # the scan's header probe, then one decode for all six outputs
+
+
+def test_formats_only_keep_the_original_size_and_name(tmp_path):
+    results = run(tmp_path, variant_formats=["png", "webp"])
+    assert sorted(v['path'] for v in results[0].variants) == [
+        str(tmp_path / "out" / "a-compressed.png"), str(tmp_path / "out" / "a-compressed.webp")]
+
+
+@pytest.mark.parametrize('fields', [
+    {'variant_widths': [0]},
+    {'variant_formats': ["webp"], 'mode': "compress_only"},
+    {'variant_formats': ["webp"], 'incremental': True},
+])
+def test_invalid_fan_out_is_rejected(fields):
+    with pytest.raises(ValueError):
+        app.BatchConfig(**fields)
@@ -0,0 +1,60 @@
+"""Incremental runs: the build manifest skips inputs whose output is up to date"""
+import json
+import os
+
+from PIL import Image
+
+import app
+
+
+def make_inputs(folder):
+    (folder / "sub").mkdir(parents=True)
+    Image.new('RGB', (30, 20), 'red').save(folder / "a.png")
+    Image.new('RGB', (30, 20), 'green').save(folder / "sub" / "b.png")
+
+
+def run(tmp_path, **fields):
+    fields = dict(dict(mode="compress_convert", output_ext=".webp", quality=80, incremental=True, workers=1,
+                       progress="none"), **fields)
+    results = app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", **fields))
+    return {os.path.relpath(r.input_path, tmp_path / "in"): r.status for r in results}
+
+
+def test_unchanged_inputs_are_skipped(tmp_path):
+    make_inputs(tmp_path / "in")
+    assert run(tmp_path) == {"a.png": "success", "sub/b.png": "success"}
+    manifest = json.loads((tmp_path / "out" / app.BuildManifest.FILENAME).read_text())
+    assert sorted(manifest['entries']) == ["a.png", "sub/b.png"]
+    assert manifest['entries']["sub/b.png"]['output'] == "sub/b-compressed.webp"
+
+    assert run(tmp_path) == {"a.png": "unchanged", "sub/b.png": "unchanged"}
+
+
+def test_changed_content_settings_or_outputs_are_redone(tmp_path):
+    make_inputs(tmp_path / "in")
+    run(tmp_path)
+
+    # Touched but identical: the content hash still matches
+    os.utime(tmp_path / "in" / "a.png", ns=(10**18, 10**18))
+    assert run(tmp_path) == {"a.png": "unchanged", "sub/b.png": "unchanged"}
+
+    Image.new('RGB', (30, 20), 'blue').save(tmp_path / "in" / "a.png")
+    assert run(tmp_path) == {"a.png": "success", "sub/b.png": "unchanged"}
+
+    (tmp_path / "out" / "sub" / "b-compressed.webp").unlink()
+    assert run(tmp_path) == {"a.png": "unchanged", "sub/b.png": "success"}
+
+    assert run(tmp_path, quality=60) == {"a.png": "success", "sub/b.png": "success"}
+
+
+def test_prune_orphans_removes_outputs_of_deleted_inputs(tmp_path):
+    make_inputs(tmp_path / "in")
+    run(tmp_path)
+    (tmp_path / "in" / "sub" / "b.png").unlink()
+
+    assert run(tmp_path, prune_orphans=True) == {"a.png": "unchanged"}
+    assert not (tmp_path / "out" / "sub" / "b-compressed.webp").exists()
+    assert (tmp_path / "out" / "a-compressed.webp").exists()
+    manifest = json.loads((tmp_path / "out" / app.BuildManifest.FILENAME).read_text())
+    assert sorted(manifest['entries']) == ["a.png"]
@@ -0,0 +1,45 @@
+"""Per-stage timings, the JSONL trace and cProfile sampling"""
+import json
+
+from PIL import Image
+
+import app
+
+
+def make_inputs(folder, count=4):
+    folder.mkdir()
+    for index in range(count):
+        Image.new('RGB', (50, 40), (index * 50, 100, 100)).save(folder / f"img{index}.png")
+
+
+def test_trace_records_stage_timings_per_file(tmp_path, capsys):
+    make_inputs(tmp_path / "in")
+    trace = tmp_path / "trace.jsonl"
+    results = app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="compress_convert", output_ext=".jpg",
+        workers=1, progress="none", trace_path=str(trace)))
+    assert all(r.stats for r in results)
+
+    lines = [json.loads(line) for line in trace.read_text().splitlines()]
+    assert len(lines) == 4
+    for line in lines:
+        assert line['status'] == "success"
+        assert {'decode', 'encode', 'write'} <= set(line['stages'])
+        assert all(stage['wall'] >= 0 and stage['cpu'] >= 0 for stage in line['stages'].values())
+    assert "Stage timings (4 files, ms per file)" in capsys.readouterr().out
+
+
+def test_timings_are_off_by_default(tmp_path):
+    make_inputs(tmp_path / "in", 1)
+    results = app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="compress_only", progress="none"))
+    assert results[0].stats is None
+
+
+def test_profile_samples_are_merged_into_one_dump(tmp_path, capsys):
+    make_inputs(tmp_path / "in")
+    app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="compress_only", workers=1,
+        progress="none", profile_samples=2))
+    assert (tmp_path / "out" / ".mami-profile.prof").exists()
+    assert "cProfile of 2 sampled file(s)" in capsys.readouterr().out
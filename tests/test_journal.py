@@ -0,0 +1,85 @@
+"""JobJournal and --resume (see ImageCompressor._resume_from)"""
+import json
+
+import pytest
+from PIL import Image
+
+import app
+
+SETTINGS = {'mode': 'convert_only', 'quality': None}
+
+
+def make_inputs(folder, count):
+    folder.mkdir()
+    for i in range(count):
+        Image.effect_noise((40, 30), 60).convert('RGB').save(folder / f"n{i:02d}.png")
+
+
+def batch(tmp_path, **options):
+    return app.BatchConfig(input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="convert_only",
+                           output_ext=".webp", workers=1, progress="none", **options)
+
+
+def test_replay_skips_a_torn_last_line(tmp_path):
+    output = tmp_path / "out.webp"
+    output.write_bytes(b"x" * 10)
+    info = app.ImageInfo(str(tmp_path / "in.png"), 100, 5)
+    journal = app.JobJournal(tmp_path)
+    journal.open(SETTINGS)
+    journal.plan([output, tmp_path / "other.webp"])
+    journal.record("in.png", info, app.FileResult(info.path, str(output), "success", 100, 10))
+    journal.close()
+    with open(journal.path, 'ab') as file:
+        file.write(b'{"input": "oth')
+
+    resumed = app.JobJournal(tmp_path)
+    resumed.open(SETTINGS, resume=True)
+    assert resumed.planned == {"out.webp", "other.webp"}
+    assert resumed.lookup("in.png", info)['outputs'] == [["out.webp", 10]]
+    # A changed input or a damaged output is redone
+    assert resumed.lookup("in.png", app.ImageInfo(info.path, 101, 5)) is None
+    output.write_bytes(b"x")
+    assert resumed.lookup("in.png", info) is None
+
+    # Lines appended after the torn one stay readable
+    other = app.ImageInfo(str(tmp_path / "other.png"), 50, 6)
+    resumed.record("other.png", other, app.FileResult(other.path, str(tmp_path / "other.webp"), "failed", 50))
+    resumed.close()
+    assert json.loads(journal.path.read_bytes().splitlines()[-1])['input'] == "other.png"
+    replayed = app.JobJournal(tmp_path)
+    replayed.open(SETTINGS, resume=True)
+    replayed.close()
+    assert set(replayed.done) == {"in.png"}
+
+
+def test_resume_refuses_other_settings(tmp_path):
+    journal = app.JobJournal(tmp_path)
+    journal.open(SETTINGS)
+    journal.close()
+    with pytest.raises(ValueError):
+        app.JobJournal(tmp_path).open(dict(SETTINGS, quality=80), resume=True)
+
+
+def test_resume_finishes_an_interrupted_batch(tmp_path):
+    make_inputs(tmp_path / "in", 6)
+    first = app.ImageCompressor(workers=1).run(batch(tmp_path))
+    assert [r.status for r in first] == ["success"] * 6
+
+    # Forget the last two inputs as if the run had been killed while writing them
+    out = tmp_path / "out"
+    journal = out / app.JobJournal.FILENAME
+    lines = journal.read_bytes().splitlines()
+    journal.write_bytes(b"\n".join(lines[:-2]) + b"\n" + lines[-2][:20])
+    lost = sorted(out.glob("*.webp"))[-2:]
+    lost[0].unlink()
+    stale = out / f".{lost[0].name}.4242.tmp"
+    stale.write_bytes(b"partial")
+    unrelated = out / ".someone-else.webp.4242.tmp"
+    unrelated.write_bytes(b"in progress")
+
+    results = app.ImageCompressor(workers=1).run(batch(tmp_path, resume=True))
+    assert sorted(r.status for r in results) == ["resumed"] * 4 + ["success"] * 2
+    # The interrupted run's names are reused instead of numbered around
+    assert sorted(p.name for p in out.glob("*.webp")) == [f"n{i:02d}-converted.webp" for i in range(6)]
+    assert not stale.exists()
+    assert unrelated.exists()
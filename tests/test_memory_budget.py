@@ -0,0 +1,62 @@
+"""Memory-aware admission: jobs only start while their estimates fit the budget"""
+from collections import namedtuple
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+import app
+
+Memory = namedtuple('Memory', 'available')
+
+
+class Recorder:
+    def __init__(self):
+        self.log = []
+
+    def emit(self, event, result=None):
+        self.log.append(('start', Path(event['input']).name))
+
+    def close(self):
+        pass
+
+
+def start_order(tmp_path, monkeypatch, available):
+    (tmp_path / "in").mkdir(exist_ok=True)
+    sizes = {"small.png": (40, 30), "large.png": (400, 300), "medium.png": (200, 150)}
+    for name, size in sizes.items():
+        Image.new('RGB', size, 'white').save(tmp_path / "in" / name)
+    monkeypatch.setattr(app.psutil, 'virtual_memory', lambda: Memory(available))
+
+    compressor = app.ImageCompressor(workers=2)
+    compressor._apply_config(app.BatchConfig(input_dir=tmp_path / "in", output_dir=tmp_path / "out",
+                                             workers=2, progress="none"))
+    (tmp_path / "out").mkdir(exist_ok=True)
+    jobs = [(info, tmp_path / "out" / Path(info.path).name) for info in compressor.iter_input_files()]
+    recorder = Recorder()
+    compressor.events = app.ProgressEvents([recorder])
+    for result in compressor._run_jobs(jobs, 80, "compress_only"):
+        assert result.status == "success"
+        recorder.log.append(('done', Path(result.input_path).name))
+    return recorder.log
+
+
+def test_largest_jobs_start_first(tmp_path, monkeypatch):
+    log = start_order(tmp_path, monkeypatch, available=1 << 40)
+    assert [name for kind, name in log if kind == 'start'] == ["large.png", "medium.png", "small.png"]
+    assert [kind for kind, _ in log[:2]] == ['start', 'start']  # room for two at once
+
+
+def test_a_job_over_budget_runs_alone(tmp_path, monkeypatch):
+    log = start_order(tmp_path, monkeypatch, available=1)
+    assert [kind for kind, _ in log] == ['start', 'done'] * 3
+
+
+def test_estimates_grow_with_pixels():
+    compressor = app.ImageCompressor(workers=1)
+    small = app.ImageInfo("a.png", 1000, 0, 100, 100, "PNG", "RGB", valid=True)
+    large = app.ImageInfo("b.png", 1000, 0, 1000, 1000, "PNG", "RGB", valid=True)
+    assert compressor.estimate_job_memory(large, ".jpg") - compressor.estimate_job_memory(small, ".jpg") \
+        >= (1000 * 1000 - 100 * 100) * 4
+    with pytest.raises(ValueError):
+        app.BatchConfig(memory_fraction=0)
@@ -0,0 +1,65 @@
+"""Sources kept by never-larger carry no private metadata (see strip_metadata)"""
+import io
+
+import pytest
+from PIL import Image, PngImagePlugin
+
+import app
+
+
+def exif(**tags):
+    data = Image.Exif()
+    data[0x010F] = 'SecretCam'
+    data[0x8825] = {1: 'N', 2: (52.0, 1.0, 3.0)}
+    for tag, value in tags.items():
+        data[int(tag[1:])] = value
+    return data
+
+
+def encoded(fmt, **options):
+    buffer = io.BytesIO()
+    img = Image.effect_noise((48, 32), 40).convert('RGB')
+    (img.quantize(8) if fmt in ('PNG', 'GIF') else img).save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('fmt,options', [
+    ('JPEG', {'exif': exif(), 'comment': b'SecretNote', 'icc_profile': b'\0' * 128}),
+    ('PNG', {'exif': exif(), 'pnginfo': PngImagePlugin.PngInfo()}),
+    ('WEBP', {'exif': exif(), 'xmp': b'<x>SecretNote</x>'}),
+    ('GIF', {'comment': b'SecretNote'}),
+])
+def test_strip_metadata_is_lossless_and_private(fmt, options):
+    if 'pnginfo' in options:
+        options['pnginfo'].add_text('Author', 'SecretNote')
+    data = encoded(fmt, **options)
+    stripped = app.strip_metadata(data)
+
+    assert b'Secret' in data and b'Secret' not in stripped
+    with Image.open(io.BytesIO(data)) as before, Image.open(io.BytesIO(stripped)) as after:
+        assert after.format == before.format
+        assert after.convert('RGB').tobytes() == before.convert('RGB').tobytes()
+        assert after.info.get('icc_profile') == before.info.get('icc_profile')
+
+
+def test_tiff_with_private_tags_is_not_kept():
+    assert app.strip_metadata(encoded('TIFF')) is not None
+    assert app.strip_metadata(encoded('TIFF', tiffinfo={700: b'<x/>'})) is None
+
+
+def test_kept_jpeg_loses_its_exif():
+    data = encoded('JPEG', quality=30, exif=exif())
+    compressor = app.ImageCompressor(workers=1)
+    output, _, _ = compressor.compress_bytes(data, 90, "compress_only")
+    assert compressor.kept_source and b'SecretCam' not in output
+    with Image.open(io.BytesIO(output)) as img:
+        assert not img.getexif()
+
+
+def test_rotated_sources_are_re_encoded_upright():
+    data = encoded('JPEG', quality=30, exif=exif(t274=6))
+    compressor = app.ImageCompressor(workers=1)
+    output, _, _ = compressor.compress_bytes(data, 90, "compress_only")
+    assert compressor.kept_source is None
+    with Image.open(io.BytesIO(output)) as img:
+        assert img.size == (32, 48)
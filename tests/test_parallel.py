@@ -0,0 +1,40 @@
+"""The worker pool: every input gets a result, whatever happens to the others"""
+from pathlib import Path
+
+from PIL import Image
+
+import app
+
+
+def make_inputs(folder, count=6):
+    folder.mkdir()
+    for index in range(count):
+        Image.linear_gradient('L').resize((64 + index * 8, 48)).convert('RGB').save(folder / f"img{index}.png")
+
+
+def run(tmp_path, workers, output):
+    return app.ImageCompressor(workers=workers).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / output, mode="compress_convert", output_ext=".jpg",
+        quality=70, workers=workers, progress="none"))
+
+
+def test_pool_writes_the_same_outputs_as_one_worker(tmp_path):
+    make_inputs(tmp_path / "in")
+    serial = run(tmp_path, 1, "serial")
+    parallel = run(tmp_path, 3, "parallel")
+    assert [r.status for r in parallel] == ["success"] * 6
+    assert sorted(r.input_path for r in parallel) == sorted(r.input_path for r in serial)
+    for name in (f"img{index}-compressed.jpg" for index in range(6)):
+        assert (tmp_path / "parallel" / name).read_bytes() == (tmp_path / "serial" / name).read_bytes()
+
+
+def test_a_failing_input_does_not_stop_the_batch(tmp_path):
+    make_inputs(tmp_path / "in", 4)
+    # A valid header followed by a truncated image stream only fails once a worker decodes it
+    data = (tmp_path / "in" / "img0.png").read_bytes()
+    (tmp_path / "in" / "img0.png").write_bytes(data[:len(data) // 2])
+
+    results = run(tmp_path, 2, "out")
+    statuses = {Path(r.input_path).name: r.status for r in results}
+    assert statuses == {"img0.png": "failed", "img1.png": "success", "img2.png": "success", "img3.png": "success"}
+    assert not (tmp_path / "out" / "img0-compressed.jpg").exists()
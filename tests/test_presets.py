@@ -0,0 +1,64 @@
+"""Encoder presets and the auto-tuner that picks one from sample encodes"""
+import io
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def photo():
+    return Image.effect_mandelbrot((200, 150), (-2.1, -1.2, 0.7, 1.2), 64).convert('RGB')
+
+
+def encode(preset, output_ext):
+    compressor = app.ImageCompressor(workers=1)
+    compressor.encoder_preset = preset
+    return compressor._encode_image(photo(), output_ext, 80)
+
+
+def test_presets_choose_the_encoder_settings():
+    assert len(encode('smallest', '.png')) <= len(encode('balanced', '.png')) < len(encode('fast', '.png'))
+    with Image.open(io.BytesIO(encode('fast', '.jpg'))) as img:
+        assert not img.info.get('progressive')
+    with Image.open(io.BytesIO(encode('balanced', '.jpg'))) as img:
+        assert img.info.get('progressive')
+    with Image.open(io.BytesIO(encode('smallest', '.tiff'))) as img:
+        assert img.info['compression'] == 'tiff_adobe_deflate'
+
+
+def make_batch(tmp_path, count=4):
+    (tmp_path / "in").mkdir()
+    for index in range(count):
+        photo().rotate(index * 90).save(tmp_path / "in" / f"img{index}.png")
+    compressor = app.ImageCompressor(workers=1)
+    compressor._apply_config(app.BatchConfig(input_dir=tmp_path / "in", output_dir=tmp_path / "out",
+                                             mode="compress_convert", output_ext=".png", progress="none",
+                                             tune_samples=3))
+    (tmp_path / "out").mkdir()
+    jobs = [(info, tmp_path / "out" / f"{index}.png") for index, info in enumerate(compressor.iter_input_files())]
+    return compressor, jobs
+
+
+def test_auto_tune_measures_every_preset_on_a_sample(tmp_path):
+    compressor, jobs = make_batch(tmp_path)
+    # Any throughput is enough, so the smallest output wins
+    compressor.tune_throughput = 1e-9
+    tuning = compressor._auto_tune(jobs, 80, "compress_convert")
+    assert tuning['samples'] == 3 and sorted(tuning['candidates']) == sorted(app.ENCODER_PRESETS)
+    sizes = {name: stats['bytes'] for name, stats in tuning['candidates'].items()}
+    assert sizes[tuning['preset']] == min(sizes.values())
+    assert compressor.encoder_preset == "balanced"  # the trial encodes leave the configured preset alone
+
+
+def test_size_slack_allows_a_faster_preset(tmp_path):
+    compressor, jobs = make_batch(tmp_path)
+    compressor.tune_size_slack = 100.0
+    tuning = compressor._auto_tune(jobs, 80, "compress_convert")
+    seconds = {name: stats['ms_per_image'] for name, stats in tuning['candidates'].items()}
+    assert seconds[tuning['preset']] == min(seconds.values())
+
+
+def test_unknown_presets_are_rejected():
+    with pytest.raises(ValueError, match="preset"):
+        app.BatchConfig(encoder_preset="tiny")
@@ -0,0 +1,43 @@
+"""Progress rendering and the JSONL event log"""
+import io
+import json
+
+import pytest
+from PIL import Image
+
+import app
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+@pytest.mark.parametrize('stdout, sink', [(Terminal(), app.TerminalProgress), (io.StringIO(), app.FileLinesSink)])
+def test_auto_progress_follows_the_terminal(monkeypatch, stdout, sink):
+    monkeypatch.setattr('sys.stdout', stdout)
+    compressor = app.ImageCompressor(workers=1)
+    compressor.progress_mode = "auto"
+    events = compressor.open_progress()
+    assert [type(s) for s in events.sinks] == [sink]
+
+
+def test_interactive_runs_report_each_file():
+    assert app.ImageCompressor(workers=1).progress_mode == "files"
+
+
+def test_event_log_records_every_input(tmp_path):
+    (tmp_path / "in").mkdir()
+    for name in ("a.png", "b.png"):
+        Image.new('RGB', (20, 20), 'red').save(tmp_path / "in" / name)
+    (tmp_path / "in" / "broken.png").write_bytes(b"not an image")
+    log = tmp_path / "events.jsonl"
+    app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="compress_only", workers=1,
+        progress="none", events_path=str(log)))
+
+    events = [json.loads(line) for line in log.read_text().splitlines()]
+    assert events[0]['event'] == "batch_started" and events[-1]['event'] == "batch_finished"
+    started = [e['input'] for e in events if e['event'] == "started"]
+    finished = [e['input'] for e in events if e['event'] == "finished"]
+    assert sorted(started) == sorted(finished) == [str(tmp_path / "in" / n) for n in ("a.png", "b.png")]
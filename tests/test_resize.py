@@ -0,0 +1,59 @@
+"""Max-dimension and scale resizing, with reduced-resolution JPEG decoding"""
+import io
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def encoded(size, fmt='JPEG', orientation=1):
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    Image.linear_gradient('L').resize(size).convert('RGB').save(buffer, fmt, exif=exif)
+    return buffer.getvalue()
+
+
+def output_size(compressor, data, output_ext=".png"):
+    out, _, _ = compressor.compress_bytes(data, 80, "compress_convert", output_ext)
+    with Image.open(io.BytesIO(out)) as img:
+        return img.size
+
+
+@pytest.mark.parametrize('bounds, expected', [
+    ({'max_width': 400}, (400, 300)),
+    ({'max_height': 150}, (200, 150)),
+    ({'max_width': 400, 'max_height': 100}, (133, 100)),
+    ({'scale': 0.25}, (400, 300)),
+    ({'max_width': 4000}, (1600, 1200)),  # never upscaled
+])
+def test_outputs_fit_the_bounds(bounds, expected):
+    compressor = app.ImageCompressor(workers=1)
+    for name, value in bounds.items():
+        setattr(compressor, name, value)
+    assert output_size(compressor, encoded((1600, 1200))) == expected
+
+
+def test_bounds_apply_to_the_upright_image():
+    compressor = app.ImageCompressor(workers=1)
+    compressor.max_width = 300
+    # Stored landscape, shown portrait (EXIF orientation 6)
+    assert output_size(compressor, encoded((1600, 1200), orientation=6)) == (300, 400)
+
+
+def test_jpegs_shrinking_a_lot_are_decoded_at_reduced_resolution(monkeypatch):
+    data = encoded((1600, 1200))
+    decoded = []
+    real_load = Image.Image.load
+
+    def load(img):
+        pixels = real_load(img)
+        decoded.append(img.size)
+        return pixels
+    monkeypatch.setattr(app.Image.Image, 'load', load)
+
+    compressor = app.ImageCompressor(workers=1)
+    compressor.max_width = 200
+    assert output_size(compressor, data) == (200, 150)
+    assert max(decoded) == (200, 150)  # libjpeg scaled the DCT by 1/8; no full-size bitmap
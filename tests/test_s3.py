@@ -0,0 +1,67 @@
+"""s3:// inputs and outputs against moto's in-memory S3 (needs the s3 extra and moto)"""
+import io
+
+import pytest
+from PIL import Image
+
+import app
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    pytest.importorskip('boto3')
+    moto = pytest.importorskip('moto')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    import boto3
+    with moto.mock_aws():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket='images')
+        yield client
+
+
+def test_folder_to_s3_and_back(tmp_path, bucket):
+    (tmp_path / "in" / "sub").mkdir(parents=True)
+    Image.effect_noise((40, 30), 60).convert('RGB').save(tmp_path / "in" / "a.png")
+    Image.effect_noise((40, 30), 60).convert('RGB').save(tmp_path / "in" / "sub" / "b.png")
+
+    results = app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir="s3://images/web", mode="convert_only", output_ext=".webp",
+        workers=1, progress="none"))
+    assert [r.status for r in results] == ["success"] * 2
+    keys = sorted(item['Key'] for item in bucket.list_objects_v2(Bucket='images')['Contents'])
+    assert keys == ["web/a-converted.webp", "web/sub/b-converted.webp"]
+
+    results = app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir="s3://images/web", output_dir=tmp_path / "out", mode="convert_only", output_ext=".png",
+        workers=1, progress="none"))
+    assert [r.status for r in results] == ["success"] * 2
+    assert sorted(p.relative_to(tmp_path / "out").as_posix() for p in (tmp_path / "out").rglob("*.png")) == [
+        "a-converted-converted.png", "sub/b-converted-converted.png"]
+
+
+def test_pool_workers_fetch_objects_by_key(tmp_path, bucket, monkeypatch):
+    for name in ("a.png", "b.png", "c.png"):
+        buffer = io.BytesIO()
+        Image.effect_noise((40, 30), 60).convert('RGB').save(buffer, 'PNG')
+        bucket.put_object(Bucket='images', Key=f"in/{name}", Body=buffer.getvalue())
+    submitted = []
+    submit = app.ImageCompressor._submit_job
+    monkeypatch.setattr(app.ImageCompressor, '_submit_job', staticmethod(
+        lambda *args: submitted.append(args[-1]) or submit(*args)))
+
+    results = app.ImageCompressor(workers=2).run(app.BatchConfig(
+        input_dir="s3://images/in", output_dir=tmp_path / "out", mode="convert_only", output_ext=".webp",
+        workers=2, progress="none"))
+    assert [r.status for r in results] == ["success"] * 3
+    assert submitted == [None] * 3  # no object bytes are sent to the workers
+
+
+def test_sidecars_are_kept_per_bucket_and_prefix():
+    folders = set()
+    for location in ("s3://images/web", "s3://images/thumbs", "s3://other/web"):
+        compressor = app.ImageCompressor(workers=1)
+        compressor.set_locations("in", location)
+        folders.add(compressor.output_dir)
+    assert len(folders) == 3
@@ -0,0 +1,47 @@
+"""The persistent scan index: unchanged inputs are not probed again"""
+import os
+
+from PIL import Image
+
+import app
+
+
+def make_inputs(folder):
+    folder.mkdir()
+    for index in range(3):
+        Image.new('RGB', (24, 16), (index * 70, 10, 10)).save(folder / f"img{index}.png")
+
+
+def scan(tmp_path, **fields):
+    compressor = app.ImageCompressor(workers=1)
+    compressor._apply_config(app.BatchConfig(input_dir=tmp_path / "in", output_dir=tmp_path / "out",
+                                             progress="none", **fields))
+    (tmp_path / "out").mkdir(exist_ok=True)
+    infos = list(compressor.iter_input_files())
+    return infos, compressor.scan_counts
+
+
+def test_unchanged_inputs_come_from_the_index(tmp_path):
+    make_inputs(tmp_path / "in")
+    infos, counts = scan(tmp_path)
+    assert counts == (0, 3)
+
+    os.utime(tmp_path / "in" / "img1.png", ns=(1, 1))  # changed mtime: probed again
+    cached, counts = scan(tmp_path)
+    assert counts == (2, 1)
+    assert [(i.path, i.width, i.height, i.format) for i in cached] == [
+        (i.path, i.width, i.height, i.format) for i in infos]
+
+    assert scan(tmp_path, rebuild_scan_index=True)[1] == (0, 3)
+    assert scan(tmp_path, scan_index=False)[1] is None
+
+
+def test_scan_summary_is_printed_after_a_streamed_run(tmp_path, capsys):
+    make_inputs(tmp_path / "in")
+    config = app.BatchConfig(input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="compress_only",
+                             workers=1, progress="none")
+    app.ImageCompressor(workers=1).run(config)
+    capsys.readouterr()
+    app.ImageCompressor(workers=1).run(config)
+    out = capsys.readouterr().out
+    assert out.index("Compression Summary") < out.index("Scan index: 3 cached, 0 probed")
@@ -0,0 +1,83 @@
+"""The HTTP compression service, against a real server on a free port"""
+import http.client
+import io
+import json
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import app
+
+
+@pytest.fixture
+def service():
+    service = app.CompressionService(app.ImageCompressor(workers=1), port=0, queue_size=0)
+    thread = threading.Thread(target=service.serve_forever, daemon=True)
+    thread.start()
+    while service.pool is None:
+        time.sleep(0.01)
+    yield service
+    service.server.shutdown()
+    thread.join(10)
+
+
+def post(service, body: bytes, query: str = "mode=compress_convert&format=webp&quality=70"):
+    connection = http.client.HTTPConnection(*service.server.server_address[:2], timeout=30)
+    connection.request("POST", f"/compress?{query}", body=body)
+    response = connection.getresponse()
+    result = response.status, dict(response.getheaders()), response.read()
+    connection.close()
+    return result
+
+
+def get(service, path):
+    connection = http.client.HTTPConnection(*service.server.server_address[:2], timeout=30)
+    connection.request("GET", path)
+    body = connection.getresponse().read()
+    connection.close()
+    return body
+
+
+def png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (60, 40), 'orange').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_compresses_an_upload(service):
+    status, headers, body = post(service, png())
+    assert status == 200
+    assert headers["Content-Type"] == "image/webp" and headers["X-Output-Format"] == "webp"
+    with Image.open(io.BytesIO(body)) as img:
+        assert (img.format, img.size) == ("WEBP", (60, 40))
+
+
+def test_overload_is_answered_with_503(service):
+    # workers + queue_size = 1 slot, taken here as if by a request in progress
+    assert service.slots.acquire(blocking=False)
+    try:
+        status, headers, body = post(service, png())
+        assert status == 503 and headers["Retry-After"] == "1"
+        assert json.loads(body)['error'] == "Server busy, retry later"
+    finally:
+        service.slots.release()
+    assert post(service, png())[0] == 200
+
+    metrics = json.loads(get(service, "/metrics"))
+    assert metrics['requests'] == {"200": 1, "503": 1} and metrics['in_flight'] == 0
+
+
+def test_bad_requests_map_to_http_errors(service):
+    assert post(service, b"not an image")[0] == 415
+    assert post(service, png(), "mode=shrink")[0] == 400
+    service.max_body = 10
+    assert post(service, png())[0] == 413
+
+
+def test_each_request_starts_from_the_service_settings(service):
+    status, headers, _ = post(service, png(), "mode=compress_convert&format=jpg&target_size=100KB")
+    assert status == 200 and headers["X-Target-Met"] == "true"
+    status, headers, _ = post(service, png(), "mode=compress_convert&format=jpg")
+    assert status == 200 and "X-Target-Met" not in headers
@@ -0,0 +1,27 @@
+"""Each input is probed once by the scan and opened once more to be decoded"""
+import pytest
+from PIL import Image
+
+import app
+
+
+def test_processing_reuses_the_scanned_header(tmp_path, monkeypatch):
+    (tmp_path / "in").mkdir()
+    for index in range(3):
+        Image.new('RGBA', (40 + index, 30), (200, 10, 10, 128)).save(tmp_path / "in" / f"img{index}.png")
+    compressor = app.ImageCompressor(workers=1)
+    compressor._apply_config(app.BatchConfig(input_dir=tmp_path / "in", output_dir=tmp_path / "out",
+                                             scan_index=False, progress="none"))
+    infos = list(compressor.iter_input_files())
+    assert [(i.width, i.height, i.format, i.mode, i.valid) for i in infos] == [
+        (40 + index, 30, "PNG", "RGBA", True) for index in range(3)]
+
+    opened = []
+    real_open = Image.open
+    monkeypatch.setattr(app.Image, 'open', lambda fp, *args, **kwargs: opened.append(fp) or real_open(fp, *args, **kwargs))
+    monkeypatch.setattr(app.ImageCompressor, '_probe_image', lambda *args: pytest.fail("probed twice"))
+    (tmp_path / "out").mkdir()
+    results = [compressor._process_file(info, tmp_path / "out" / f"{index}.webp", 80, "compress_convert")
+               for index, info in enumerate(infos)]
+    assert [r.status for r in results] == ["success"] * 3
+    assert sorted(map(str, opened)) == sorted(i.path for i in infos)
@@ -0,0 +1,40 @@
+"""--min-ssim search (needs the ssim extra)"""
+import io
+
+import pytest
+from PIL import Image
+
+import app
+
+pytest.importorskip('numpy')
+
+
+def photo():
+    img = Image.linear_gradient('L').resize((320, 240)).convert('RGB')
+    return Image.blend(img, Image.effect_noise((320, 240), 30).convert('RGB'), 0.3)
+
+
+def test_identical_encode_scores_one():
+    buffer = io.BytesIO()
+    photo().save(buffer, 'PNG')
+    assert app.SimilarityReference(photo()).score(buffer.getvalue()) == pytest.approx(1.0)
+
+
+def test_search_picks_the_lowest_quality_that_meets_the_floor():
+    compressor = app.ImageCompressor(workers=1)
+    compressor.min_ssim = 0.95
+    data, search = compressor._search_min_ssim(photo(), '.jpg', 95)
+
+    reference = app.SimilarityReference(photo())
+    assert search['met'] and search['score'] >= 0.95
+    assert reference.score(data) == pytest.approx(search['score'], abs=1e-4)
+    if search['value'] > 1:
+        lower = compressor._encode_image(photo(), '.jpg', search['value'] - 1)
+        assert reference.score(lower) < 0.95
+
+
+def test_unreachable_floor_keeps_the_best_encode():
+    compressor = app.ImageCompressor(workers=1)
+    compressor.min_ssim = 1.0
+    _, search = compressor._search_min_ssim(photo(), '.jpg', 60)
+    assert not search['met'] and search['value'] == 60
@@ -0,0 +1,61 @@
+"""The recursive scanner and streaming its results into the workers"""
+import os
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def touch_image(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new('RGB', (12, 12), 'gray').save(path)
+
+
+def test_walk_order_and_skipped_entries(tmp_path):
+    for name in ("b.png", "a.png", "z/c.png", "m/n/d.png", "m/e.png", ".hidden/f.png", ".g.png", "out/h.png"):
+        touch_image(tmp_path / name)
+    (tmp_path / "linked").symlink_to(tmp_path / "m", target_is_directory=True)
+
+    names = list(app.LocalStorage(tmp_path).walk(skip={os.path.realpath(tmp_path / "out")}))
+    # Each folder's files first, then its subfolders, both sorted
+    assert names == ["a.png", "b.png", "m/e.png", "m/n/d.png", "z/c.png"]
+
+
+def test_processing_starts_before_the_scan_finishes(tmp_path, monkeypatch):
+    for index in range(40):
+        touch_image(tmp_path / "in" / f"{index // 10}" / f"img{index:02}.png")
+    log = []
+    walk = app.LocalStorage.walk
+
+    def logged_walk(storage, skip=()):
+        for name in walk(storage, skip):
+            log.append(('found', name))
+            yield name
+    monkeypatch.setattr(app.LocalStorage, 'walk', logged_walk)
+
+    class Sink:
+        def emit(self, event, result=None):
+            if event['event'] == 'started':
+                log.append(('started', event['input']))
+
+        def close(self):
+            pass
+    monkeypatch.setattr(app.ImageCompressor, 'open_progress', lambda self: app.ProgressEvents([Sink()]))
+
+    results = app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="compress_only", workers=1))
+    assert len(results) == 40 and all(r.status == "success" for r in results)
+    kinds = [kind for kind, _ in log]
+    assert kinds.index('started') < len(kinds) - 1 - kinds[::-1].index('found')
+
+
+@pytest.mark.parametrize('fields', [{'dedupe': True}, {'auto_tune': True}])
+def test_steps_needing_the_whole_batch_still_get_it(tmp_path, fields):
+    for index in range(3):
+        touch_image(tmp_path / "in" / f"img{index}.png")
+    results = app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="compress_only", workers=1,
+        progress="none", **fields))
+    assert sorted(Path(r.input_path).name for r in results) == ["img0.png", "img1.png", "img2.png"]
@@ -0,0 +1,108 @@
+"""StripReader and the strip writers against Pillow's own decode (see --strip processing)"""
+import os
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def noise(mode, size=(97, 61)):
+    img = Image.effect_noise(size, 60).convert('RGB')
+    return img.quantize(64) if mode == 'P' else img.convert(mode)
+
+
+@pytest.mark.parametrize('mode,fmt', [('RGB', 'BMP'), ('L', 'BMP'), ('P', 'BMP'), ('RGB', 'TIFF'), ('L', 'TIFF')])
+def test_strip_reader_matches_full_decode(tmp_path, mode, fmt):
+    path = tmp_path / f"in.{fmt.lower()}"
+    noise(mode).save(path, fmt)
+    reader = app.StripReader(str(path), strip_pixels=97 * 7)
+    assert reader.rows_per_strip == 7
+
+    with Image.open(path) as expected:
+        expected.load()
+        for top, band in reader.strips():
+            assert band.tobytes() == expected.crop((0, top, expected.width, top + band.height)).tobytes()
+
+
+def test_strip_reader_rejects_compressed_tiff(tmp_path):
+    path = tmp_path / "in.tiff"
+    noise('RGB').save(path, 'TIFF', compression='tiff_lzw')
+    with pytest.raises(ValueError):
+        app.StripReader(str(path))
+
+
+@pytest.mark.parametrize('writer_class,mode', [
+    (app.PngStripWriter, 'RGB'), (app.PngStripWriter, 'L'), (app.PngStripWriter, 'P'), (app.PngStripWriter, 'RGBA'),
+    (app.BmpStripWriter, 'RGB'), (app.BmpStripWriter, 'L'), (app.BmpStripWriter, 'P'),
+])
+def test_strip_writers_round_trip(tmp_path, writer_class, mode):
+    img = noise(mode)
+    output = tmp_path / "out"
+    writer = writer_class(output, img.size)
+    for top in range(0, img.height, 10):
+        writer.write(img.crop((0, top, img.width, min(top + 10, img.height))))
+    writer.close()
+
+    assert os.listdir(tmp_path) == ["out"]
+    with Image.open(output) as written:
+        assert written.size == img.size
+        assert written.convert('RGBA').tobytes() == img.convert('RGBA').tobytes()
+
+
+@pytest.mark.parametrize('fmt', ['BMP', 'TIFF'])
+def test_bands_are_allocated_at_strip_size(tmp_path, fmt):
+    path = tmp_path / f"in.{fmt.lower()}"
+    noise('RGB').save(path, fmt)
+    band = app.StripReader(str(path), strip_pixels=97 * 7).read(14, 21)
+    assert band.size == band.im.size == (97, 7)
+
+
+@pytest.mark.parametrize('output_ext,mode', [('.tiff', "compress_only"), ('.jpg', "convert_only"),
+                                              ('.webp', "convert_only")])
+def test_tiff_source_through_full_frame_writer(tmp_path, output_ext, mode):
+    source = tmp_path / "in.tiff"
+    img = noise('RGB')
+    img.save(source, 'TIFF')
+    output = tmp_path / f"out{output_ext}"
+    compressor = app.ImageCompressor(workers=1)
+    compressor.never_larger = False
+    reader = app.StripReader(str(source), strip_pixels=97 * 7)
+    writer = app.FullFrameWriter(compressor, str(output), img.size, output_ext, 90)
+    for _, band in reader.strips():
+        writer.write(compressor._apply_mode(band, '.tiff', output_ext, 90, mode))
+    writer.close()
+
+    with Image.open(output) as written:
+        assert written.size == img.size
+        if output_ext == '.tiff':
+            assert written.tobytes() == img.tobytes()
+
+
+def test_oversized_tiff_is_processed_in_strips(tmp_path):
+    (tmp_path / "in").mkdir()
+    noise('RGB', (400, 300)).save(tmp_path / "in" / "big.tiff", 'TIFF')
+    compressor = app.ImageCompressor(workers=1)
+    compressor.MAX_PIXELS = 50_000
+    results = compressor.run(app.BatchConfig(input_dir=tmp_path / "in", output_dir=tmp_path / "out",
+                                             mode="convert_only", output_ext=".jpg", workers=1, progress="none"))
+    assert [r.status for r in results] == ["success"]
+    with Image.open(results[0].output_path) as written:
+        assert written.size == (400, 300)
+
+
+def test_strip_writer_abort_leaves_nothing(tmp_path):
+    writer = app.PngStripWriter(tmp_path / "out.png", (10, 10))
+    writer.write(Image.new('RGB', (10, 5)))
+    writer.abort()
+    assert os.listdir(tmp_path) == []
+
+
+def test_strip_processing_keeps_a_source_that_is_not_larger(tmp_path):
+    source = tmp_path / "in.bmp"
+    noise('RGB').save(source)
+    compressor = app.ImageCompressor(workers=1)
+    compressor._compress_image_in_strips(str(source), str(tmp_path / "out.bmp"), 80, "compress_only")
+
+    assert (tmp_path / "out.bmp").read_bytes() == source.read_bytes()
+    assert compressor.kept_source.startswith("source copied through")
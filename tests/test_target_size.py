@@ -0,0 +1,56 @@
+"""Target-size mode: bisect the encoder setting until the output fits"""
+import io
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def photo(size=(160, 120)):
+    # Deterministic detail that compresses poorly at high quality
+    return Image.effect_mandelbrot(size, (-2.1, -1.2, 0.7, 1.2), 64).convert('RGB')
+
+
+def source_bytes(fmt='PNG'):
+    buffer = io.BytesIO()
+    photo().save(buffer, fmt)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('output_ext', [".jpg", ".webp", ".png"])
+def test_output_fits_the_target(output_ext):
+    compressor = app.ImageCompressor(workers=1)
+    unconstrained, _, _ = compressor.compress_bytes(source_bytes(), 95, "compress_convert", output_ext)
+    compressor.target_size = len(unconstrained) // 2
+    data, ext, search = compressor.compress_bytes(source_bytes(), 95, "compress_convert", output_ext)
+    assert ext == output_ext
+    assert search['met'] and len(data) <= compressor.target_size
+    assert search['attempts'] <= 10  # a bisection, not a sweep
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (160, 120)
+
+
+def test_the_unconstrained_encode_wins_when_it_fits():
+    compressor = app.ImageCompressor(workers=1)
+    compressor.target_size = 10 ** 9
+    data, _, search = compressor.compress_bytes(source_bytes(), 90, "compress_convert", ".jpg")
+    assert (search['value'], search['attempts'], search['met']) == (90, 1, True)
+
+
+def test_an_unreachable_target_keeps_the_smallest_attempt():
+    compressor = app.ImageCompressor(workers=1)
+    compressor.target_size = 10
+    data, _, search = compressor.compress_bytes(source_bytes(), 90, "compress_convert", ".jpg")
+    assert not search['met'] and search['value'] <= 2  # the lowest qualities encode alike
+    assert data[:2] == b'\xff\xd8'
+
+
+def test_batch_summary_reports_the_search(tmp_path, capsys):
+    (tmp_path / "in").mkdir()
+    photo().save(tmp_path / "in" / "a.png")
+    results = app.ImageCompressor(workers=1).run(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="compress_convert", output_ext=".jpg",
+        target_size=4000, workers=1, progress="none"))
+    assert results[0].output_size <= 4000 and results[0].search['met']
+    assert "Target size met: " in capsys.readouterr().out
@@ -0,0 +1,57 @@
+"""Watch mode: settled files anywhere in the input tree are processed as they arrive"""
+import os
+import time
+
+import pytest
+from PIL import Image
+
+import app
+
+
+def settle(watcher, rounds=20):
+    ready = []
+    for _ in range(rounds):
+        watcher.wait(0.05)
+        ready += [path for path, _ in watcher.ready(100)]
+    return sorted(ready)
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_subfolders_created_later_are_watched(tmp_path, use_inotify):
+    (tmp_path / "old").mkdir()
+    (tmp_path / "out").mkdir()
+    watcher = app.FolderWatcher(tmp_path, ['.png'], settle=0, poll_interval=0.05, use_inotify=use_inotify,
+                                skip={os.path.realpath(tmp_path / "out")})
+    try:
+        (tmp_path / "new" / "deeper").mkdir(parents=True)
+        for path in ("top.png", "old/a.png", "new/deeper/b.png", "out/ignored.png", ".hidden.png"):
+            Image.new('RGB', (8, 8)).save(tmp_path / path, 'PNG')
+        assert settle(watcher) == [str(tmp_path / p) for p in ("new/deeper/b.png", "old/a.png", "top.png")]
+    finally:
+        watcher.close()
+
+
+def test_watch_mirrors_subfolders(tmp_path, monkeypatch):
+    (tmp_path / "in" / "sub").mkdir(parents=True)
+    Image.new('RGB', (20, 20), 'blue').save(tmp_path / "in" / "sub" / "a.png")
+
+    wait = app.FolderWatcher.wait
+
+    def stop_once_written(watcher, timeout):
+        if (tmp_path / "out" / "sub" / "a-converted.webp").exists():
+            raise KeyboardInterrupt
+        time.sleep(0.05)
+        wait(watcher, timeout)
+    monkeypatch.setattr(app.FolderWatcher, 'wait', stop_once_written)
+
+    counts = app.ImageCompressor(workers=1).watch(app.BatchConfig(
+        input_dir=tmp_path / "in", output_dir=tmp_path / "out", mode="convert_only", output_ext=".webp",
+        workers=1, progress="none"), settle=0)
+    assert counts["success"] == 1
+
+
+def test_watch_rejects_dedupe(tmp_path):
+    (tmp_path / "in").mkdir()
+    with pytest.raises(ValueError, match="dedupe"):
+        app.ImageCompressor(workers=1).watch(app.BatchConfig(
+            input_dir=tmp_path / "in", output_dir=tmp_path / "out", dedupe=True, progress="none"))